@@ -8,9 +8,16 @@ import sys, socket, struct, time, os, os.path, tempfile, traceback
 import xml.etree.ElementTree as ET
 import io
 import binascii
+import hashlib
+import contextlib
+import selectors
+import collections
+import concurrent.futures
+import multiprocessing, multiprocessing.connection
+import asyncio
 import threading
+import signal
 import configparser
-import ctypes
 
 # path.py module import
 try:
@@ -36,16 +43,32 @@ except:
 
 # internal modules
 from bftp_config import analyse_options
-from bftp_utils import debug, str_ajuste, mtime2str, chemin_interdit, augmenter_priorite
+from bftp_utils import debug, str_ajuste, mtime2str, chemin_interdit, augmenter_priorite, entier_signe32
 from modules.OptionParser_doc import *
 import modules.TabBits as TabBits, modules.Console as Console
 import modules.TraitEncours as TraitEncours
+from modules.EmissionLot import EmissionLot
+from modules.ReceptionLot import ReceptionLot, etat_noyau
+from modules.Aiguillage import Aiguillage
+from modules.FichierMappe import FichierMappe
+import modules.Compression as Compression
+import modules.Delta as Delta
+from modules.IndexContenu import IndexContenu, hachage
+from modules.FilePriorite import FilePriorite
+from modules.CRC32 import CRCPaquets, TAILLE_BLOC as TAILLE_BLOC_CRC
 
 
 #=== CONSTANTES ===============================================================
 
 # Network Packet Max size
 TAILLE_PAQUET = 65500
+# Taille maximale des datagrammes émis: TAILLE_PAQUET par défaut (fragmentés
+# par IP), ou ajustée à la MTU du lien par --mtu (un datagramme par trame,
+# cf. taille_datagramme_mtu). Le récepteur accepte toute taille.
+TAILLE_DATAGRAMME = TAILLE_PAQUET
+# Données minimales par paquet: un fichier au nom trop long pour la MTU part
+# en datagrammes plus grands, fragmentés
+TAILLE_DONNEES_MIN = 512
 
 RACINE_TEMP = "temp"    # Tempfile root
 
@@ -53,6 +76,48 @@ MAX_NOM_FICHIER = 1024  # Max length for the filename field
 
 HB_DELAY = 10 # Default time between two Heartbeat
 
+TAILLE_LOT = 32 # Nombre maximum de datagrammes émis par appel système (sendmmsg)
+# Nombre de datagrammes reçus par appel système (recvmmsg), et taille des
+# tampons de réception, alloués une fois pour toutes
+TAILLE_LOT_RECEPTION = 32
+TAILLE_TAMPON_RECEPTION = 65536
+SO_RCVBUFFORCE = getattr(socket, 'SO_RCVBUFFORCE', 33)   # SO_RCVBUF au-delà de rmem_max (Linux)
+# Réception répartie sur plusieurs processus (--processus): délai entre deux
+# envois des comptes de paquets au processus principal, et entre deux bilans
+DELAI_RELAIS = 0.5
+DELAI_BILAN = 60
+DELAI_ARRET_PROCESSUS = 5
+# Écriture découplée de la capture (--ecrivains, cf. PoolEcriture): octets de
+# datagrammes en attente d'écriture au-delà desquels la capture attend
+MAX_FILE_ECRITURE = 64*1024*1024
+# Points de reprise des réceptions en cours (--etat, cf. Fichier.sauvegarder):
+# délai entre deux sauvegardes de l'état d'un fichier, et entête de l'état
+# (signature, taille, date, CRC32, drapeaux, nb_paquets, CRC32 attendu connu,
+# CRC32 attendu, taille des paquets, longueur du nom)
+DELAI_POINT_REPRISE = 30
+POINT_REPRISE = struct.Struct("!4sQQiiiBiiH")
+SIGNATURE_REPRISE = b"BFTR"
+
+TAILLE_TRANCHE_CRC = 1024*1024 # Taille des tranches lues pour le calcul de CRC32
+
+# Limitation du débit (cf. LimiteurDebit)
+RAFALE = 128*1024       # Octets pouvant être émis d'un coup sur le lien
+MTU_LIEN = 1500         # MTU du lien, pour compter les entêtes des fragments IP
+TAILLE_ENTETE_IP = 20
+TAILLE_ENTETE_IPV6 = 40
+TAILLE_ENTETE_UDP = 8
+MARGE_ATTENTE = 200000  # Attente active pendant les dernières 200 µs d'une pause (en ns)
+RATTRAPAGE = 20000000   # Retard au réveil d'une pause rattrapé au plus: 20 ms (en ns)
+
+# Emission en pipeline (cf. PipelineEmission)
+PROFONDEUR_PIPELINE = 4     # Nombre de fichiers préparés à l'avance
+NB_PREPARATEURS = 2         # Nombre de threads de préparation
+PRECHARGEMENT = 8*1024*1024 # Octets lus à l'avance d'un fichier dont le CRC32 est connu
+
+# CRC32 calculé pendant l'émission et transmis en fin de fichier, au lieu
+# d'une lecture préalable du fichier par CalcCRC (option --crc-fin)
+CRC_FIN = False
+
 # en synchro stricte durée de rétention
 # un fichier disparu/effacé sur le guichet bas est effacé coté haut après ce délai
 OFFLINEDELAY = 86400*7 # 86400 vaut 1 jour
@@ -60,18 +125,95 @@ OFFLINEDELAY = 86400*7 # 86400 vaut 1 jour
 FORMAT_ENTETE = "!iiQQiiiiQQi"
 # Correction bug 557 : taille du format diffère selon les OS
 TAILLE_ENTETE = struct.calcsize(FORMAT_ENTETE)
+# Entête précompilée. A l'émission, seuls les champs qui changent d'un paquet
+# à l'autre (taille_donnees, offset, num_session, num_paquet_session,
+# num_paquet) sont repackés dans le tampon d'entête du fichier.
+ENTETE = struct.Struct(FORMAT_ENTETE)
+ENTETE_VARIABLE = struct.Struct("!QQiii")
+OFFSET_ENTETE_VARIABLE = 8
 
 # Types de paquets:
 PAQUET_FICHIER      = 0  # File
 PAQUET_REPERTOIRE   = 1  # Directory (not yet use)
 PAQUET_HEARTBEAT    = 10 # HeartBeat
 PAQUET_DELETEFile   = 16 # File Delete
+PAQUET_FINFICHIER   = 17 # File trailer (CRC32 et taille du fichier)
+PAQUET_REPARATION   = 18 # FEC: parité XOR d'un groupe de paquets de données
+PAQUET_MULTIFICHIER = 19 # Plusieurs petits fichiers complets
+PAQUET_CLONE        = 20 # Copie d'un fichier déjà reçu, de même contenu
+PAQUET_ANNONCE      = 21 # Nom et identifiant d'un fichier (cf. IDENTIFIANTS)
+
+# Les bits de poids fort du type de paquet portent des drapeaux:
+MASQUE_TYPE         = 0xFF
+DRAPEAU_CRC_FIN     = 0x100 # CRC32 transmis dans le paquet de fin de fichier
+MASQUE_COMPRESSION  = 0x600 # méthode de compression du flux transmis (cf. Compression)
+DECALAGE_COMPRESSION = 9
+DRAPEAU_PATCH       = 0x800 # flux transmis: patch par rapport à la version précédente (cf. Delta)
+DRAPEAU_IDENTIFIANT = 0x1000 # champ nom remplacé par l'identifiant du fichier (cf. IDENTIFIANTS)
+
+# Correction d'erreurs (FEC): les paquets de données d'un fichier sont groupés
+# par FEC_K, et FEC_R paquets de réparation sont émis après chaque groupe. Le
+# paquet de réparation j est le XOR des paquets i du groupe tels que i%FEC_R==j
+# (parités entrelacées): il permet de reconstruire une perte parmi eux, donc
+# jusqu'à FEC_R pertes consécutives par groupe. Il commence par une sous-entête:
+# k, r, j, taille_donnees_max (pas des offsets des paquets de données).
+FEC_K = 0                   # 0: pas de paquets de réparation
+FEC_R = 1
+SOUS_ENTETE_REPARATION = struct.Struct("!iiii")
+
+# Petits fichiers regroupés dans des paquets PAQUET_MULTIFICHIER: chaque fichier
+# y est une entrée (longueur du nom, date, taille, CRC32) suivie du nom et du
+# contenu. Le champ num_paquet de l'entête donne le nombre d'entrées.
+PETITS_FICHIERS = 0         # taille maximale d'un fichier regroupé (0: pas de regroupement)
+ENTREE_MULTIFICHIER = struct.Struct("!HQQi")
+
+# Compression des fichiers émis (cf. modules/Compression.py): None pour ne pas
+# compresser, "auto" pour choisir la méthode d'après le débit, ou "zlib"/"lzma".
+COMPRESSION = None
+METHODES_COMPRESSION = {'auto': None, 'zlib': (Compression.ZLIB,), 'lzma': (Compression.LZMA,)}
+TAILLE_MIN_COMPRESSION = 4096   # les fichiers plus petits ne sont pas compressés
+
+# Entrelacement de l'ordre d'émission (cf. ordre_paquets): les paquets sont
+# rangés en lignes de FEC_K (ou LARGEUR_ENTRELACEMENT) paquets consécutifs,
+# et les blocs de ENTRELACEMENT lignes sont émis colonne par colonne.
+ENTRELACEMENT = 0           # 0: ordre séquentiel, sans rotation
+LARGEUR_ENTRELACEMENT = 16
+
+# Transfert différentiel (cf. modules/Delta.py): un fichier modifié dont une
+# version précédente a été émise MinFileRedundancy fois est envoyé sous forme
+# d'un patch ne contenant que ses blocs modifiés.
+DELTA = False
+TAILLE_MIN_DELTA = 4 * 1024 * 1024  # les fichiers plus petits sont renvoyés en entier
+
+# Déduplication (cf. modules/IndexContenu.py): un fichier dont le contenu a
+# déjà été livré sous un autre chemin est envoyé sous forme d'un paquet
+# PAQUET_CLONE (nom du fichier, puis chemin de la copie existante en données):
+# le récepteur le recopie depuis cette copie, après contrôle du CRC32.
+DEDUP = False
+TAILLE_MIN_DEDUP = 64 * 1024        # les fichiers plus petits sont envoyés normalement
+
+# Identifiants de fichiers: les paquets d'un fichier portent à la place de son
+# nom un identifiant de 64 bits (drapeau DRAPEAU_IDENTIFIANT), associé au nom
+# par des paquets PAQUET_ANNONCE (nom en champ nom, identifiant en données)
+# émis au début du fichier puis tous les REPETITION_ANNONCE paquets. Le
+# récepteur garde les paquets d'identifiant encore inconnu jusqu'à l'annonce
+# suivante (cf. TableIdentifiants), dans la limite de MAX_ATTENTE octets.
+IDENTIFIANTS = False
+IDENTIFIANT = struct.Struct("!Q")
+REPETITION_ANNONCE = 32
+MAX_IDENTIFIANTS = 65536    # identifiants connus conservés par le récepteur
+MAX_ATTENTE = 32*1024*1024  # octets de paquets en attente de leur annonce
 
 # Complement d'attributs à XFL
 ATTR_CRC = "crc" 			            # File CRC
 ATTR_NBSEND = "NbSend"		        	# Number of send
 ATTR_LASTVIEW = "LastView"	        	# Last View Date
 ATTR_LASTSEND = "LastSend"	        	# Last Send Date
+ATTR_COMPRESSION = "Compression"        # Compression choisie ("0": à choisir)
+ATTR_EMPREINTES = "Blocs"               # Empreintes des blocs (cf. Delta), "" si inconnues
+ATTR_BASE = "Base"                      # "taille:date:crc" de la version de base d'un patch
+ATTR_BASE_EMPREINTES = "BaseBlocs"      # Empreintes des blocs de la version de base
+ATTR_CONTENU = "Contenu"                # Empreinte du contenu (cf. IndexContenu), "0" si inconnue
 
 #=== Valeurs à traiter au sein du fichier .ini in fine ========================
 MinFileRedundancy = 5
@@ -88,10 +230,35 @@ options = None
 global fichiers
 fichiers = {}
 
+# répertoires de réception déjà créés ou vus (cf. creer_repertoire)
+repertoires_crees = set()
+
 # pour mesurer les stats de reception:
 
 stats = None
 
+# processus de réception (--processus), et lien avec le processus principal
+# dans chacun d'eux (cf. RelaisReception)
+NB_PROCESSUS_RECEPTION = 1
+relais_reception = None
+# threads d'écriture de chaque boucle de réception (--ecrivains), 0: décodage
+# et écriture dans la boucle elle-même
+NB_ECRIVAINS = 0
+# taille du tampon de réception des sockets (--rcvbuf, SO_RCVBUF), en octets
+TAMPON_RECEPTION = None
+# répertoire des points de reprise des réceptions en cours (--etat), None:
+# réceptions abandonnées à l'arrêt; points de reprise trouvés au démarrage,
+# par nom de fichier (cf. charger_points_reprise)
+REPERTOIRE_ETAT = None
+points_reprise = {}
+
+# socket d'émission de la session (cf. Transport)
+transport = None
+moteur_async = None     # MoteurAsync de la session (--async), sinon émission synchrone
+NB_LECTEURS_ASYNC = 4   # threads de construction des lots du moteur asyncio
+# Liens de la session: liste de (adresse, port, poids), None pour le seul lien (HOST, PORT)
+LIENS = None
+
 #------------------------------------------------------------------------------
 # EXIT_AIDE : Display Help in case of error
 #-------------------
@@ -116,6 +283,7 @@ class Stats:
         self.num_session = -1
         self.num_paquet_attendu = 0
         self.nb_paquets_perdus = 0
+        self.nb_paquets_recus = 0
 
     def ajouter_paquet(self, paquet):
         """pour mettre à jour les stats en fonction du paquet."""
@@ -129,6 +297,21 @@ class Stats:
             self.nb_paquets_perdus += paquet.num_paquet_session - self.num_paquet_attendu
         self.num_paquet_attendu = paquet.num_paquet_session + 1
 
+    def ajouter_compte(self, num_session, nb_paquets, dernier_paquet):
+        """pour mettre à jour les stats d'après les paquets d'une session reçus
+        par un processus de réception (cf. RelaisReception): nombre de paquets
+        et plus grand numéro de paquet dans la session."""
+        if num_session < self.num_session:
+            # compte en retard d'une session déjà terminée
+            return
+        if num_session != self.num_session:
+            self.num_session = num_session
+            self.num_paquet_attendu = 0
+            self.nb_paquets_recus = 0
+        self.nb_paquets_recus += nb_paquets
+        self.num_paquet_attendu = max(self.num_paquet_attendu, dernier_paquet + 1)
+        self.nb_paquets_perdus = max(0, self.num_paquet_attendu - self.nb_paquets_recus)
+
     def taux_perte(self):
         """calcule le taux de paquets perdus, en pourcentage"""
         # num_paquet_attendu correspond au nombre de paquets envoyés de la session
@@ -146,6 +329,94 @@ class Stats:
 #------------------------------------------------------------------------------
 # classe FICHIER
 #-------------------
+def fichier_provisoire(fichier_dest):
+    """chemin du fichier caché, à côté de fichier_dest, dans lequel une
+    nouvelle version est construite avant de remplacer l'ancienne."""
+    return fichier_dest.dirname() / ('.%s.bftp' % fichier_dest.basename())
+
+def fichier_partiel(fichier_dest, version):
+    """chemin du fichier caché, à côté de fichier_dest, dans lequel les
+    paquets d'une version du fichier sont écrits au fil de leur réception
+    (version: entier propre à cette version, cf. Fichier)."""
+    return fichier_dest.dirname() / ('.%s.%08x.part' % (fichier_dest.basename(), version))
+
+def version_fichier(taille_fichier, date_fichier, crc32, drapeaux):
+    "entier propre à une version d'un fichier reçu (cf. fichier_partiel)."
+    return binascii.crc32(struct.pack("!QQii", taille_fichier, date_fichier, crc32, drapeaux))
+
+def fichier_point_reprise(nom_fichier, version):
+    """chemin du point de reprise d'une version d'un fichier en cours de
+    réception, dans REPERTOIRE_ETAT (cf. Fichier.sauvegarder)."""
+    h = hashlib.blake2b(nom_fichier.encode('utf-8'), digest_size=16)
+    return path(REPERTOIRE_ETAT) / ('%s.%08x.etat' % (h.hexdigest(), version))
+
+def lire_point_reprise(chemin, entete_seule=False):
+    """lit un point de reprise (cf. Fichier.sauvegarder). Renvoie (champs de
+    l'entête POINT_REPRISE après la signature, nom du fichier, suite: paquets
+    reçus puis état du CRC32). Lève ValueError s'il est incorrect."""
+    with open(chemin, 'rb') as f:
+        entete = f.read(POINT_REPRISE.size)
+        if len(entete) != POINT_REPRISE.size:
+            raise ValueError('point de reprise tronque')
+        champs = POINT_REPRISE.unpack(entete)
+        if champs[0] != SIGNATURE_REPRISE:
+            raise ValueError('point de reprise incorrect')
+        nom_fichier = f.read(champs[-1]).decode('utf-8')
+        suite = b'' if entete_seule else f.read()
+    return champs[1:-1], nom_fichier, suite
+
+def charger_points_reprise():
+    """Au démarrage de la réception: recense les points de reprise de
+    REPERTOIRE_ETAT dans points_reprise. Ceux dont le fichier partiel a
+    disparu, ou illisibles, sont supprimés. Les réceptions sont reprises à
+    l'arrivée d'un paquet de leur fichier (cf. Fichier.reprendre)."""
+    points_reprise.clear()
+    for chemin in path(REPERTOIRE_ETAT).files('*.etat'):
+        try:
+            (taille_fichier, date_fichier, crc32, drapeaux, *suite), nom_fichier, reste = \
+                lire_point_reprise(chemin, entete_seule=True)
+        except (OSError, ValueError) as e:
+            logging.warning(f'Point de reprise {chemin} illisible, supprime: {e}')
+            chemin.remove()
+            continue
+        version = version_fichier(taille_fichier, date_fichier, crc32, drapeaux)
+        if chemin_interdit(nom_fichier) or chemin != fichier_point_reprise(nom_fichier, version) \
+        or not fichier_partiel(CHEMIN_DEST / nom_fichier, version).isfile():
+            logging.warning(f'Point de reprise sans fichier partiel supprime: {nom_fichier}')
+            chemin.remove()
+            continue
+        points_reprise[nom_fichier] = chemin
+    # sauvegardes interrompues (cf. Fichier.sauvegarder)
+    for chemin in path(REPERTOIRE_ETAT).files('*.etat.tmp'):
+        chemin.remove()
+    if points_reprise:
+        msg = f'{len(points_reprise)} reception(s) interrompue(s) a reprendre'
+        print(msg)
+        logging.info(msg)
+
+def creer_repertoire(chemin):
+    """crée si besoin le répertoire chemin et ses parents (un fichier du
+    même nom est remplacé). Les répertoires déjà vus sont gardés dans
+    repertoires_crees, pour ne pas interroger le disque à chaque fichier."""
+    if chemin in repertoires_crees:
+        return
+    if os.path.exists(chemin) and not os.path.isdir(chemin):
+        os.remove(chemin)
+    os.makedirs(chemin, exist_ok=True)
+    repertoires_crees.add(chemin)
+
+def ouvrir_fichier_recu(fichier, mode):
+    """ouvre (cf. open) un fichier sous CHEMIN_DEST, en créant son
+    répertoire si besoin; recréé s'il a disparu depuis qu'il a été vu."""
+    chemin = fichier.dirname()
+    creer_repertoire(chemin)
+    try:
+        return open(fichier, mode)
+    except FileNotFoundError:
+        repertoires_crees.discard(chemin)
+        creer_repertoire(chemin)
+        return open(fichier, mode)
+
 class Fichier:
     """classe représentant un fichier en cours de réception."""
 
@@ -160,24 +431,198 @@ class Fichier:
         self.nb_paquets = paquet.nb_paquets
         # chemin du fichier destination
         self.fichier_dest = CHEMIN_DEST / self.nom_fichier
-        # on crée le fichier temporaire (objet file):
-        self.fichier_temp = tempfile.NamedTemporaryFile(prefix='BFTP_')
-        self.paquets_recus = TabBits.TabBits(self.nb_paquets)
         #print('Reception du fichier "{}"...'.format(self.nom_fichier))
         self.est_termine = False    # flag indiquant une réception complète
-        self.crc32 = paquet.crc32 # CRC32 du fichier
+        self.crc32 = paquet.crc32 # CRC32 du fichier, tel que dans l'entête
+        self.drapeaux = paquet.drapeaux
+        # méthode de compression du flux reçu (Compression.AUCUNE: le fichier tel quel)
+        self.compression = (paquet.drapeaux & MASQUE_COMPRESSION) >> DECALAGE_COMPRESSION
+        # flux reçu: patch à appliquer à la version déjà présente à destination
+        self.patch = bool(paquet.drapeaux & DRAPEAU_PATCH)
+        # on crée le fichier partiel (objet file), à côté de la destination,
+        # donc sur le même système de fichiers: une fois vérifié, il y est
+        # renommé sans recopie (sauf flux compressé ou patch, à reconstruire).
+        # Son nom dépend de la version: deux processus de réception peuvent
+        # recevoir chacun une version du même fichier (cf. recevoir_processus)
+        version = version_fichier(self.taille_fichier, self.date_fichier, self.crc32, self.drapeaux)
+        self.fichier_part = fichier_partiel(self.fichier_dest, version)
+        # CRC32 à vérifier: inconnu jusqu'au paquet de fin en mode CRC_FIN
+        if paquet.drapeaux & DRAPEAU_CRC_FIN:
+            self.crc_attendu = None
+        else:
+            self.crc_attendu = paquet.crc32
+        # taille des paquets de données, sauf le dernier (0: inconnue)
+        self.taille_paquet = 0
+        # point de reprise de la réception (--etat), cf. sauvegarder
+        self.fichier_etat = None
+        if REPERTOIRE_ETAT is not None:
+            self.fichier_etat = fichier_point_reprise(self.nom_fichier, version)
+        self.derniere_sauvegarde = time.monotonic()
+        self.etat_sauvegarde = None     # (paquets reçus, CRC32 attendu) sauvegardés
+        if not self.reprendre(paquet):
+            self.paquets_recus = TabBits.TabBits(self.nb_paquets)
+            self.fichier_temp = ouvrir_fichier_recu(self.fichier_part, 'w+b')
+            if not (self.compression or self.patch) and self.taille_fichier > 0:
+                try:
+                    # place réservée d'avance: fichier peu fragmenté, et disque
+                    # plein signalé dès le début de la réception
+                    os.posix_fallocate(self.fichier_temp.fileno(), 0, self.taille_fichier)
+                except AttributeError:
+                    # posix_fallocate n'existe pas sur ce système
+                    pass
+                except OSError as e:
+                    logging.warning(f"Préallocation impossible pour {self.nom_fichier}: {e}")
+            # CRC32 du fichier calculé au fil des paquets, dans leur ordre
+            # d'arrivée: le contrôle final ne relit pas le fichier (sauf flux
+            # compressé ou patch, dont le CRC32 est celui du fichier reconstruit)
+            self.crc_paquets = None if (self.compression or self.patch) else CRCPaquets(self.nb_paquets)
         self.termine = False  # Nouveau flag pour indiquer si le fichier a été traité complètement
+        # FEC: (k, r, taille_donnees_max) connu au premier paquet de réparation,
+        # et parités en attente d'utilisation, par (groupe, j)
+        self.fec = None
+        self.reparations = {}
+        self.nb_paquets_repares = 0
+
+    def reprendre(self, paquet):
+        """Reprend la réception interrompue de cette version du fichier (arrêt
+        ou redémarrage du récepteur), d'après son point de reprise trouvé au
+        démarrage (cf. charger_points_reprise): paquets reçus, CRC32 attendu,
+        et fichier partiel rouvert tel quel. Le point de reprise d'une autre
+        version, ou de la même version découpée autrement que le paquet reçu
+        (cf. meme_decoupage), est supprimé, avec son fichier partiel. Renvoie
+        False si la réception n'est pas à reprendre."""
+        chemin = points_reprise.pop(self.nom_fichier, None)
+        if chemin is None:
+            return False
+        try:
+            (taille_fichier, date_fichier, crc32, drapeaux, nb_paquets, crc_connu,
+             crc_attendu, taille_paquet), nom_fichier, suite = lire_point_reprise(chemin)
+            version = version_fichier(taille_fichier, date_fichier, crc32, drapeaux)
+            if chemin != self.fichier_etat:
+                # autre version du fichier: abandonnée
+                with contextlib.suppress(OSError):
+                    os.remove(fichier_partiel(self.fichier_dest, version))
+                chemin.remove()
+                return False
+            if nb_paquets != self.nb_paquets or (taille_paquet and paquet.type_paquet == PAQUET_FICHIER
+                                                 and paquet.offset != paquet.num_paquet * taille_paquet):
+                # même version émise en paquets d'une autre taille (--mtu,
+                # --identifiants): les paquets reçus ne correspondent plus
+                msg = f'Reception de "{self.nom_fichier}" recommencee: decoupage en paquets modifie'
+                Console.Print_temp(msg, NL=True)
+                logging.info(msg)
+                with contextlib.suppress(OSError):
+                    os.remove(self.fichier_part)
+                chemin.remove()
+                return False
+            taille_tab = (self.nb_paquets + 7) // 8
+            self.paquets_recus = TabBits.TabBits(self.nb_paquets, buffer=suite[:taille_tab])
+            self.crc_paquets = None
+            if not (self.compression or self.patch):
+                self.crc_paquets = CRCPaquets(self.nb_paquets, suite[taille_tab:])
+            elif len(suite) != taille_tab:
+                raise ValueError('point de reprise incorrect')
+            self.fichier_temp = open(self.fichier_part, 'r+b')
+        except (OSError, ValueError) as e:
+            logging.warning(f'Point de reprise inutilisable pour {self.nom_fichier}: {e}')
+            with contextlib.suppress(OSError):
+                chemin.remove()
+            return False
+        if crc_connu:
+            self.crc_attendu = crc_attendu
+        self.taille_paquet = taille_paquet
+        if self.crc_paquets is not None:
+            self.recalculer_crc()
+        self.etat_sauvegarde = (self.paquets_recus.nb_true, self.crc_attendu)
+        msg = 'Reprise de "{}": {} paquets recus sur {}'.format(
+            self.nom_fichier, self.paquets_recus.nb_true, self.nb_paquets)
+        Console.Print_temp(msg, NL=True)
+        logging.info(msg)
+        return True
+
+    def recalculer_crc(self):
+        """Après une reprise: ajoute à crc_paquets les paquets reçus des blocs
+        incomplets, relus dans le fichier partiel (un bloc par lecture). Un
+        paquet de taille inconnue est marqué manquant, à recevoir de nouveau."""
+        taille_bloc = TAILLE_BLOC_CRC
+        for bloc, manquants in enumerate(self.crc_paquets.manquants):
+            if manquants == 0:
+                continue
+            debut = bloc * taille_bloc
+            recus = [n for n in range(debut, min(debut + taille_bloc, self.nb_paquets))
+                     if self.paquets_recus.get(n)]
+            if not recus:
+                continue
+            if self.nb_paquets == 1:
+                taille_paquet = self.taille_fichier
+            elif self.taille_paquet:
+                taille_paquet = self.taille_paquet
+            else:
+                for n in recus:
+                    self.paquets_recus.set(n, False)
+                continue
+            donnees = os.pread(self.fichier_temp.fileno(), taille_bloc * taille_paquet,
+                               debut * taille_paquet)
+            for n in recus:
+                position = (n - debut) * taille_paquet
+                fin = min(position + taille_paquet, self.taille_fichier - debut * taille_paquet)
+                self.crc_paquets.ajouter(n, donnees[position:fin])
+
+    def sauvegarder(self):
+        """Point de reprise de la réception, dans REPERTOIRE_ETAT: entête
+        POINT_REPRISE, nom du fichier, paquets reçus (TabBits), état du CRC32
+        des blocs complets (cf. CRCPaquets.etat). Les données reçues sont
+        d'abord forcées sur disque (fsync du fichier partiel), puis l'état
+        est écrit à côté et renommé: après un arrêt brutal, le point de
+        reprise lu est complet, et ses paquets sont dans le fichier partiel."""
+        if self.fichier_etat is None or self.termine or self.fichier_temp.closed:
+            return
+        self.derniere_sauvegarde = time.monotonic()
+        etat = (self.paquets_recus.nb_true, self.crc_attendu)
+        if etat == self.etat_sauvegarde:
+            return
+        os.fsync(self.fichier_temp.fileno())
+        nom = self.nom_fichier.encode('utf-8')
+        contenu = [POINT_REPRISE.pack(SIGNATURE_REPRISE, self.taille_fichier, self.date_fichier,
+                                      self.crc32, self.drapeaux, self.nb_paquets,
+                                      self.crc_attendu is not None, self.crc_attendu or 0,
+                                      self.taille_paquet, len(nom)),
+                   nom, self.paquets_recus.tobytes()]
+        if self.crc_paquets is not None:
+            contenu.append(self.crc_paquets.etat())
+        provisoire = path(self.fichier_etat + '.tmp')
+        with open(provisoire, 'wb') as f:
+            f.writelines(contenu)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(provisoire, self.fichier_etat)
+        self.etat_sauvegarde = etat
+
+    def point_de_reprise(self):
+        "sauvegarde la réception (cf. sauvegarder) toutes les DELAI_POINT_REPRISE secondes."
+        if self.fichier_etat is not None \
+        and time.monotonic() - self.derniere_sauvegarde >= DELAI_POINT_REPRISE:
+            try:
+                self.sauvegarder()
+            except OSError as e:
+                logging.error(f"Sauvegarde de la reception de {self.nom_fichier} impossible: {e}")
+
+    def supprimer_point_reprise(self):
+        "supprime le point de reprise, qui ne sera plus mis à jour."
+        if self.fichier_etat is not None:
+            with contextlib.suppress(OSError):
+                os.remove(self.fichier_etat)
+            self.fichier_etat = None
 
     def annuler_reception(self):
         "pour annuler la réception d'un fichier en cours."
-        # on ferme et on supprime le fichier temporaire
-        # seulement s'il est effectivement ouvert
-        # (sinon à l'initialisation c'est un entier)
-        if isinstance(self.fichier_temp, io.IOBase):
-            if not self.fichier_temp.closed:
-                self.fichier_temp.close()
-        # d'après la doc de tempfile, le fichier est automatiquement supprimé
-        #os.remove(self.nom_temp)
+        # on ferme le fichier partiel seulement s'il est effectivement ouvert
+        if not self.fichier_temp.closed:
+            self.fichier_temp.close()
+        # puis on le supprime (il n'existe plus si la réception a abouti)
+        with contextlib.suppress(OSError):
+            os.remove(self.fichier_part)
+        self.supprimer_point_reprise()
 
     def recopier_destination(self):
         logging.info(f"Début de recopier_destination pour {self.nom_fichier}")
@@ -185,77 +630,109 @@ class Fichier:
         print('OK, fichier termine.')
         logging.info(f'Recopie du fichier "{self.nom_fichier}" vers la destination.')
         
-        # créer le chemin destination si besoin avec makedirs
-        chemin_dest = self.fichier_dest.dirname()
-        if not os.path.exists(chemin_dest):
-            chemin_dest.makedirs()
-        elif not os.path.isdir(chemin_dest):
-            chemin_dest.remove()
-            chemin_dest.mkdir()
-        
-        # recopier le fichier temporaire au bon endroit
-        
+        # le fichier partiel devient le fichier destination, après contrôle
+        base = None
+        cible = self.fichier_part
         try:
-            # on revient au début du fichier temporaire
+            # on revient au début du fichier partiel
             self.fichier_temp.seek(0)
             
-            with open(self.fichier_dest, 'wb') as f_dest:
-                # on démarre le calcul de CRC32
-                crc32 = 0
-                while True:
-                    buffer = self.fichier_temp.read(16384)
-                    if not buffer:
-                        break
-                    f_dest.write(buffer)
-                    # poursuite du calcul de CRC32
-                    crc32 = binascii.crc32(buffer, crc32)
+            if self.compression or self.patch:
+                if self.compression:
+                    # flux compressé: décompressé bloc par bloc avant le contrôle du CRC32
+                    blocs = Compression.decompresser(self.fichier_temp, self.compression, self.taille_fichier)
+                else:
+                    # patch: la nouvelle version est reconstruite à côté de la
+                    # version de base, qui reste intacte jusqu'au contrôle du CRC32
+                    base, blocs = self.ouvrir_patch()
+                cible = fichier_provisoire(self.fichier_dest)
+                with open(cible, 'wb') as f_dest:
+                    # on démarre le calcul de CRC32
+                    crc32 = 0
+                    for buffer in blocs:
+                        f_dest.write(buffer)
+                        # poursuite du calcul de CRC32
+                        crc32 = binascii.crc32(buffer, crc32)
+            else:
+                # données déjà en place, CRC32 déjà calculé (cf. ecrire_donnees)
+                crc32 = self.crc_paquets.crc32
             
             # vérifier si la taille obtenue est correcte
-            taille_obtenue = self.fichier_dest.getsize()
+            taille_obtenue = cible.getsize()
             if taille_obtenue != self.taille_fichier:
                 logging.error(f"Taille du fichier incorrecte: attendu {self.taille_fichier}, obtenu {taille_obtenue}")
                 raise IOError('taille du fichier incorrecte.')
             
             # vérifier si le checksum CRC32 est correct
-            logging.info(f"CRC32 calculé: {crc32 & 0xFFFFFFFF:08X}, CRC32 attendu: {self.crc32 & 0xFFFFFFFF:08X}")
-            if (crc32 & 0xFFFFFFFF) != (self.crc32 & 0xFFFFFFFF):
+            logging.info(f"CRC32 calculé: {crc32 & 0xFFFFFFFF:08X}, CRC32 attendu: {self.crc_attendu & 0xFFFFFFFF:08X}")
+            if (crc32 & 0xFFFFFFFF) != (self.crc_attendu & 0xFFFFFFFF):
                 logging.error(f"Contrôle d'intégrité incorrect pour le fichier: {self.nom_fichier}")
                 raise IOError("controle d'integrite incorrect.")
             
-            # mettre à jour la date de modif: tuple (atime,mtime)
-            self.fichier_dest.utime((self.date_fichier, self.date_fichier))
+            if base is not None:
+                base.close()
             
-            # fermer le fichier temporaire
-            self.fichier_temp.close()
+            # mettre à jour la date de modif: tuple (atime,mtime), avant que
+            # le fichier n'apparaisse à destination
+            cible.utime((self.date_fichier, self.date_fichier))
+            os.replace(cible, self.fichier_dest)
             
-            # d'après la doc de tempfile, le fichier est automatiquement supprimé
+            # fermer le fichier partiel, supprimé s'il n'a pas été renommé
+            self.fichier_temp.close()
+            if cible != self.fichier_part:
+                self.fichier_part.remove()
+            self.supprimer_point_reprise()
             self.fichier_en_cours = False
             
             # Affichage de fin de traitement
             logging.info(f'Fichier "{self.nom_fichier}" recu en entier, recopie a destination terminée.')
+            if relais_reception is not None:
+                relais_reception.signaler('recu', self.nom_fichier)
             
             # Marquer le fichier comme terminé
             self.termine = True
             
             # dans ce cas on retire le fichier du dictionnaire
             self.est_termine = True
-            del fichiers[self.nom_fichier]
+            fichiers.pop(self.nom_fichier, None)
         
         except IOError as e:
             logging.error(f"Erreur lors de la recopie du fichier {self.nom_fichier}: {e}")
-            # Vous pouvez ajouter ici d'autres actions à effectuer en cas d'erreur
+            if cible != self.fichier_part:
+                # patch non applicable: la version précédente est conservée
+                if base is not None:
+                    base.close()
+                if os.path.exists(cible):
+                    cible.remove()
+            # réception abandonnée (fichier partiel et point de reprise
+            # supprimés): le prochain tour d'émission la recommence
+            self.annuler_reception()
+            if fichiers.get(self.nom_fichier) is self:
+                del fichiers[self.nom_fichier]
             raise  # On relève l'exception pour la gestion d'erreur au niveau supérieur
         except Exception as e:
             logging.error(f"Erreur inattendue lors de la recopie du fichier {self.nom_fichier}: {e}")
             raise
         logging.info(f"Fin de recopier_destination pour {self.nom_fichier}")
 
+    def ouvrir_patch(self):
+        """Ouvre la version de base d'un patch reçu, après avoir vérifié
+        qu'elle correspond à celle indiquée dans le patch. Renvoie (fichier de
+        base ouvert, générateur des blocs de la nouvelle version)."""
+        taille_base, date_base, crc_base, taille_bloc, indices = Delta.lire_entete_patch(self.fichier_temp)
+        if not self.fichier_dest.isfile() or self.fichier_dest.getsize() != taille_base \
+                or int(self.fichier_dest.getmtime()) != date_base:
+            raise IOError("version de base du patch absente ou modifiee.")
+        base = open(self.fichier_dest, 'rb')
+        logging.info(f"Patch de {len(indices)} bloc(s) pour {self.nom_fichier}")
+        return base, Delta.appliquer(self.fichier_temp, base, taille_bloc, indices, self.taille_fichier)
+
     def traiter_paquet(self, paquet):
         """Traite un paquet reçu pour ce fichier."""
-        logging.info(f"Début du traitement du paquet pour {self.nom_fichier}, offset: {paquet.offset}")
+        logging.debug("Début du traitement du paquet pour %s, offset: %d", self.nom_fichier, paquet.offset)
         
         if self.termine:
-            logging.info(f"Fichier {self.nom_fichier} déjà terminé, paquet ignoré")
+            logging.debug("Fichier %s déjà terminé, paquet ignoré", self.nom_fichier)
             return
         
         # Vérifier si le paquet est dans les limites du fichier
@@ -265,35 +742,193 @@ class Fichier:
         
         # Vérifier si le paquet n'a pas déjà été reçu
         if self.paquets_recus.get(paquet.num_paquet):
-            logging.info(f"Paquet {paquet.num_paquet} déjà reçu pour {self.nom_fichier}, ignoré")
+            logging.debug("Paquet %d déjà reçu pour %s, ignoré", paquet.num_paquet, self.nom_fichier)
             return
         
         # Écrire les données du paquet dans le fichier temporaire
-        self.fichier_temp.seek(paquet.offset)
-        self.fichier_temp.write(paquet.donnees)
-        self.fichier_temp.flush()
+        self.ecrire_donnees(paquet.num_paquet, paquet.offset, paquet.donnees)
         
-        # Marquer le paquet comme reçu
-        self.paquets_recus.set(paquet.num_paquet, True)
+        logging.debug("Paquet %d traité pour %s, %d paquets reçus sur %d",
+                      paquet.num_paquet, self.nom_fichier, self.paquets_recus.nb_true, self.nb_paquets)
         
-        logging.info(f"Paquet {paquet.num_paquet} traité pour {self.nom_fichier}, {self.paquets_recus.nb_true} paquets reçus sur {self.nb_paquets}")
+        # une parité du groupe attendait peut-être ce paquet
+        if self.reparations:
+            k, r, taille_donnees_max = self.fec
+            i = paquet.num_paquet % k
+            self.reparer(paquet.num_paquet // k, i % r)
         
         # Vérifier si le fichier est complet
         if self.est_complet():
-            logging.info(f"Fichier {self.nom_fichier} complet, lancement de la recopie")
-            try:
-                self.recopier_destination()
-            except Exception as e:
-                logging.error(f"Erreur lors de la recopie de {self.nom_fichier}: {e}")
-                traceback.print_exc()
+            self.terminer()
         else:
-            paquets_manquants = self.nb_paquets - self.paquets_recus.nb_true
-            logging.info(f"Fichier {self.nom_fichier} incomplet, {paquets_manquants} paquets manquants")
+            logging.debug("Fichier %s incomplet, %d paquets manquants",
+                          self.nom_fichier, self.nb_paquets - self.paquets_recus.nb_true)
+
+    def meme_decoupage(self, paquet):
+        """vrai si le paquet suit le découpage en paquets de cette réception:
+        même nombre de paquets, et offset conforme à la taille des paquets
+        déjà reçus. La même version d'un fichier peut être émise en
+        datagrammes d'une autre taille (--mtu), donc découpée autrement."""
+        if paquet.nb_paquets != self.nb_paquets:
+            return False
+        if self.taille_paquet and paquet.type_paquet == PAQUET_FICHIER:
+            return paquet.offset == paquet.num_paquet * self.taille_paquet
+        return True
+
+    def ecrire_donnees(self, num_paquet, offset, donnees):
+        """Ecrit les données d'un paquet à leur place dans le fichier partiel
+        et le marque comme reçu."""
+        if self.crc_paquets is not None:
+            self.crc_paquets.ajouter(num_paquet, donnees)
+        if not self.taille_paquet and num_paquet < self.nb_paquets - 1:
+            self.taille_paquet = len(donnees)
+        donnees = memoryview(donnees)
+        while donnees:
+            n = os.pwrite(self.fichier_temp.fileno(), donnees, offset)
+            donnees, offset = donnees[n:], offset + n
+        self.paquets_recus.set(num_paquet, True)
+
+    def traiter_reparation(self, paquet):
+        """Traite un paquet de réparation (FEC) reçu pour ce fichier."""
+        if self.termine:
+            return
+        k, r, j, taille_donnees_max = paquet.fec
+        if self.fec is None:
+            self.fec = (k, r, taille_donnees_max)
+        elif self.fec != (k, r, taille_donnees_max):
+            logging.warning(f"Paquet de réparation incohérent ignoré pour {self.nom_fichier}")
+            return
+        # la parité est gardée au-delà du tampon de réception: copie
+        self.reparations[(paquet.num_paquet, j)] = bytes(paquet.donnees)
+        self.reparer(paquet.num_paquet, j)
+        if self.est_complet():
+            self.terminer()
+
+    def reparer(self, groupe, j):
+        """Reconstruit si possible le paquet manquant couvert par la parité j
+        du groupe: il faut qu'il soit le seul manquant parmi les paquets de
+        données qu'elle couvre. La parité est oubliée dès qu'elle est inutile."""
+        reparation = self.reparations.get((groupe, j))
+        if reparation is None:
+            return
+        k, r, taille_donnees_max = self.fec
+        couverts = range(groupe*k + j, min(groupe*k + k, self.nb_paquets), r)
+        manquants = [n for n in couverts if not self.paquets_recus.get(n)]
+        if len(manquants) > 1:
+            # on attend d'autres paquets du groupe
+            return
+        del self.reparations[(groupe, j)]
+        if not manquants:
+            return
+        manquant = manquants[0]
+        offset = manquant * taille_donnees_max
+        taille_donnees = min(taille_donnees_max, self.taille_fichier - offset)
+        if self.compression or self.patch:
+            # la taille du flux compressé (ou du patch) n'est pas connue: le
+            # dernier paquet peut être complété par des zéros, ignorés ensuite
+            taille_donnees = min(taille_donnees, len(reparation))
+        if taille_donnees < 0 or taille_donnees > len(reparation):
+            logging.warning(f"Paquet de réparation incohérent ignoré pour {self.nom_fichier}")
+            return
+        # XOR de la parité et des autres paquets couverts, relus dans le
+        # fichier partiel (les plus courts sont complétés par des zéros)
+        valeur = int.from_bytes(reparation, 'little')
+        for n in couverts:
+            if n != manquant:
+                valeur ^= int.from_bytes(os.pread(self.fichier_temp.fileno(), taille_donnees_max,
+                                                  n * taille_donnees_max), 'little')
+        donnees = valeur.to_bytes(len(reparation), 'little')[:taille_donnees]
+        self.ecrire_donnees(manquant, offset, donnees)
+        self.nb_paquets_repares += 1
+        logging.info(f"Paquet {manquant} reconstruit par FEC pour {self.nom_fichier}")
+
+    def traiter_fin(self, paquet):
+        """Traite le paquet de fin de fichier, qui donne le CRC32 calculé
+        par l'émetteur pendant l'envoi."""
+        if self.termine or self.crc_attendu is not None:
+            return
+        if paquet.taille_fichier != self.taille_fichier or paquet.date_fichier != self.date_fichier:
+            logging.warning(f"Paquet de fin ignoré pour {self.nom_fichier}: taille ou date différente")
+            return
+        self.crc_attendu = paquet.crc32
+        if self.est_complet():
+            self.terminer()
+
+    def terminer(self):
+        """Lance la recopie une fois toutes les données reçues, si le CRC32
+        à vérifier est connu (sinon on attend le paquet de fin)."""
+        if self.crc_attendu is None:
+            logging.info(f"Fichier {self.nom_fichier} complet, en attente du paquet de fin")
+            return
+        logging.info(f"Fichier {self.nom_fichier} complet, lancement de la recopie")
+        if self.nb_paquets_repares:
+            logging.info(f"{self.nb_paquets_repares} paquet(s) reconstruit(s) par FEC pour {self.nom_fichier}")
+        try:
+            self.recopier_destination()
+        except Exception as e:
+            logging.error(f"Erreur lors de la recopie de {self.nom_fichier}: {e}")
+            traceback.print_exc()
 
     def est_complet(self):
         """Vérifie si tous les paquets du fichier ont été reçus."""
         return self.paquets_recus.nb_true == self.nb_paquets
 
+#------------------------------------------------------------------------------
+# classe TableIdentifiants
+#-------------------
+def identifiant_fichier(nom_fichier_dest, taille_fichier, date_fichier, drapeaux):
+    """Identifiant de 64 bits d'une version d'un fichier émis (nom encodé,
+    taille, date et drapeaux): il est le même à chaque tour d'émission."""
+    h = hashlib.blake2b(struct.pack("!QQi", taille_fichier, date_fichier, drapeaux), digest_size=IDENTIFIANT.size)
+    h.update(nom_fichier_dest)
+    return IDENTIFIANT.unpack(h.digest())[0]
+
+class TableIdentifiants:
+    """Table des identifiants de fichiers annoncés, côté réception, et des
+    paquets reçus avant l'annonce de leur identifiant. Partagée par les
+    threads d'écriture (cf. PoolEcriture)."""
+
+    def __init__(self, max_identifiants=MAX_IDENTIFIANTS, max_attente=MAX_ATTENTE):
+        # identifiant -> nom du fichier, les plus anciens étant oubliés
+        self.noms = collections.OrderedDict()
+        self.max_identifiants = max_identifiants
+        # identifiant -> paquets en attente, les plus anciens étant abandonnés
+        self.attente = collections.OrderedDict()
+        self.octets_en_attente = 0
+        self.max_attente = max_attente
+        self.verrou = threading.Lock()
+
+    def nom(self, identifiant):
+        "nom du fichier annoncé avec cet identifiant, ou None."
+        return self.noms.get(identifiant)
+
+    def annoncer(self, identifiant, nom_fichier):
+        """enregistre l'annonce d'un fichier; renvoie les paquets qui
+        attendaient cet identifiant, à traiter."""
+        with self.verrou:
+            if identifiant in self.noms:
+                self.noms.move_to_end(identifiant)
+            else:
+                self.noms[identifiant] = nom_fichier
+                if len(self.noms) > self.max_identifiants:
+                    self.noms.popitem(last=False)
+            paquets = self.attente.pop(identifiant, [])
+            self.octets_en_attente -= sum(len(p) for p in paquets)
+        return paquets
+
+    def mettre_en_attente(self, identifiant, paquet):
+        "garde un paquet d'identifiant inconnu jusqu'à son annonce."
+        with self.verrou:
+            while self.attente and self.octets_en_attente + len(paquet) > self.max_attente:
+                ancien, paquets = self.attente.popitem(last=False)
+                self.octets_en_attente -= sum(len(p) for p in paquets)
+                logging.warning(f"{len(paquets)} paquet(s) sans annonce abandonné(s)")
+            self.attente.setdefault(identifiant, []).append(bytes(paquet))
+            self.octets_en_attente += len(paquet)
+
+# identifiants des fichiers annoncés, pour la réception
+table_identifiants = TableIdentifiants()
+
 #------------------------------------------------------------------------------
 # classe PAQUET
 #-------------------
@@ -301,9 +936,6 @@ class Paquet:
     """classe représentant un paquet BFTP, permettant la construction et le
     décodage du paquet."""
 
-    def test_method(self):
-        print("La méthode test_method fonctionne.")
-
     def __init__(self):
         "Constructeur d'objet Paquet BFTP."
         # on initialise les infos contenues dans l'entête du paquet
@@ -320,14 +952,15 @@ class Paquet:
         self.fichier_en_cours = ""
         self.num_session = -1
         self.num_paquet_session = -1
-
-    def decoder(self, paquet):
-        "Pour décoder un paquet BFTP."
-        taille_attendue = struct.calcsize(FORMAT_ENTETE)
-        if len(paquet) < taille_attendue:
-            raise ValueError(f"Taille du paquet insuffisante : {len(paquet)} octets reçus, {taille_attendue} attendus")
-        
-        entete = paquet[0:TAILLE_ENTETE]
+        self.drapeaux = 0
+        self.fec = None
+        # le décodage met à jour les stats (sinon, paquets comptés par la capture, cf. PoolEcriture)
+        self.compter = True
+
+    def decoder_entete(self, paquet):
+        "Pour décoder l'entête d'un paquet BFTP, et vérifier son type."
+        if len(paquet) < TAILLE_ENTETE:
+            raise ValueError(f"Taille du paquet insuffisante : {len(paquet)} octets reçus, {TAILLE_ENTETE} attendus")
         (
             self.type_paquet,
             self.longueur_nom,
@@ -340,33 +973,52 @@ class Paquet:
             self.taille_fichier,
             self.date_fichier,
             self.crc32
-        ) = struct.unpack(FORMAT_ENTETE, entete)
-        if self.type_paquet not in [PAQUET_FICHIER, PAQUET_HEARTBEAT, PAQUET_DELETEFile]:
+        ) = struct.unpack_from(FORMAT_ENTETE, paquet)
+        self.drapeaux = self.type_paquet & ~MASQUE_TYPE
+        self.type_paquet &= MASQUE_TYPE
+        if self.type_paquet not in [PAQUET_FICHIER, PAQUET_HEARTBEAT, PAQUET_DELETEFile,
+                                    PAQUET_FINFICHIER, PAQUET_REPARATION, PAQUET_MULTIFICHIER,
+                                    PAQUET_CLONE, PAQUET_ANNONCE]:
             raise ValueError('type de paquet incorrect')
-        if self.type_paquet == PAQUET_FICHIER:
+
+    def decoder(self, paquet):
+        "Pour décoder un paquet BFTP."
+        self.decoder_entete(paquet)
+        if self.type_paquet in (PAQUET_FICHIER, PAQUET_REPARATION):
             if self.longueur_nom > MAX_NOM_FICHIER:
                 raise ValueError('nom de fichier trop long')
-            if self.offset + self.taille_donnees > self.taille_fichier:
+            if self.type_paquet == PAQUET_FICHIER \
+            and self.offset + self.taille_donnees > self.taille_fichier:
                 raise ValueError('offset ou taille des donnees incorrects')
-            self.nom_fichier = paquet[TAILLE_ENTETE : TAILLE_ENTETE + self.longueur_nom]
-            # conversion en utf-8 pour éviter problèmes dûs aux accents
-            self.nom_fichier = self.nom_fichier.decode('utf-8', 'strict')
-            if chemin_interdit(self.nom_fichier):
-                logging.error('nom de fichier ou de chemin incorrect: {}'.format(self.nom_fichier))
-                raise ValueError('nom de fichier ou de chemin incorrect')
+            if self.drapeaux & DRAPEAU_IDENTIFIANT:
+                if not self.nom_identifiant(paquet):
+                    return
+            else:
+                self.nom_fichier = paquet[TAILLE_ENTETE : TAILLE_ENTETE + self.longueur_nom]
+                # conversion en utf-8 pour éviter problèmes dûs aux accents
+                self.nom_fichier = bytes(self.nom_fichier).decode('utf-8', 'strict')
+                if chemin_interdit(self.nom_fichier):
+                    logging.error('nom de fichier ou de chemin incorrect: {}'.format(self.nom_fichier))
+                    raise ValueError('nom de fichier ou de chemin incorrect')
             taille_entete_complete = TAILLE_ENTETE + self.longueur_nom
             if self.taille_donnees != len(paquet) - taille_entete_complete:
                 raise ValueError('taille de donnees incorrecte')
+            # vue sur le tampon de réception, jusqu'à l'écriture sur disque
             self.donnees = paquet[taille_entete_complete:len(paquet)]
+            if self.type_paquet == PAQUET_REPARATION:
+                self.decoder_reparation()
             # on mesure les stats, et on les affiche tous les 100 paquets
-            stats.ajouter_paquet(self)
+            if self.compter:
+                stats.ajouter_paquet(self)
             # est-ce que le fichier est en cours de réception ?
             if self.nom_fichier in fichiers:
                 f = fichiers[self.nom_fichier]
                 # on vérifie si le fichier n'a pas changé:
                 if f.date_fichier != self.date_fichier \
                 or f.taille_fichier != self.taille_fichier \
-                or f.crc32 != self.crc32:
+                or f.crc32 != self.crc32 \
+                or f.drapeaux != self.drapeaux \
+                or not f.meme_decoupage(self):
                     # on commence par annuler la réception en cours:
                     f.annuler_reception()
                     del fichiers[self.nom_fichier]
@@ -381,7 +1033,7 @@ class Paquet:
                         Console.Print_temp(msg, NL=True)
                         logging.info(msg)
                         self.fichier_en_cours = self.nom_fichier
-                    f.traiter_paquet(self)
+                    self.traiter(f)
             else:
                 # est-ce que le fichier existe déjà sur le disque ?
                 fichier_dest = CHEMIN_DEST / self.nom_fichier
@@ -396,11 +1048,48 @@ class Paquet:
                 else:
                     # sinon on crée un nouvel objet fichier d'après les infos du paquet:
                     self.nouveau_fichier()
+        elif self.type_paquet == PAQUET_MULTIFICHIER:
+            if self.longueur_nom != 0 or self.taille_donnees != len(paquet) - TAILLE_ENTETE:
+                raise ValueError('paquet multi-fichiers incorrect')
+            if self.compter:
+                stats.ajouter_paquet(self)
+            self.traiter_multifichier(memoryview(paquet)[TAILLE_ENTETE:])
+        elif self.type_paquet == PAQUET_CLONE:
+            if self.longueur_nom > MAX_NOM_FICHIER or self.taille_donnees > MAX_NOM_FICHIER \
+            or self.taille_donnees != len(paquet) - TAILLE_ENTETE - self.longueur_nom:
+                raise ValueError('paquet de clonage incorrect')
+            debut = TAILLE_ENTETE + self.longueur_nom
+            self.nom_fichier = bytes(paquet[TAILLE_ENTETE : debut]).decode('utf-8', 'strict')
+            origine = bytes(paquet[debut:]).decode('utf-8', 'strict')
+            if chemin_interdit(self.nom_fichier) or chemin_interdit(origine):
+                logging.error('nom de fichier ou de chemin incorrect: {} / {}'.format(self.nom_fichier, origine))
+                raise ValueError('nom de fichier ou de chemin incorrect')
+            self.traiter_clone(origine)
+        elif self.type_paquet == PAQUET_FINFICHIER:
+            if self.longueur_nom > MAX_NOM_FICHIER or self.taille_donnees != 0:
+                raise ValueError('paquet de fin de fichier incorrect')
+            if self.drapeaux & DRAPEAU_IDENTIFIANT:
+                if not self.nom_identifiant(paquet):
+                    return
+            else:
+                self.nom_fichier = paquet[TAILLE_ENTETE : TAILLE_ENTETE + self.longueur_nom]
+                self.nom_fichier = bytes(self.nom_fichier).decode('utf-8', 'strict')
+                if chemin_interdit(self.nom_fichier):
+                    raise ValueError('nom de fichier ou de chemin incorrect')
+            # sans réception en cours, le paquet de fin est sans objet: la
+            # prochaine boucle d'émission renverra données et paquet de fin
+            if self.nom_fichier in fichiers:
+                fichiers[self.nom_fichier].traiter_fin(self)
+        elif self.type_paquet == PAQUET_ANNONCE:
+            identifiant, nom_fichier = self.decoder_annonce(paquet)
+            # les paquets arrivés avant l'annonce sont traités maintenant
+            for paquet_en_attente in table_identifiants.annoncer(identifiant, nom_fichier):
+                self.decoder(paquet_en_attente)
         elif self.type_paquet == PAQUET_HEARTBEAT:
-            HeartBeat.check_heartbeat(HB_recus, self.num_session, self.num_paquet_session, self.num_paquet)
+            HB_recus.check_heartbeat(self.num_session, self.num_paquet_session, self.num_paquet)
         elif self.type_paquet == PAQUET_DELETEFile:
             self.nom_fichier = paquet[TAILLE_ENTETE : TAILLE_ENTETE + self.longueur_nom]
-            self.nom_fichier = self.nom_fichier.decode('utf-8', 'strict')
+            self.nom_fichier = bytes(self.nom_fichier).decode('utf-8', 'strict')
             fichier_dest = CHEMIN_DEST / self.nom_fichier
             # Test pour bloquer en présence de caracteres joker ou autres
             if chemin_interdit(self.nom_fichier):
@@ -423,11 +1112,132 @@ class Paquet:
                     logging.info("suppression de dossier")
                     try:
                         os.rmdir(fichier_dest)
+                        # il a pu être mémorisé, avec ses anciens sous-répertoires
+                        repertoires_crees.clear()
                     except OSError:
                         msg = 'Echec de effacement de "{}"...'.format(self.nom_fichier)
                         Console.Print_temp(msg, NL=True)
                         logging.warning(msg)
 
+    def decoder_annonce(self, paquet):
+        """Pour décoder un paquet d'annonce, d'entête déjà décodée: renvoie
+        l'identifiant annoncé et le nom du fichier."""
+        if self.longueur_nom > MAX_NOM_FICHIER or self.taille_donnees != IDENTIFIANT.size \
+        or len(paquet) != TAILLE_ENTETE + self.longueur_nom + IDENTIFIANT.size:
+            raise ValueError("paquet d'annonce incorrect")
+        nom_fichier = bytes(paquet[TAILLE_ENTETE : TAILLE_ENTETE + self.longueur_nom]).decode('utf-8', 'strict')
+        if chemin_interdit(nom_fichier):
+            logging.error('nom de fichier ou de chemin incorrect: {}'.format(nom_fichier))
+            raise ValueError('nom de fichier ou de chemin incorrect')
+        identifiant, = IDENTIFIANT.unpack_from(paquet, TAILLE_ENTETE + self.longueur_nom)
+        return identifiant, nom_fichier
+
+    def nom_identifiant(self, paquet):
+        """Pour un paquet portant l'identifiant de son fichier au lieu de son
+        nom: retrouve le nom annoncé. Renvoie False si l'identifiant n'a pas
+        encore été annoncé (le paquet est alors mis en attente)."""
+        if self.longueur_nom != IDENTIFIANT.size:
+            raise ValueError('identifiant de fichier incorrect')
+        identifiant, = IDENTIFIANT.unpack_from(paquet, TAILLE_ENTETE)
+        # les drapeaux décrivent ensuite le fichier, indépendamment du mode d'émission
+        self.drapeaux &= ~DRAPEAU_IDENTIFIANT
+        self.nom_fichier = table_identifiants.nom(identifiant)
+        if self.nom_fichier is None:
+            table_identifiants.mettre_en_attente(identifiant, paquet)
+            return False
+        return True
+
+    def decoder_reparation(self):
+        "Pour décoder la sous-entête d'un paquet de réparation (FEC)."
+        if len(self.donnees) < SOUS_ENTETE_REPARATION.size:
+            raise ValueError('paquet de reparation incorrect')
+        self.fec = k, r, j, taille_donnees_max = SOUS_ENTETE_REPARATION.unpack_from(self.donnees)
+        self.donnees = self.donnees[SOUS_ENTETE_REPARATION.size:]
+        if not (0 <= j < r <= k) or taille_donnees_max <= 0 \
+        or len(self.donnees) > taille_donnees_max \
+        or self.num_paquet < 0 or self.num_paquet * k >= self.nb_paquets:
+            raise ValueError('paquet de reparation incorrect')
+
+    def traiter_multifichier(self, donnees):
+        """Pour traiter un paquet multi-fichiers: chaque petit fichier est
+        vérifié puis écrit directement à destination, sans fichier temporaire."""
+        position = 0
+        for i in range(self.num_paquet):
+            if position + ENTREE_MULTIFICHIER.size > len(donnees):
+                raise ValueError('paquet multi-fichiers incorrect')
+            longueur_nom, date_fichier, taille_fichier, crc32 = \
+                ENTREE_MULTIFICHIER.unpack_from(donnees, position)
+            position += ENTREE_MULTIFICHIER.size
+            fin = position + longueur_nom + taille_fichier
+            if longueur_nom > MAX_NOM_FICHIER or fin > len(donnees):
+                raise ValueError('paquet multi-fichiers incorrect')
+            nom_fichier = bytes(donnees[position:position+longueur_nom]).decode('utf-8', 'strict')
+            contenu = donnees[position+longueur_nom:fin]
+            position = fin
+            if chemin_interdit(nom_fichier):
+                logging.error('nom de fichier ou de chemin incorrect: {}'.format(nom_fichier))
+                continue
+            if (binascii.crc32(contenu) & 0xFFFFFFFF) != (crc32 & 0xFFFFFFFF):
+                logging.error(f"Contrôle d'intégrité incorrect pour le fichier: {nom_fichier}")
+                continue
+            fichier_dest = CHEMIN_DEST / nom_fichier
+            if  fichier_dest.exists() \
+            and fichier_dest.getsize() == taille_fichier \
+            and fichier_dest.getmtime() == date_fichier:
+                continue
+            # une réception en cours d'une autre version du fichier est abandonnée
+            if nom_fichier in fichiers:
+                fichiers.pop(nom_fichier).annuler_reception()
+            with ouvrir_fichier_recu(fichier_dest, 'wb') as f_dest:
+                f_dest.write(contenu)
+            fichier_dest.utime((date_fichier, date_fichier))
+            logging.info(f'Fichier "{nom_fichier}" recu dans un paquet multi-fichiers')
+        if position != len(donnees):
+            raise ValueError('paquet multi-fichiers incorrect')
+        Console.Print_temp('{} petits fichiers recus'.format(self.num_paquet))
+
+    def traiter_clone(self, origine):
+        """Pour traiter un paquet de clonage: le fichier est recopié depuis
+        origine, fichier déjà reçu de même contenu, à côté de la destination
+        qui n'est remplacée qu'après contrôle de la taille et du CRC32."""
+        fichier_dest = CHEMIN_DEST / self.nom_fichier
+        if  fichier_dest.exists() \
+        and fichier_dest.getsize() == self.taille_fichier \
+        and fichier_dest.getmtime() == self.date_fichier:
+            Console.Print_temp('Fichier deja recu: {}'.format(self.nom_fichier))
+            return
+        fichier_origine = CHEMIN_DEST / origine
+        if not fichier_origine.isfile() or fichier_origine.getsize() != self.taille_fichier:
+            logging.warning(f'Copie de "{origine}" vers "{self.nom_fichier}" impossible: original absent ou modifie')
+            return
+        # une réception en cours d'une autre version du fichier est abandonnée
+        if self.nom_fichier in fichiers:
+            fichiers.pop(self.nom_fichier).annuler_reception()
+        cible = fichier_provisoire(fichier_dest)
+        crc32 = 0
+        with open(fichier_origine, 'rb') as f_origine, ouvrir_fichier_recu(cible, 'wb') as f_dest:
+            for buffer in iter(lambda: f_origine.read(TAILLE_TRANCHE_CRC), b''):
+                f_dest.write(buffer)
+                crc32 = binascii.crc32(buffer, crc32)
+        if cible.getsize() != self.taille_fichier or (crc32 & 0xFFFFFFFF) != (self.crc32 & 0xFFFFFFFF):
+            logging.error(f'Contrôle d\'intégrité incorrect pour la copie de "{origine}" vers "{self.nom_fichier}"')
+            cible.remove()
+            return
+        os.replace(cible, fichier_dest)
+        fichier_dest.utime((self.date_fichier, self.date_fichier))
+        msg = 'Fichier "{}" recopie depuis "{}"'.format(self.nom_fichier, origine)
+        Console.Print_temp(msg, NL=True)
+        logging.info(msg)
+
+    def traiter(self, fichier):
+        "Pour traiter un paquet de données ou de réparation d'un fichier en cours."
+        if self.type_paquet == PAQUET_REPARATION:
+            fichier.traiter_reparation(self)
+        else:
+            fichier.traiter_paquet(self)
+        if not fichier.termine:
+            fichier.point_de_reprise()
+
     def nouveau_fichier(self):
         "pour débuter la réception d'un nouveau fichier."
         msg = 'Reception de "{}"...'.format(self.nom_fichier)
@@ -437,18 +1247,22 @@ class Paquet:
         Console.Print_temp(msg, NL=True)
         logging.info(msg)
         self.fichier_en_cours = self.nom_fichier
+        if relais_reception is not None:
+            # une autre version du fichier reçue par un autre processus est abandonnée
+            relais_reception.signaler('reception', self.nom_fichier)
         # on crée un nouvel objet fichier d'après les infos du paquet:
         nouveau_fichier = Fichier(self)
         fichiers[self.nom_fichier] = nouveau_fichier
-        nouveau_fichier.traiter_paquet(self)
+        if nouveau_fichier.est_complet():
+            # reprise d'une réception déjà complète (cf. Fichier.reprendre)
+            nouveau_fichier.terminer()
+        else:
+            self.traiter(nouveau_fichier)
 
     def construire(self):
         "pour construire un paquet BFTP à partir des paramètres. (non implémenté)"
         raise NotImplementedError
 
-print("Contenu de la classe Paquet:")
-print(Paquet.__dict__)
-
 
 
 
@@ -581,6 +1395,10 @@ class HeartBeat:
 
     def send_heartbeat(self, message=None, num_session=None, num_paquet=None):
         """ Send a heartbeat packet """
+        transport_session().envoyer([self.paquet_heartbeat(message, num_session, num_paquet)])
+
+    def paquet_heartbeat(self, message=None, num_session=None, num_paquet=None):
+        """ Build a heartbeat datagram (header, message) """
         # un HeartBeat est un paquet court donnant un timestamp qui pourra être vérifié à la réception
         # on donne un numero de session afin de tracer coté haut une relance du guichet bas
         # num paquet permet de tracer les iterations au sein d'une session
@@ -594,7 +1412,6 @@ class HeartBeat:
             message = "HeartBeat"
         taille_donnees = len(message)
         # self.print_heartbeat()
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         # on commence par packer l'entete:
         entete = struct.pack(FORMAT_ENTETE,
                              PAQUET_HEARTBEAT,
@@ -609,9 +1426,7 @@ class HeartBeat:
                              0,
                              0
                              )
-        paquet = entete + message.encode('utf-8')
-        s.sendto(paquet, (HOST, PORT))
-        s.close()
+        return (entete, message.encode('utf-8'))
 
     def stop(self):
         self.stop_event.set()
@@ -620,31 +1435,71 @@ class HeartBeat:
 #-------------------
 
 class LimiteurDebit:
-    "pour controler le débit d'envoi de données."
+    """pour controler le débit d'envoi de données.
+
+    Seau à jetons (algorithme GCRA) sur time.monotonic_ns: chaque datagramme
+    émis repousse l'heure théorique d'émission (tat) de sa durée sur le lien,
+    entêtes IP/UDP comprises. On peut émettre tant que l'on n'est pas en
+    avance de plus d'une rafale sur cette heure théorique. Le retard pris
+    au réveil d'une pause est rattrapé sur les datagrammes suivants, dans la
+    limite de RATTRAPAGE; un retard dû à l'émetteur lui-même (lecture, calcul
+    de CRC, fichier suivant...) n'est pas rattrapé, pour ne pas provoquer de
+    rafale.
+    """
 
-    def __init__(self, debit):
+    def __init__(self, debit, rafale=None, mtu=None):
         """contructeur de classe LimiteurDebit.
 
-        debit : débit maximum autorisé, en Kbps."""
+        debit  : débit maximum autorisé, en Kbps.
+        rafale : nombre d'octets pouvant être émis d'un coup (RAFALE par défaut).
+        mtu    : MTU du lien, pour compter les entêtes des fragments IP."""
         # débit en Kbps converti en octets/s
         self.debit_max = debit*1000/8
+        # durée d'émission d'un octet sur le lien, en ns
+        self.ns_par_octet = 1e9 / self.debit_max
+        self.rafale = RAFALE if rafale is None else rafale
+        self.tolerance = int(self.rafale * self.ns_par_octet)
+        self.mtu = MTU_LIEN if mtu is None else mtu
+        # heure théorique d'émission du prochain datagramme: le seau démarre
+        # vide, sans rafale initiale
+        self.tat = time.monotonic_ns() + self.tolerance
+        # retard au réveil de la dernière pause, à rattraper (en ns)
+        self.retard = 0
         # on stocke le temps de départ
-        self.temps_debut = time.time()
+        self.temps_debut = time.monotonic()
         # nombre d'octets déjà transférés
         self.octets_envoyes = 0
 
     def depart_chrono(self):
-        "pour (re)démarrer la mesure du débit."
-        self.temps_debut = time.time()
+        """pour (re)démarrer la mesure du débit. Le seau à jetons n'est pas
+        remis à zéro: le débit reste respecté d'un fichier à l'autre."""
+        self.temps_debut = time.monotonic()
         self.octets_envoyes = 0
 
-    def ajouter_donnees(self, octets):
-        "pour ajouter un nombre d'octets envoyés."
+    def surcout(self, taille):
+        """nombre d'octets d'entêtes ajoutés sur le lien à un datagramme UDP de
+        taille octets: entête UDP, et une entête IP par fragment."""
+        nb_fragments = -(-(taille + TAILLE_ENTETE_UDP) // (self.mtu - TAILLE_ENTETE_IP))
+        return TAILLE_ENTETE_UDP + max(1, nb_fragments) * TAILLE_ENTETE_IP
+
+    def taille_lot(self, taille_datagramme, maximum):
+        """nombre de datagrammes de taille_datagramme octets que l'on peut
+        émettre en un lot sans dépasser la rafale (au moins 1)."""
+        return max(1, min(maximum, self.rafale // (taille_datagramme + self.surcout(taille_datagramme))))
+
+    def ajouter_donnees(self, octets, nb_datagrammes=1):
+        "pour ajouter un nombre d'octets envoyés, en nb_datagrammes datagrammes."
         self.octets_envoyes += octets
+        if nb_datagrammes:
+            octets += nb_datagrammes * self.surcout(octets // nb_datagrammes)
+        maintenant = time.monotonic_ns()
+        self.tat = max(self.tat, maintenant - self.retard) + int(octets * self.ns_par_octet)
+        # part du retard qui reste à rattraper après ce datagramme
+        self.retard = max(0, min(self.retard, maintenant - self.tat))
 
     def temps_total(self):
         "donne le temps total de mesure."
-        return (time.time() - self.temps_debut)
+        return (time.monotonic() - self.temps_debut)
 
     def debit_moyen(self):
         "donne le débit moyen mesuré, en octets/s."
@@ -653,20 +1508,460 @@ class LimiteurDebit:
         debit_moyen = self.octets_envoyes / temps_total
         return debit_moyen
 
+    def attente(self):
+        "donne le temps à attendre avant de pouvoir émettre, en ns."
+        return self.tat - self.tolerance - time.monotonic_ns()
+
     def limiter_debit(self):
         "pour faire une pause afin de respecter le débit maximum."
-        # on fait des petites pauses (10 ms) tant que le débit est trop élevé:
-        while self.debit_moyen() > self.debit_max:
-            time.sleep(0.01)
-        # méthode alternative qui ne fonctionne pas très bien
-        # (donne souvent des temps de pause négatifs !)
-#       temps_total = self.temps_total()
-#       debit_moyen = self.debit_moyen()
-#       # si on dépasse le débit max, on calcule la pause:
-#       if debit_moyen > self.debit_max:
-#           pause = self.octets_envoyes/self.debit_max - temps_total
-#           if pause>0:
-#               time.sleep(pause)
+        echeance = self.tat - self.tolerance
+        reste = echeance - time.monotonic_ns()
+        if reste <= 0:
+            return
+        while reste > 0:
+            # on dort jusqu'à un peu avant l'échéance, puis attente active
+            # pour ne pas dépendre de la précision de time.sleep
+            if reste > MARGE_ATTENTE:
+                time.sleep((reste - MARGE_ATTENTE) / 1e9)
+            reste = echeance - time.monotonic_ns()
+        self.retard = min(-reste, RATTRAPAGE)
+
+    async def limiter_debit_async(self):
+        """comme limiter_debit, pour une coroutine: la pause laisse tourner la
+        boucle asyncio. Le retard au réveil est rattrapé de la même façon."""
+        echeance = self.tat - self.tolerance
+        reste = echeance - time.monotonic_ns()
+        if reste <= 0:
+            return
+        await asyncio.sleep(reste / 1e9)
+        self.retard = min(max(0, time.monotonic_ns() - echeance), RATTRAPAGE)
+
+
+class PartageDebit:
+    """pour partager un même débit entre plusieurs émetteurs (threads), au
+    prorata de leur poids.
+
+    Chaque émetteur utilise sa part (PartDebit) comme un LimiteurDebit. Les
+    émetteurs en attente d'émission passent un par un dans l'ordre de leur
+    temps virtuel (octets émis divisés par leur poids: file équitable
+    pondérée), puis attendent le seau à jetons commun. Un émetteur inactif
+    laisse sa part aux autres, et reprend au temps virtuel courant sans avoir
+    accumulé de crédit.
+    """
+
+    def __init__(self, debit, rafale=None, mtu=None):
+        """contructeur de classe PartageDebit: mêmes paramètres que
+        LimiteurDebit, pour le débit total."""
+        self.limiteur = LimiteurDebit(debit, rafale, mtu)
+        self.condition = threading.Condition()
+        self.en_attente = set()     # parts en attente d'émission
+        self.occupe = None          # part autorisée à émettre, jusqu'à ajouter_donnees
+        self.temps_virtuel = 0.0
+        self.nb_parts = 0
+
+    def part(self, poids=1):
+        "crée la part d'un émetteur de poids donné."
+        self.nb_parts += 1
+        return PartDebit(self, poids, self.nb_parts)
+
+    def tete(self):
+        "part en attente de plus petit temps virtuel."
+        return min(self.en_attente, key=lambda part: (part.virtuel, part.rang))
+
+
+class PartDebit:
+    """part d'un PartageDebit, utilisable par un émetteur comme un LimiteurDebit."""
+
+    def __init__(self, partage, poids, rang):
+        self.partage = partage
+        self.poids = poids
+        self.rang = rang
+        self.virtuel = 0.0
+        self.temps_debut = time.monotonic()
+        self.octets_envoyes = 0
+
+    def depart_chrono(self):
+        "pour (re)démarrer la mesure du débit de cette part."
+        self.temps_debut = time.monotonic()
+        self.octets_envoyes = 0
+
+    def surcout(self, taille):
+        return self.partage.limiteur.surcout(taille)
+
+    def taille_lot(self, taille_datagramme, maximum):
+        return self.partage.limiteur.taille_lot(taille_datagramme, maximum)
+
+    def temps_total(self):
+        return (time.monotonic() - self.temps_debut)
+
+    def debit_moyen(self):
+        "donne le débit moyen de cette part, en octets/s."
+        temps_total = self.temps_total()
+        if temps_total == 0: return 0
+        return self.octets_envoyes / temps_total
+
+    def attente(self):
+        return self.partage.limiteur.attente()
+
+    def limiter_debit(self):
+        "pour attendre le tour de cette part, puis le seau à jetons commun."
+        partage = self.partage
+        with partage.condition:
+            if partage.occupe is self:
+                partage.occupe = None
+            self.virtuel = max(self.virtuel, partage.temps_virtuel)
+            partage.en_attente.add(self)
+            try:
+                while True:
+                    if partage.occupe is None and partage.tete() is self:
+                        if partage.limiteur.attente() <= 0:
+                            break
+                        partage.condition.release()
+                        try:
+                            partage.limiteur.limiter_debit()
+                        finally:
+                            partage.condition.acquire()
+                    else:
+                        partage.condition.wait()
+                partage.occupe = self
+                partage.temps_virtuel = max(partage.temps_virtuel, self.virtuel)
+            finally:
+                partage.en_attente.discard(self)
+
+    async def limiter_debit_async(self):
+        """comme limiter_debit, pour une coroutine: l'attente du tour de cette
+        part se fait dans un thread, sans bloquer la boucle asyncio."""
+        await asyncio.get_running_loop().run_in_executor(None, self.limiter_debit)
+
+    def ajouter_donnees(self, octets, nb_datagrammes=1):
+        "pour ajouter les octets émis par cette part, et rendre la main."
+        partage = self.partage
+        with partage.condition:
+            self.octets_envoyes += octets
+            cout = octets
+            if nb_datagrammes:
+                cout += nb_datagrammes * self.surcout(octets // nb_datagrammes)
+            partage.limiteur.ajouter_donnees(octets, nb_datagrammes)
+            self.virtuel += cout / self.poids
+            if partage.occupe is self:
+                partage.occupe = None
+            partage.condition.notify_all()
+
+    def fermer(self):
+        "pour retirer cette part du partage (émetteur terminé)."
+        partage = self.partage
+        with partage.condition:
+            partage.en_attente.discard(self)
+            if partage.occupe is self:
+                partage.occupe = None
+            partage.condition.notify_all()
+
+
+#------------------------------------------------------------------------------
+# Transport
+#-------------------
+
+class Transport:
+    """Socket UDP d'émission de la session, partagée par les données, les
+    effacements et le heartbeat: une seule socket pour toute la session,
+    avec ses options réglées en un seul endroit et des compteurs d'envoi.
+    L'émission est protégée par un verrou (thread du heartbeat).
+
+    Les datagrammes peuvent être répartis sur plusieurs liens (couples
+    adresse, port), en tourniquet pondéré, pour dépasser le débit d'un seul
+    lien ou d'un seul coeur de réception."""
+
+    def __init__(self, destination, taille_lot=None, tampon_emission=None,
+                 dscp=None, port_source=None, poids=None):
+        """Constructeur d'objet Transport.
+
+        destination     : tuple (adresse IP, port) déjà résolu, ou liste de
+                          tels tuples pour répartir l'émission sur plusieurs liens.
+        taille_lot      : nombre maximum de datagrammes par appel système.
+        tampon_emission : taille du tampon d'émission de la socket (SO_SNDBUF), en octets.
+        dscp            : classe DSCP des datagrammes émis (champ TOS).
+        port_source     : port UDP source, sinon choisi par le système.
+        poids           : poids de chaque lien dans la répartition (1 par défaut)."""
+        if isinstance(destination[0], str):
+            destination = [destination]
+        self.destinations = [tuple(d) for d in destination]
+        self.destination = self.destinations[0]
+        self.poids = list(poids) if poids else [1] * len(self.destinations)
+        if len(self.poids) != len(self.destinations) or min(self.poids) < 1:
+            raise ValueError("poids des liens invalides: %r" % (poids,))
+        self.sequence = tourniquet_pondere(self.poids)
+        self.position = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if tampon_emission:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, tampon_emission)
+        if dscp is not None:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, dscp << 2)
+        if port_source:
+            self.sock.bind(('', port_source))
+        # au plus 4 tampons par datagramme: entête, nom, sous-entête, données
+        self.emission = EmissionLot(self.sock, taille_lot or TAILLE_LOT, 4)
+        self.verrou = threading.Lock()
+        self.nb_datagrammes = 0     # nombre de datagrammes émis
+        self.nb_octets = 0          # nombre d'octets émis (données UDP)
+        self.nb_erreurs = 0         # nombre de lots en erreur
+        self.nb_par_lien = [0] * len(self.destinations)  # datagrammes émis par lien
+
+    def repartir(self, datagrammes):
+        """Répartit un lot de datagrammes entre les liens, dans l'ordre du
+        tourniquet pondéré. Renvoie la liste des lots, un par lien."""
+        lots = [[] for d in self.destinations]
+        sequence, position = self.sequence, self.position
+        for datagramme in datagrammes:
+            lots[sequence[position]].append(datagramme)
+            position += 1
+            if position == len(sequence):
+                position = 0
+        self.position = position
+        return lots
+
+    def envoyer(self, datagrammes):
+        """Pour émettre un lot de datagrammes (séquences de tampons).
+        Renvoie le nombre d'octets émis."""
+        with self.verrou:
+            try:
+                if len(self.destinations) == 1:
+                    octets = self.emission.envoyer(datagrammes, self.destination)
+                    self.nb_par_lien[0] += len(datagrammes)
+                else:
+                    octets = 0
+                    for i, lot in enumerate(self.repartir(datagrammes)):
+                        if lot:
+                            octets += self.emission.envoyer(lot, self.destinations[i])
+                            self.nb_par_lien[i] += len(lot)
+            except OSError:
+                self.nb_erreurs += 1
+                raise
+            self.nb_datagrammes += len(datagrammes)
+            self.nb_octets += octets
+        return octets
+
+    def print_stats(self):
+        """affiche les compteurs d'envoi"""
+        msg = 'Transport: {} datagrammes, {} octets, {} appels systeme, {} erreurs'.format(
+            self.nb_datagrammes, self.nb_octets, self.emission.nb_appels, self.nb_erreurs)
+        if len(self.destinations) > 1:
+            msg += ', par lien: ' + ', '.join('{}:{}={}'.format(d[0], d[1], n)
+                for d, n in zip(self.destinations, self.nb_par_lien))
+        print(msg)
+        logging.info(msg)
+
+    def fermer(self):
+        with self.verrou:
+            self.sock.close()
+
+def tourniquet_pondere(poids):
+    """Séquence des indices de liens d'un cycle de tourniquet pondéré lissé:
+    chaque lien i y figure poids[i] fois, les passages d'un même lien étant
+    répartis au mieux dans le cycle (ex: poids 3,1 -> 0,0,1,0)."""
+    courant = [0] * len(poids)
+    total = sum(poids)
+    sequence = []
+    for n in range(total):
+        for i, p in enumerate(poids):
+            courant[i] += p
+        choix = courant.index(max(courant))
+        courant[choix] -= total
+        sequence.append(choix)
+    return sequence
+
+def transport_session():
+    """Renvoie le Transport de la session, créé au premier appel avec les
+    paramètres par défaut s'il n'a pas été créé au démarrage."""
+    global transport
+    if transport is None:
+        transport = Transport(resoudre_liens(), poids=[lien[2] for lien in liens_session()])
+    return transport
+
+
+#------------------------------------------------------------------------------
+# MoteurAsync
+#-------------------
+
+def _lot_suivant(lots):
+    """Lot suivant d'un générateur de lots: (False, lot), ou (True, valeur de
+    retour du générateur) quand il est épuisé."""
+    try:
+        return False, next(lots)
+    except StopIteration as fin:
+        return True, fin.value
+
+class MoteurAsync:
+    """Moteur d'émission asyncio (--async): une boucle d'événements, dans son
+    propre thread, porte toute l'émission de la session sur la socket du
+    Transport, rendue non bloquante, par un seul chemin d'émission:
+
+    - les flux de données des fichiers (coroutine emettre_lots): leurs lots
+      sont construits (lecture du disque, CRC32, FEC) dans un pool de
+      threads, puis émis au rythme de leur limiteur de débit sans bloquer la
+      boucle. Plusieurs fichiers peuvent être émis en parallèle (envoyer_async);
+    - le heartbeat (coroutine heartbeat), émis à l'heure même pendant les
+      pauses de régulation du débit;
+    - les messages de suppression (coroutine suppressions), mis en file par
+      SendDeleteFileMessage sans attendre leur émission.
+
+    Les lots sont émis par l'EmissionLot du Transport (sendmmsg, sans
+    concaténation des tampons); quand le tampon d'émission de la socket est
+    plein, la suite du lot attend qu'elle redevienne disponible en écriture.
+
+    Les fonctions d'émission synchrones (envoyer, envoyer_clone...) lui
+    soumettent leurs lots depuis leur propre thread (cf. emettre_lots).
+    """
+
+    def __init__(self, transport, nb_lecteurs=None):
+        """Constructeur d'objet MoteurAsync.
+
+        transport   : Transport de la session, dont la socket, les liens et
+                      les compteurs sont repris par le moteur.
+        nb_lecteurs : nombre de threads de construction des lots."""
+        self.transport = transport
+        self.executeur = concurrent.futures.ThreadPoolExecutor(
+            nb_lecteurs or NB_LECTEURS_ASYNC, thread_name_prefix='BFTP_lecture')
+        self.boucle = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.boucle.run_forever, name='BFTP_async', daemon=True)
+        self.attente_ecriture = None    # futur partagé par les émissions en attente de la socket
+        self.file_suppressions = None
+        self.taches = []
+
+    def demarrer(self, heartbeat=None):
+        """démarre la boucle d'événements, et l'émission du heartbeat si un
+        objet HeartBeat est fourni."""
+        self.thread.start()
+        self.executer(self._ouvrir())
+        if heartbeat is not None:
+            self.boucle.call_soon_threadsafe(self._lancer, self.heartbeat(heartbeat))
+
+    async def _ouvrir(self):
+        self.transport.sock.setblocking(False)
+        self.file_suppressions = asyncio.Queue()
+        self._lancer(self.suppressions())
+
+    def _lancer(self, coroutine):
+        self.taches.append(self.boucle.create_task(coroutine))
+
+    def executer(self, coroutine):
+        """exécute une coroutine dans la boucle et attend son résultat (depuis
+        un autre thread que celui de la boucle)."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.boucle).result()
+
+    def _ecriture_possible(self):
+        self.boucle.remove_writer(self.transport.sock.fileno())
+        self.attente_ecriture.set_result(None)
+        self.attente_ecriture = None
+
+    async def attendre_ecriture(self):
+        """attend que la socket soit de nouveau disponible en écriture. Toutes
+        les émissions en attente partagent la même surveillance de la socket."""
+        if self.attente_ecriture is None:
+            self.attente_ecriture = self.boucle.create_future()
+            self.boucle.add_writer(self.transport.sock.fileno(), self._ecriture_possible)
+        await asyncio.shield(self.attente_ecriture)
+
+    async def envoyer(self, datagrammes):
+        """Chemin d'émission unique: émet un lot de datagrammes (séquences de
+        tampons), réparti entre les liens comme par Transport.envoyer.
+        Renvoie le nombre d'octets émis."""
+        transport = self.transport
+        with transport.verrou:
+            if len(transport.destinations) == 1:
+                lots = [datagrammes]
+            else:
+                lots = transport.repartir(datagrammes)
+        octets = 0
+        for i, lot in enumerate(lots):
+            while lot:
+                with transport.verrou:
+                    try:
+                        nb, octets_lot = transport.emission.envoyer_partiel(lot, transport.destinations[i])
+                    except OSError as e:
+                        # comme une émission UDP perdue: le reste du lot est abandonné
+                        transport.nb_erreurs += 1
+                        logging.warning(f"Erreur d'emission: {e}")
+                        break
+                    transport.nb_par_lien[i] += nb
+                    transport.nb_datagrammes += nb
+                    transport.nb_octets += octets_lot
+                octets += octets_lot
+                lot = lot[nb:]
+                if lot:
+                    await self.attendre_ecriture()
+        return octets
+
+    async def emettre_lots(self, lots, limiteur_debit):
+        """Coroutine d'émission d'un flux de données: équivalent de emettre_lots,
+        les lots étant construits dans le pool de threads."""
+        boucle = asyncio.get_running_loop()
+        while True:
+            fini, lot = await boucle.run_in_executor(self.executeur, _lot_suivant, lots)
+            if fini:
+                return lot
+            await limiteur_debit.limiter_debit_async()
+            limiteur_debit.ajouter_donnees(await self.envoyer(lot), len(lot))
+
+    async def heartbeat(self, hb):
+        "coroutine d'émission du heartbeat toutes les hb.hb_delay secondes."
+        hb.newsession()
+        while True:
+            await self.envoyer([hb.paquet_heartbeat()])
+            hb.incsession()
+            await asyncio.sleep(hb.hb_delay)
+
+    async def suppressions(self):
+        "coroutine d'émission des messages de suppression mis en file."
+        while True:
+            datagrammes = await self.file_suppressions.get()
+            try:
+                await self.envoyer(datagrammes)
+            finally:
+                self.file_suppressions.task_done()
+
+    def supprimer(self, datagrammes):
+        "met en file des messages de suppression (depuis n'importe quel thread)."
+        self.boucle.call_soon_threadsafe(self.file_suppressions.put_nowait, datagrammes)
+
+    async def _arreter(self):
+        # les suppressions en file sont émises avant l'arrêt
+        await self.file_suppressions.join()
+        for tache in self.taches:
+            tache.cancel()
+        await asyncio.gather(*self.taches, return_exceptions=True)
+        if self.attente_ecriture is not None:
+            self.boucle.remove_writer(self.transport.sock.fileno())
+            self.attente_ecriture.cancel()
+            self.attente_ecriture = None
+        # la socket du Transport peut de nouveau servir à l'émission synchrone
+        self.transport.sock.setblocking(True)
+
+    def fermer(self):
+        "arrête le moteur, après émission des suppressions en file."
+        if self.thread.is_alive():
+            self.executer(self._arreter())
+            self.boucle.call_soon_threadsafe(self.boucle.stop)
+            self.thread.join()
+        self.boucle.close()
+        self.executeur.shutdown(wait=True)
+
+async def envoyer_async(fichier_source, fichier_dest, limiteur_debit, num_session=None,
+    num_paquet_session=None, crc=None, source=None, tour=0, compression=None, patch=None):
+    """Coroutine équivalente à envoyer(), pour le moteur asyncio: plusieurs
+    fichiers peuvent être émis en parallèle dans la même boucle, sur le même
+    chemin d'émission. La préparation (CRC32...) se fait dans le pool de
+    threads du moteur."""
+    boucle = asyncio.get_running_loop()
+    lots = await boucle.run_in_executor(moteur_async.executeur, lambda: lots_fichier(
+        fichier_source, fichier_dest, limiteur_debit, num_session, num_paquet_session,
+        crc, source, tour, compression, patch))
+    try:
+        return await moteur_async.emettre_lots(lots, limiteur_debit)
+    except IOError:
+        msg = f"Ouverture du fichier {fichier_source}..."
+        print("Erreur : " + msg)
+        logging.error(msg)
+        return -1
 
 
 #------------------------------------------------------------------------------
@@ -680,120 +1975,534 @@ def recevoir(repertoire):
     CHEMIN_DEST = path(repertoire)
     logging.info(f"Démarrage de la réception dans le répertoire : {CHEMIN_DEST}")
     print(f'Les fichiers seront recus dans le repertoire "{str_lat1(CHEMIN_DEST.abspath(),errors="replace")}".')
-    print(f'En ecoute sur le port UDP {PORT}...')
+    liens = liens_session()
+    for hote, port, poids in liens:
+        print(f'En ecoute sur le port UDP {port} ({hote})...')
     print('(taper Ctrl+Pause pour quitter)')
-    p = Paquet()
-    print(f"Type de p: {type(p)}")
-    print(f"Méthodes de p: {dir(p)}")
-    try:
-        p.test_method()
-    except AttributeError:
-        print("La méthode test_method n'existe pas.")
+    if REPERTOIRE_ETAT is not None:
+        os.makedirs(REPERTOIRE_ETAT, exist_ok=True)
+        charger_points_reprise()
+        # arrêt du service (mise à jour...) comme par Ctrl+C: les réceptions
+        # en cours sont sauvegardées (cf. fermer_receptions)
+        signal.signal(signal.SIGTERM, arret_reception)
+    if NB_PROCESSUS_RECEPTION > 1:
+        recevoir_processus(liens, NB_PROCESSUS_RECEPTION)
+    else:
+        # une socket par lien, toutes alimentant la même table de fichiers
+        boucle_reception([ouvrir_socket_reception(hote, port) for hote, port, poids in liens])
+
+def arret_reception(signum, frame):
+    "SIGTERM: arrêt de la réception, comme par Ctrl+C."
+    raise KeyboardInterrupt
+
+def fermer_receptions():
+    """A l'arrêt de la réception: les réceptions en cours sont sauvegardées
+    pour être reprises au redémarrage avec --etat (cf. Fichier.sauvegarder),
+    abandonnées sinon (fichiers partiels supprimés)."""
+    for f in list(fichiers.values()):
+        if f.fichier_etat is None:
+            f.annuler_reception()
+            continue
+        try:
+            f.sauvegarder()
+        except OSError as e:
+            logging.error(f"Sauvegarde de la reception de {f.nom_fichier} impossible: {e}")
+        f.fichier_temp.close()
+    if fichiers:
+        msg = f'{len(fichiers)} reception(s) en cours ' + \
+              ('sauvegardee(s)' if REPERTOIRE_ETAT is not None else 'abandonnee(s)')
+        print(msg)
+        logging.info(msg)
+    fichiers.clear()
+
+def ouvrir_socket_reception(hote, port, partage=False):
+    """socket de réception non bloquante liée à (hote, port); partage: le
+    port est partagé avec d'autres sockets (SO_REUSEPORT)."""
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    s.bind((HOST, PORT))
-    while True:
+    if partage:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if TAMPON_RECEPTION:
         try:
-            paquet, emetteur = s.recvfrom(TAILLE_PAQUET)
-            logging.info(f"Paquet reçu de {emetteur}")
-            if not paquet: 
-                continue
-            if len(paquet) < struct.calcsize(FORMAT_ENTETE):
-                msg = f"Paquet trop petit reçu de {emetteur}: {len(paquet)} octets"
-                print(msg)
-                logging.warning(msg)
-                continue
+            # au-delà de net.core.rmem_max (privilège CAP_NET_ADMIN)
+            s.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, TAMPON_RECEPTION)
+        except OSError:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, TAMPON_RECEPTION)
+        # le noyau double la valeur demandée (place de ses structures)
+        taille = s.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // 2
+        if taille < TAMPON_RECEPTION:
+            msg = (f'Tampon de reception limite a {taille // 1024} Ko '
+                   f'(sysctl net.core.rmem_max)')
+            print(msg)
+            logging.warning(msg)
+    s.bind((hote, port))
+    s.setblocking(False)
+    return s
+
+def decoder_paquet(p, paquet):
+    """décode et traite un paquet reçu avec l'objet Paquet p (fichier,
+    heartbeat, effacement...); les erreurs sont affichées et journalisées
+    sans interrompre la réception."""
+    try:
+        p.decoder(paquet)
+    except struct.error as e:
+        msg = f"Erreur lors du décodage d'un paquet: {e}"
+        print(msg)
+        logging.error(msg)
+    except ValueError as e:
+        msg = f"Erreur de valeur lors du décodage d'un paquet: {e}"
+        print(msg)
+        logging.error(msg)
+    except AttributeError as e:
+        msg = f"Erreur d'attribut lors du décodage d'un paquet: {e}"
+        print(msg)
+        logging.error(msg)
+    except Exception as e:
+        msg = f"Erreur inattendue lors du décodage d'un paquet: {e}"
+        print(msg)
+        traceback.print_exc()
+        logging.error(msg)
+
+class PoolEcriture:
+    """Threads d'écriture des fichiers reçus: la boucle de réception (thread
+    de capture) leur dépose les datagrammes, qu'ils décodent et écrivent,
+    recopie à destination des fichiers complets comprise. Tous les paquets
+    d'un fichier vont au même thread, dans leur ordre de réception (cf.
+    repartir): seul ce thread crée, reprend ou abandonne sa réception.
+
+    Au-delà de max_octets en attente, la capture attend qu'un thread se
+    libère: les datagrammes suivants s'accumulent dans le tampon de la
+    socket (--rcvbuf), puis sont perdus par le noyau (cf. bilan_reception)."""
+
+    def __init__(self, nb_ecrivains, max_octets=MAX_FILE_ECRITURE):
+        self.files = [collections.deque() for i in range(nb_ecrivains)]
+        self.verrou = threading.Lock()
+        self.non_vide = [threading.Condition(self.verrou) for i in range(nb_ecrivains)]
+        self.place = threading.Condition(self.verrou)
+        self.max_octets = max_octets
+        self.arret = False
+        self.octets = 0             # octets en attente d'écriture
+        self.nb_en_attente = 0      # datagrammes en attente d'écriture
+        self.max_octets_atteint = 0
+        self.max_en_attente = 0
+        self.nb_deposes = 0         # datagrammes déposés par la capture
+        self.nb_attentes = 0        # attentes de la capture, faute de place
+        self.duree_attente = 0.0
+        self.threads = [threading.Thread(target=self.ecrire, args=(i,),
+                                         name=f'BFTP_ecriture_{i}', daemon=True)
+                        for i in range(nb_ecrivains)]
+        for thread in self.threads:
+            thread.start()
+
+    def indice(self, nom_fichier):
+        "indice du thread d'écriture des paquets d'un fichier, d'après son nom encodé."
+        return hash(nom_fichier) % len(self.files)
+
+    def repartir(self, p, datagramme):
+        """Répartit un datagramme (bytes) d'entête décodée par p (cf.
+        Paquet.decoder_entete) entre les threads d'écriture: renvoie la liste
+        des (indice, datagramme) à déposer. Tous les paquets d'un fichier vont
+        au thread de son nom, quel que soit leur type:
+
+        - paquet portant un identifiant: le nom est retrouvé dans
+          table_identifiants; d'identifiant encore inconnu, le paquet y est
+          mis en attente par la capture elle-même;
+        - paquet d'annonce: enregistré par la capture, qui dépose les paquets
+          qui attendaient l'identifiant au thread du nom annoncé;
+        - paquet multi-fichiers: découpé en un paquet par thread, regroupant
+          les petits fichiers dont il a la charge (cf. decouper_multifichier);
+        - autres paquets (données, fin, effacement, clonage): nom en champ nom.
+
+        Les erreurs de décodage lèvent ValueError."""
+        if p.type_paquet == PAQUET_ANNONCE:
+            identifiant, nom_fichier = p.decoder_annonce(datagramme)
+            indice = self.indice(nom_fichier.encode('utf-8'))
+            return [(indice, paquet) for paquet in table_identifiants.annoncer(identifiant, nom_fichier)]
+        if p.type_paquet == PAQUET_MULTIFICHIER:
+            return self.decouper_multifichier(p, datagramme)
+        if p.drapeaux & DRAPEAU_IDENTIFIANT:
+            if p.longueur_nom != IDENTIFIANT.size:
+                raise ValueError('identifiant de fichier incorrect')
+            identifiant, = IDENTIFIANT.unpack_from(datagramme, TAILLE_ENTETE)
+            nom_fichier = table_identifiants.nom(identifiant)
+            if nom_fichier is None:
+                table_identifiants.mettre_en_attente(identifiant, datagramme)
+                return []
+            return [(self.indice(nom_fichier.encode('utf-8')), datagramme)]
+        return [(self.indice(datagramme[TAILLE_ENTETE : TAILLE_ENTETE + p.longueur_nom]), datagramme)]
+
+    def decouper_multifichier(self, p, datagramme):
+        """Découpe un paquet multi-fichiers en un paquet par thread
+        d'écriture, de mêmes entête et entrées, chaque petit fichier allant au
+        thread de son nom. Un paquet incorrect est déposé tel quel, son
+        décodage signalera l'erreur."""
+        entrees = collections.defaultdict(list)
+        position = TAILLE_ENTETE
+        for n in range(p.num_paquet):
+            if position + ENTREE_MULTIFICHIER.size > len(datagramme):
+                return [(0, datagramme)]
+            longueur_nom, date_fichier, taille_fichier, crc32 = \
+                ENTREE_MULTIFICHIER.unpack_from(datagramme, position)
+            debut_nom = position + ENTREE_MULTIFICHIER.size
+            fin = debut_nom + longueur_nom + taille_fichier
+            if fin > len(datagramme):
+                return [(0, datagramme)]
+            entrees[self.indice(datagramme[debut_nom : debut_nom + longueur_nom])].append(datagramme[position:fin])
+            position = fin
+        if position != len(datagramme) or len(entrees) < 2:
+            return [(next(iter(entrees), 0), datagramme)]
+        # entête reconstruite comme à l'émission (cf. envoyer_petits_fichiers):
+        # la taille est celle des entrées retenues, date et CRC32 de l'entête
+        # sont nuls, chaque entrée portant ceux de son fichier
+        decoupage = []
+        for indice, elements in entrees.items():
+            donnees = b"".join(elements)
+            entete = ENTETE.pack(PAQUET_MULTIFICHIER | p.drapeaux, 0, len(donnees), p.offset,
+                                 p.num_session, p.num_paquet_session, len(elements), p.nb_paquets,
+                                 len(donnees), 0, 0)
+            decoupage.append((indice, entete + donnees))
+        return decoupage
+
+    def annuler(self, nom_fichier):
+        """fait abandonner la réception en cours d'un fichier par son thread
+        d'écriture, seul à en modifier le Fichier, après les datagrammes déjà
+        déposés."""
+        self.deposer([(self.indice(nom_fichier.encode('utf-8')), ('annuler', nom_fichier))])
+
+    def deposer(self, datagrammes):
+        """dépose un lot de datagrammes, liste de (indice, bytes), dans les
+        files des threads de leurs fichiers (ou des demandes d'abandon, cf.
+        annuler); attend, si la place manque,
+        qu'elle se libère."""
+        taille = sum(len(datagramme) for i, datagramme in datagrammes)
+        with self.verrou:
+            if self.octets and self.octets + taille > self.max_octets:
+                debut = time.monotonic()
+                self.nb_attentes += 1
+                while self.octets and self.octets + taille > self.max_octets:
+                    self.place.wait()
+                self.duree_attente += time.monotonic() - debut
+            for i, datagramme in datagrammes:
+                self.files[i].append(datagramme)
+                self.non_vide[i].notify()
+            self.octets += taille
+            self.nb_en_attente += len(datagrammes)
+            self.nb_deposes += len(datagrammes)
+            self.max_octets_atteint = max(self.max_octets_atteint, self.octets)
+            self.max_en_attente = max(self.max_en_attente, self.nb_en_attente)
+
+    def ecrire(self, i):
+        "boucle du thread d'écriture i: traite les datagrammes de sa file."
+        p = Paquet()
+        # paquets déjà comptés par la capture, qui les voit tous dans l'ordre
+        p.compter = False
+        file = self.files[i]
+        while True:
+            with self.verrou:
+                while not file:
+                    if self.arret:
+                        return
+                    self.non_vide[i].wait()
+                lot = [file.popleft() for n in range(min(len(file), TAILLE_LOT_RECEPTION))]
+                self.octets -= sum(map(len, lot))
+                self.nb_en_attente -= len(lot)
+                self.place.notify()
+            for datagramme in lot:
+                if isinstance(datagramme, tuple):
+                    # demande d'abandon (cf. annuler)
+                    evenement, nom_fichier = datagramme
+                    if nom_fichier in fichiers:
+                        fichiers.pop(nom_fichier).annuler_reception()
+                    continue
+                decoder_paquet(p, memoryview(datagramme))
+
+    def fermer(self):
+        """arrête les threads d'écriture et attend qu'ils aient traité les
+        datagrammes déjà déposés: après, plus aucun n'utilise les réceptions
+        en cours (cf. fermer_receptions)."""
+        with self.verrou:
+            self.arret = True
+            for condition in self.non_vide:
+                condition.notify()
+        for thread in self.threads:
+            thread.join()
+
+    def bilan(self):
+        "état de la file d'écriture, pour bilan_reception."
+        return (f"file d'ecriture: {self.nb_en_attente} datagramme(s), {self.octets // 1024} Ko"
+                f" (max {self.max_en_attente}, {self.max_octets_atteint // 1024} Ko)"
+                f", capture en attente {self.nb_attentes} fois ({self.duree_attente:.1f} s)")
+
+def bilan_reception(sockets, ecriture=None):
+    """bilan de la réception: pour chaque socket, octets en attente dans son
+    tampon et datagrammes perdus par le noyau faute de place (cf.
+    etat_noyau); état de la file d'écriture éventuelle."""
+    elements = []
+    for s in sockets:
+        etat = etat_noyau(s)
+        if etat is not None:
+            elements.append(f'port {s.getsockname()[1]}: tampon {etat[0] // 1024} Ko'
+                            f', {etat[1]} datagramme(s) perdu(s) par le noyau')
+    if ecriture is not None:
+        elements.append(ecriture.bilan())
+    return ', '.join(elements)
+
+def boucle_reception(sockets, connexion=None):
+    """Boucle de réception et de décodage des paquets reçus sur les sockets,
+    chacune recevant ses datagrammes par lots, dans ses propres tampons.
+    connexion: dans un processus de réception, lien avec le processus
+    principal (cf. recevoir_processus).
+
+    Avec NB_ECRIVAINS threads d'écriture (cf. PoolEcriture), la boucle ne
+    fait que capturer: elle traite les heartbeats et les annonces
+    d'identifiants et compte les paquets (stats), puis dépose les autres
+    datagrammes, copiés hors des tampons, au thread de leur fichier."""
+    p = Paquet()
+    ecriture = PoolEcriture(NB_ECRIVAINS) if NB_ECRIVAINS > 0 else None
+    selecteur = selectors.DefaultSelector()
+    for s in sockets:
+        selecteur.register(s, selectors.EVENT_READ,
+            ReceptionLot(s, TAILLE_LOT_RECEPTION, TAILLE_TAMPON_RECEPTION))
+    delai = DELAI_BILAN
+    if connexion is not None:
+        selecteur.register(connexion, selectors.EVENT_READ, None)
+        delai = DELAI_RELAIS
+    prochain_bilan = time.monotonic() + DELAI_BILAN
+    prets = []
+    try:
+        while True:
             try:
-                p.decoder(paquet)
-                logging.info(f"Type de paquet reçu : {p.type_paquet}")
-                if p.type_paquet == PAQUET_FICHIER:
-                    print(f"Fichier reçu : {p.nom_fichier}")
-                    logging.info(f"Traitement du paquet fichier : {p.nom_fichier}")
-                    if p.nom_fichier in fichiers:
-                        f = fichiers[p.nom_fichier]
-                    else:
-                        f = Fichier(p)
-                        fichiers[p.nom_fichier] = f
-                    f.traiter_paquet(p)
-                elif p.type_paquet == PAQUET_HEARTBEAT:
-                    print("Paquet heartbeat reçu")
-                    logging.info("Paquet heartbeat reçu")
-                    HeartBeat.check_heartbeat(HB_recus, p.num_session, p.num_paquet_session, p.num_paquet)
-                elif p.type_paquet == PAQUET_DELETEFile:
-                    print("Paquet de suppression reçu")
-                    logging.info(f"Paquet de suppression reçu pour : {p.nom_fichier}")
-                    # Traitement du paquet de suppression
-                    fichier_dest = CHEMIN_DEST / p.nom_fichier
-                    if fichier_dest.exists():
-                        try:
-                            if fichier_dest.is_file():
-                                os.remove(fichier_dest)
-                            elif fichier_dest.is_dir():
-                                os.rmdir(fichier_dest)
-                            logging.info(f"Fichier/dossier supprimé : {p.nom_fichier}")
-                        except OSError as e:
-                            logging.error(f"Erreur lors de la suppression de {p.nom_fichier}: {e}")
-                    else:
-                        logging.warning(f"Fichier/dossier à supprimer non trouvé : {p.nom_fichier}")
-                else:
-                    print(f"Type de paquet inconnu : {p.type_paquet}")
-                    logging.warning(f"Type de paquet inconnu reçu : {p.type_paquet}")
-            except struct.error as e:
-                msg = f"Erreur lors du décodage d'un paquet: {e}"
-                print(msg)
-                logging.error(msg)
-                continue
-            except ValueError as e:
-                msg = f"Erreur de valeur lors du décodage d'un paquet: {e}"
-                print(msg)
-                logging.error(msg)
-                continue
-            except AttributeError as e:
-                msg = f"Erreur d'attribut lors du décodage d'un paquet: {e}"
+                if time.monotonic() >= prochain_bilan:
+                    prochain_bilan = time.monotonic() + DELAI_BILAN
+                    logging.info(f'Reception: {bilan_reception(sockets, ecriture)}')
+                if not prets:
+                    prets = [cle.data for cle, evenements in selecteur.select(delai)]
+                    if relais_reception is not None:
+                        relais_reception.transmettre()
+                    if not prets:
+                        continue
+                reception = prets[-1]
+                if reception is None:
+                    # message du processus principal
+                    prets.pop()
+                    try:
+                        evenement, nom_fichier = connexion.recv()
+                    except EOFError:
+                        # le processus principal s'est arrêté
+                        return
+                    if evenement == 'annuler':
+                        if ecriture is not None:
+                            # le Fichier appartient à un thread d'écriture
+                            ecriture.annuler(nom_fichier)
+                        elif nom_fichier in fichiers:
+                            fichiers.pop(nom_fichier).annuler_reception()
+                    continue
+                lot = reception.recevoir()
+                if len(lot) < reception.taille_lot:
+                    # plus rien à lire sur cette socket pour le moment
+                    # (le sélecteur la signalera de nouveau)
+                    prets.pop()
+                a_deposer = []
+                for i, paquet in enumerate(lot):
+                    if not paquet:
+                        continue
+                    if len(paquet) < TAILLE_ENTETE:
+                        msg = f"Paquet trop petit reçu de {reception.emetteur(i)}: {len(paquet)} octets"
+                        print(msg)
+                        logging.warning(msg)
+                        continue
+                    if ecriture is None:
+                        # le décodage traite aussi le paquet (fichier, heartbeat, effacement...)
+                        decoder_paquet(p, paquet)
+                        continue
+                    try:
+                        p.decoder_entete(paquet)
+                        if p.type_paquet == PAQUET_HEARTBEAT:
+                            decoder_paquet(p, paquet)
+                            continue
+                        if p.type_paquet in (PAQUET_FICHIER, PAQUET_REPARATION, PAQUET_MULTIFICHIER):
+                            stats.ajouter_paquet(p)
+                        # copie: le tampon de réception resservira au lot suivant
+                        a_deposer += ecriture.repartir(p, bytes(paquet))
+                    except (struct.error, ValueError) as e:
+                        msg = f"Erreur lors du décodage d'un paquet: {e}"
+                        print(msg)
+                        logging.error(msg)
+                if a_deposer:
+                    ecriture.deposer(a_deposer)
+            except socket.error as e:
+                msg = f"Erreur de socket: {e}"
                 print(msg)
                 logging.error(msg)
-                print(f"Type de p lors de l'erreur: {type(p)}")
-                print(f"Méthodes de p lors de l'erreur: {dir(p)}")
-                continue
             except Exception as e:
-                msg = f"Erreur inattendue lors du décodage d'un paquet: {e}"
+                msg = f"Erreur inattendue dans la boucle principale: {e}"
                 print(msg)
                 traceback.print_exc()
                 logging.error(msg)
-                continue
-        except socket.error as e:
-            msg = f"Erreur de socket: {e}"
-            print(msg)
-            logging.error(msg)
-        except Exception as e:
-            msg = f"Erreur inattendue dans la boucle principale: {e}"
-            print(msg)
-            traceback.print_exc()
-            logging.error(msg)
-            logging.debug(f"Traceback: {traceback.format_exc()}")
+                logging.debug(f"Traceback: {traceback.format_exc()}")
+    finally:
+        if ecriture is not None:
+            ecriture.fermer()
+        msg = f'Reception: {bilan_reception(sockets, ecriture)}'
+        print(msg)
+        logging.info(msg)
+        fermer_receptions()
 
-    s.close()
+#------------------------------------------------------------------------------
+# Réception répartie sur plusieurs processus
+#-------------------
+class RelaisReception:
+    """Dans un processus de réception: remplace stats et HB_recus, et
+    transmet au processus principal les comptes de paquets, les heartbeats
+    et les débuts et fins de réception de fichiers."""
+
+    def __init__(self, connexion):
+        self.connexion = connexion
+        # num_session -> [paquets reçus, plus grand num_paquet_session]
+        self.comptes = {}
+        self.dernier_envoi = time.monotonic()
+        # les threads d'écriture signalent aussi (cf. PoolEcriture)
+        self.verrou = threading.Lock()
+
+    def ajouter_paquet(self, paquet):
+        "compte le paquet (cf. Stats.ajouter_paquet), transmis par transmettre."
+        compte = self.comptes.get(paquet.num_session)
+        if compte is None:
+            compte = self.comptes[paquet.num_session] = [0, -1]
+        compte[0] += 1
+        compte[1] = max(compte[1], paquet.num_paquet_session)
+
+    def check_heartbeat(self, num_session, num_paquet, delay):
+        "le heartbeat est vérifié par le processus principal (cf. HeartBeat)."
+        with self.verrou:
+            self.connexion.send(('heartbeat', num_session, num_paquet, delay))
+
+    def signaler(self, evenement, nom_fichier):
+        "début ('reception') ou fin ('recu') de la réception d'un fichier."
+        with self.verrou:
+            self.connexion.send((evenement, nom_fichier))
+
+    def transmettre(self):
+        "envoie les comptes de paquets, au plus toutes les DELAI_RELAIS secondes."
+        if self.comptes and time.monotonic() - self.dernier_envoi >= DELAI_RELAIS:
+            with self.verrou:
+                self.connexion.send(('stats', self.comptes))
+            self.comptes = {}
+            self.dernier_envoi = time.monotonic()
+
+def processus_reception(sockets, connexion, a_fermer):
+    """Point d'entrée d'un processus de réception: reçoit sur ses sockets
+    les paquets des fichiers que le filtre d'aiguillage lui attribue.
+    a_fermer: sockets et connexions des autres processus."""
+    global stats, HB_recus, relais_reception
+    for objet in a_fermer:
+        objet.close()
+    stats = HB_recus = relais_reception = RelaisReception(connexion)
+    try:
+        # à l'arrêt, les réceptions en cours sont sauvegardées ou
+        # abandonnées (cf. fermer_receptions)
+        boucle_reception(sockets, connexion)
+    except KeyboardInterrupt:
+        pass
+
+def recevoir_processus(liens, nb_processus):
+    """Réception répartie sur nb_processus processus: sur chaque lien,
+    nb_processus sockets partagent le port (SO_REUSEPORT), et un filtre BPF
+    aiguille tous les paquets d'un même fichier vers le même processus (cf.
+    Aiguillage). Le processus principal vérifie les heartbeats, regroupe les
+    stats et fait abandonner aux autres processus la réception d'un fichier
+    dont une nouvelle version est reçue par l'un d'eux."""
+    aiguillage = Aiguillage(nb_processus, TAILLE_ENTETE, PAQUET_ANNONCE, DRAPEAU_IDENTIFIANT)
+    # sockets[i]: sockets du processus i, une par lien; l'ordre de création
+    # donne l'indice de chaque socket dans son groupe SO_REUSEPORT
+    sockets = [[] for i in range(nb_processus)]
+    for hote, port, poids in liens:
+        groupe = [ouvrir_socket_reception(hote, port, partage=True) for i in range(nb_processus)]
+        aiguillage.attacher(groupe[0])
+        for i, s in enumerate(groupe):
+            sockets[i].append(s)
+    print(f'Reception repartie sur {nb_processus} processus')
+    contexte = multiprocessing.get_context('fork')
+    processus, connexions = [], []
+    for i in range(nb_processus):
+        connexion, connexion_processus = contexte.Pipe()
+        autres = [s for j in range(nb_processus) if j != i for s in sockets[j]]
+        processus.append(contexte.Process(target=processus_reception, daemon=True,
+            args=(sockets[i], connexion_processus, autres + connexions + [connexion])))
+        processus[-1].start()
+        connexion_processus.close()
+        connexions.append(connexion)
+    for s in sum(sockets, []):
+        s.close()
+    nb_fichiers_recus = 0
+    prochain_bilan = time.monotonic() + DELAI_BILAN
+    try:
+        while True:
+            for connexion in multiprocessing.connection.wait(connexions, DELAI_RELAIS):
+                try:
+                    message = connexion.recv()
+                except EOFError:
+                    msg = "Arret inattendu d'un processus de reception"
+                    print(msg)
+                    logging.error(msg)
+                    return
+                evenement = message[0]
+                if evenement == 'stats':
+                    for num_session, (nb_paquets, dernier_paquet) in sorted(message[1].items()):
+                        stats.ajouter_compte(num_session, nb_paquets, dernier_paquet)
+                elif evenement == 'heartbeat':
+                    HB_recus.check_heartbeat(*message[1:])
+                elif evenement == 'reception':
+                    for autre in connexions:
+                        if autre is not connexion:
+                            autre.send(('annuler', message[1]))
+                elif evenement == 'recu':
+                    nb_fichiers_recus += 1
+            if time.monotonic() >= prochain_bilan:
+                prochain_bilan += DELAI_BILAN
+                logging.info(f'{nb_fichiers_recus} fichier(s) recu(s), taux de perte: {stats.taux_perte()}%'
+                             f', paquets perdus: {stats.nb_paquets_perdus}/{stats.num_paquet_attendu}')
+    finally:
+        # connexions fermées: chaque processus abandonne ses réceptions en cours
+        for connexion in connexions:
+            connexion.close()
+        for p in processus:
+            p.join(DELAI_ARRET_PROCESSUS)
+            if p.is_alive():
+                p.terminate()
+        print(f'{nb_fichiers_recus} fichier(s) recu(s)')
+        stats.print_stats()
 
 
 #------------------------------------------------------------------------------
 # CalcCRC
 #-------------------
-def CalcCRC(fichier):
-    """Calcul du CRC32 du fichier."""
+def CalcCRC(fichier, source=None, hachages=()):
+    """Calcul du CRC32 du fichier.
+
+    source: FichierMappe déjà ouvert sur le fichier (calcul sans affichage,
+    par exemple depuis un thread de préparation).
+    hachages: autres calculs (objets hashlib, par exemple l'empreinte du
+    contenu pour la déduplication) alimentés par la même lecture, si source
+    est fourni."""
 
     debug(f'Calcul de CRC32 pour "{fichier}"...')
+    if source is not None:
+        crc32 = 0
+        for tranche in source.tranches(TAILLE_TRANCHE_CRC):
+            crc32 = binascii.crc32(tranche, crc32)
+            for h in hachages:
+                h.update(tranche)
+        return crc32
     MonAff = TraitEncours.TraitEnCours()
     MonAff.StartIte()
     chaine = f" Calcul CRC32 {fichier}"
     MonAff.NewChaine(chaine, truncate=True)
     try:
-        with open(fichier, 'rb') as f:
-            buffer = f.read(16384)
-            # on démarre le calcul de CRC32:
-            crc32 = binascii.crc32(buffer)
-            while buffer:
-                buffer = f.read(16384)
-                # poursuite du calcul de CRC32:
-                crc32 = binascii.crc32(buffer, crc32)
+        with FichierMappe(fichier) as f:
+            crc32 = 0
+            # les tranches sont des vues du fichier projeté, sans copie
+            for tranche in f.tranches(TAILLE_TRANCHE_CRC):
+                crc32 = binascii.crc32(tranche, crc32)
                 MonAff.AffLigneBlink()
         debug(f"CRC32 = {crc32:08X}")
     except IOError:
@@ -804,47 +2513,132 @@ def CalcCRC(fichier):
 #------------------------------------------------------------------------------
 # SendDeleteFileMessage
 #-------------------
-def SendDeleteFileMessage(fichier):
-    """ Emet un message de suppression du fichier coté haut
+def SendDeleteFileMessage(*fichiers):
+    """ Emet un message de suppression coté haut pour chacun des fichiers,
+    par lots de TAILLE_LOT datagrammes.
     """
     # Doit on ajouter des éléments de Dref (taille/date) pour consolider l'ordre à la reception ?
     debug("Sending DeleteFileMessage...")
-    nom_fichier = str(fichier).encode('utf-8')
-    taille = len(nom_fichier)
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    # on commence par packer l'entete:
-    entete = struct.pack(
-        FORMAT_ENTETE,
-        PAQUET_DELETEFile,
-        taille,
-        taille,
-        0,
-        0,
-        0,
-        0,
-        1,
-        0,
-        0,
-        0
-        )
-    paquet = entete + nom_fichier
-    s.sendto(paquet, (HOST, PORT))
-    s.close()
+    datagrammes = []
+    for fichier in fichiers:
+        nom_fichier = str(fichier).encode('utf-8')
+        taille = len(nom_fichier)
+        # on commence par packer l'entete:
+        entete = ENTETE.pack(PAQUET_DELETEFile, taille, taille, 0, 0, 0, 0, 1, 0, 0, 0)
+        datagrammes.append((entete, nom_fichier))
+    if moteur_async is not None:
+        # émis par le moteur asyncio, sans attendre: la scrutation continue
+        moteur_async.supprimer(datagrammes)
+    else:
+        transport_session().envoyer(datagrammes)
 
 #------------------------------------------------------------------------------
-# ENVOYER
+# envoyer_clone
 #-------------------
+def envoyer_clone(fichier_dest, fichier_origine, taille_fichier, date_fichier, crc32,
+    limiteur_debit=None):
+    """Pour émettre un paquet de clonage: le récepteur recopie fichier_origine,
+    déjà livré et de même contenu, vers fichier_dest (chemins relatifs dans le
+    répertoire destination)."""
+    nom_fichier_dest = str(fichier_dest).encode('utf-8')
+    nom_fichier_origine = str(fichier_origine).encode('utf-8')
+    if len(nom_fichier_dest) > MAX_NOM_FICHIER or len(nom_fichier_origine) > MAX_NOM_FICHIER:
+        raise ValueError
+    if limiteur_debit is None:
+        limiteur_debit = LimiteurDebit(options.debit, options.rafale*1024)
+    entete = ENTETE.pack(PAQUET_CLONE, len(nom_fichier_dest), len(nom_fichier_origine), 0,
+                         int(time.time()), 0, 0, 1, taille_fichier, date_fichier, entier_signe32(crc32))
+    emettre_lots(iter([[(entete, nom_fichier_dest, nom_fichier_origine)]]), limiteur_debit)
+    msg = f"Copie de {fichier_origine} vers {fichier_dest}"
+    Console.Print_temp(msg, NL=True)
+    logging.info(msg)
 
-def envoyer(fichier_source, fichier_dest, limiteur_debit=None, num_session=None,
-    num_paquet_session=None, crc=None):
-    """Pour émettre un fichier en paquets UDP BFTP.
+#------------------------------------------------------------------------------
+# resoudre_destination
+#-------------------
+def resoudre_destination(hote=None, port=None):
+    """Résout l'adresse destination (HOST, PORT) en tuple (adresse IP, port),
+    une fois pour toutes au lieu de le faire à chaque envoi."""
+    hote = HOST if hote is None else hote
+    port = PORT if port is None else port
+    return socket.getaddrinfo(hote, port, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+
+def taille_datagramme_mtu(mtu, ipv6=False):
+    """Taille maximale d'un datagramme BFTP tenant dans une trame de mtu
+    octets, sans fragmentation IP (ipv6: entête IPv6 au lieu d'IPv4)."""
+    taille_entete_ip = TAILLE_ENTETE_IPV6 if ipv6 else TAILLE_ENTETE_IP
+    return min(TAILLE_PAQUET, mtu - taille_entete_ip - TAILLE_ENTETE_UDP)
+
+def liens_session():
+    """Renvoie les liens de la session: liste de (adresse, port, poids)."""
+    return LIENS or [(HOST, PORT, 1)]
+
+def resoudre_liens():
+    """Résout les adresses de tous les liens de la session."""
+    return [resoudre_destination(hote, port) for hote, port, poids in liens_session()]
 
-    fichier_source : chemin du fichier source sur le disque local
-    fichier_dest   : chemin relatif du fichier dans le répertoire destination
-    limiteur_debit : pour limiter le débit d'envoi
-    num_session    : numéro de session
-    num_paquet_session : compteur de paquets
-    """
+#------------------------------------------------------------------------------
+# ORDRE_PAQUETS
+#-------------------
+
+# partie fractionnaire du nombre d'or: les débuts de tours successifs sont
+# aussi éloignés que possible les uns des autres
+NOMBRE_OR = 0.6180339887498949
+
+def ordre_paquets(nb_paquets, largeur, profondeur, tour=0):
+    """Générateur des numéros de paquets d'un fichier dans l'ordre d'émission.
+
+    Les paquets sont rangés en lignes de largeur paquets consécutifs (un
+    groupe FEC), et les blocs de profondeur lignes sont lus colonne par
+    colonne: une rafale de pertes d'au plus profondeur datagrammes ne touche
+    qu'un paquet par ligne. Le bloc et la colonne de départ tournent à chaque
+    tour d'émission, pour qu'une perte périodique ne touche pas toujours les
+    mêmes paquets. Avec profondeur 0, l'ordre est séquentiel."""
+    if profondeur <= 0 or nb_paquets <= 1:
+        yield from range(nb_paquets)
+        return
+    taille_bloc = largeur * profondeur
+    nb_blocs = (nb_paquets + taille_bloc - 1) // taille_bloc
+    rotation = (tour * NOMBRE_OR) % 1.0
+    bloc_depart = int(nb_blocs * rotation)
+    colonne_depart = int(largeur * rotation)
+    for b in range(nb_blocs):
+        base = ((bloc_depart + b) % nb_blocs) * taille_bloc
+        for c in range(largeur):
+            colonne = (colonne_depart + c) % largeur
+            for n in range(base + colonne, min(base + taille_bloc, nb_paquets), largeur):
+                yield n
+
+
+#------------------------------------------------------------------------------
+# ENVOYER
+#-------------------
+
+def emettre_lots(lots, limiteur_debit):
+    """Emet les lots de datagrammes (listes de séquences de tampons) produits
+    par le générateur lots, en faisant les pauses nécessaires pour respecter
+    limiteur_debit: directement par le Transport de la session, ou par le
+    moteur asyncio s'il est démarré (--async). Renvoie la valeur de retour du
+    générateur."""
+    if moteur_async is not None:
+        return moteur_async.executer(moteur_async.emettre_lots(lots, limiteur_debit))
+    transport = transport_session()
+    while True:
+        try:
+            lot = next(lots)
+        except StopIteration as fin:
+            return fin.value
+        # on fait une pause si besoin pour limiter le débit, par lot
+        limiteur_debit.limiter_debit()
+        limiteur_debit.ajouter_donnees(transport.envoyer(lot), len(lot))
+
+def lots_fichier(fichier_source, fichier_dest, limiteur_debit, num_session=None,
+    num_paquet_session=None, crc=None, source=None, tour=0, compression=None, patch=None):
+    """Prépare l'émission d'un fichier (mêmes paramètres que envoyer, le
+    limiteur de débit servant à dimensionner les lots) et renvoie le générateur
+    de ses lots de datagrammes, à émettre par emettre_lots. Le générateur
+    renvoie le compteur de paquets de la session, et lève IOError si le
+    fichier ne peut être lu."""
 
     msg = f"Envoi du fichier {fichier_source}..."
     Console.Print_temp(msg, NL=True)
@@ -860,144 +2654,731 @@ def envoyer(fichier_source, fichier_dest, limiteur_debit=None, num_session=None,
     debug(f"longueur_nom = {longueur_nom}")
     if longueur_nom > MAX_NOM_FICHIER:
         raise ValueError
-    if os.path.isfile(str(fichier_source)):
+    if source is not None:
+        # taille et date du fichier tel qu'il a été ouvert
+        taille_fichier = source.taille
+        date_fichier = int(os.fstat(source.fichier.fileno()).st_mtime)
+    elif os.path.isfile(str(fichier_source)):
         taille_fichier = os.path.getsize(str(fichier_source))
         date_fichier = int(os.path.getmtime(str(fichier_source)))
-        debug(f"taille_fichier = {taille_fichier}")
-        debug(f"date_fichier = {mtime2str(date_fichier)}")
-        # calcul de CRC32
-        if crc is None:
-            crc32 = CalcCRC(str(fichier_source))
-        else:
-            crc32 = crc
     else:
         raise FileNotFoundError(f"Le fichier source {fichier_source} n'existe pas ou n'est pas un fichier.")
-    # taille restant pour les données dans un paquet normal
-    taille_donnees_max = TAILLE_PAQUET - TAILLE_ENTETE - longueur_nom
+    drapeaux = 0
+    taille_flux = taille_fichier
+    flux = compression if compression is not None else patch
+    if flux is not None:
+        taille_fichier = flux.taille_originale
+        taille_flux = flux.taille
+        if compression is not None:
+            drapeaux = compression.methode << DECALAGE_COMPRESSION
+        else:
+            drapeaux = DRAPEAU_PATCH
+        if crc is None:
+            crc = flux.crc32
+        source = flux.flux
+    debug(f"taille_fichier = {taille_fichier}")
+    debug(f"date_fichier = {mtime2str(date_fichier)}")
+    # champ nom des paquets: le nom, ou l'identifiant du fichier annoncé à part
+    nom_paquets = nom_fichier_dest
+    if IDENTIFIANTS:
+        nom_paquets = IDENTIFIANT.pack(identifiant_fichier(nom_fichier_dest, taille_fichier,
+                                                           date_fichier, drapeaux))
+        drapeaux |= DRAPEAU_IDENTIFIANT
+    # calcul de CRC32
+    crc_fin = crc is None and CRC_FIN
+    if crc_fin:
+        crc32 = 0
+    elif crc is None:
+        crc32 = CalcCRC(str(fichier_source))
+    else:
+        crc32 = crc
+    # taille restant pour les données dans un paquet normal (avec FEC, les
+    # paquets de réparation doivent aussi loger leur sous-entête)
+    taille_donnees_max = TAILLE_DATAGRAMME - TAILLE_ENTETE - len(nom_paquets)
+    if FEC_K:
+        taille_donnees_max -= SOUS_ENTETE_REPARATION.size
+    if taille_donnees_max < TAILLE_DONNEES_MIN:
+        # nom trop long pour la MTU: les datagrammes de ce fichier seront fragmentés
+        taille_donnees_max = TAILLE_DONNEES_MIN
     debug(f"taille_donnees_max = {taille_donnees_max}")
-    nb_paquets = (taille_fichier + taille_donnees_max - 1) // taille_donnees_max
+    nb_paquets = (taille_flux + taille_donnees_max - 1) // taille_donnees_max
     if nb_paquets == 0:
         # si le fichier est vide, il faut quand même envoyer un paquet
         nb_paquets = 1
     debug(f"nb_paquets = {nb_paquets}")
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    reste_a_envoyer = taille_fichier
-    try:
-        with open(str(fichier_source), 'rb') as f:
-            if limiteur_debit is None:
-                # si aucun limiteur fourni, on en initialise un:
-                limiteur_debit = LimiteurDebit(options.debit)
+    # l'entête est packée une seule fois pour le fichier (struct.error si un
+    # champ sort des limites du format), puis recopiée dans un tampon par
+    # datagramme du lot: seule sa partie variable est mise à jour par paquet
+    type_paquet = PAQUET_FICHIER | drapeaux | (DRAPEAU_CRC_FIN if crc_fin else 0)
+    entete = ENTETE.pack(type_paquet, len(nom_paquets), 0, 0,
+                         num_session, num_paquet_session, 0, nb_paquets,
+                         taille_fichier, date_fichier, entier_signe32(crc32))
+
+    def annonce(num_paquet_session):
+        "datagramme d'annonce du nom et de l'identifiant du fichier."
+        return (ENTETE.pack(PAQUET_ANNONCE | (type_paquet & ~MASQUE_TYPE), longueur_nom,
+                            IDENTIFIANT.size, 0, num_session, num_paquet_session, 0, nb_paquets,
+                            taille_fichier, date_fichier, entier_signe32(crc32 if not crc_fin else 0)),
+                nom_fichier_dest, nom_paquets)
+
+    # un lot est émis d'un coup: il ne doit pas dépasser la rafale autorisée
+    taille_lot = limiteur_debit.taille_lot(TAILLE_ENTETE + len(nom_paquets) + taille_donnees_max, TAILLE_LOT)
+    # (un de plus: une annonce peut précéder le dernier paquet de données du lot)
+    entetes = [bytearray(entete) for i in range(taille_lot + 1)]
+    # FEC: parités XOR en cours de calcul par groupe, sous forme d'entiers (les
+    # paquets plus courts sont complétés par des zéros): [parités, tailles,
+    # nombre de paquets du groupe restant à émettre]
+    fec_k, fec_r = (FEC_K, min(FEC_R, FEC_K)) if taille_flux > 0 else (0, 1)
+    groupes_fec = {}
+    # ordre d'émission des paquets; le CRC32 en mode CRC_FIN est calculé au
+    # fil de l'envoi si les paquets partent dans l'ordre, sinon combiné à
+    # partir de celui de chaque paquet (cf. CRCPaquets)
+    ordre = ordre_paquets(nb_paquets, fec_k or LARGEUR_ENTRELACEMENT, ENTRELACEMENT, tour)
+    crc_continu = crc_fin and ENTRELACEMENT <= 0
+    crc_paquets = CRCPaquets(nb_paquets) if crc_fin and not crc_continu else None
+
+    def lots():
+        nonlocal source, crc32, num_paquet_session
+        # fichier ouvert ici, ou déjà ouvert par l'appelant (qui le fermera)
+        with FichierMappe(str(fichier_source)) if source is None else contextlib.nullcontext(source) as source:
             limiteur_debit.depart_chrono()
-            for num_paquet in range(nb_paquets):
-                # on fait une pause si besoin pour limiter le débit
-                limiteur_debit.limiter_debit()
-                if reste_a_envoyer > taille_donnees_max:
-                    taille_donnees = taille_donnees_max
-                else:
-                    taille_donnees = reste_a_envoyer
-                reste_a_envoyer -= taille_donnees
-                offset = f.tell()
-                donnees = f.read(taille_donnees)
-                
-                # Conversion explicite de tous les arguments
-                paquet_fichier = ctypes.c_int(int(PAQUET_FICHIER)).value
-                longueur_nom = ctypes.c_int(int(longueur_nom)).value
-                taille_donnees = ctypes.c_int(int(taille_donnees)).value
-                offset = ctypes.c_uint64(int(offset)).value
-                num_session = ctypes.c_uint64(int(num_session)).value
-                num_paquet_session = ctypes.c_int(int(num_paquet_session)).value
-                num_paquet = ctypes.c_int(int(num_paquet)).value
-                nb_paquets = ctypes.c_int(int(nb_paquets)).value
-                taille_fichier = ctypes.c_uint64(int(taille_fichier)).value
-                date_fichier = ctypes.c_uint64(int(date_fichier)).value
-                crc32 = ctypes.c_int(int(crc32)).value
-
-                # Conversion en entiers non signés 64 bits si nécessaire
-                if offset > 2**31 - 1:
-                    offset = ctypes.c_uint64(offset).value
-                if taille_fichier > 2**31 - 1:
-                    taille_fichier = ctypes.c_uint64(taille_fichier).value
-                if date_fichier > 2**31 - 1:
-                    date_fichier = ctypes.c_uint64(date_fichier).value
-
-                # Affichage des valeurs pour le débogage
-                debug(f"FORMAT_ENTETE: {FORMAT_ENTETE}")
-                debug(f"paquet_fichier: {paquet_fichier} ({type(paquet_fichier)})")
-                debug(f"longueur_nom: {longueur_nom} ({type(longueur_nom)})")
-                debug(f"taille_donnees: {taille_donnees} ({type(taille_donnees)})")
-                debug(f"offset: {offset} ({type(offset)})")
-                debug(f"num_session: {num_session} ({type(num_session)})")
-                debug(f"num_paquet_session: {num_paquet_session} ({type(num_paquet_session)})")
-                debug(f"num_paquet: {num_paquet} ({type(num_paquet)})")
-                debug(f"nb_paquets: {nb_paquets} ({type(nb_paquets)})")
-                debug(f"taille_fichier: {taille_fichier} ({type(taille_fichier)})")
-                debug(f"date_fichier: {date_fichier} ({type(date_fichier)})")
-                debug(f"crc32: {crc32} ({type(crc32)})")
-
-                # Vérification des limites pour les entiers signés 32 bits
-                for name, value in [('paquet_fichier', paquet_fichier), ('longueur_nom', longueur_nom), 
-                                    ('taille_donnees', taille_donnees), ('num_paquet_session', num_paquet_session), 
-                                    ('num_paquet', num_paquet), ('nb_paquets', nb_paquets), ('crc32', crc32)]:
-                    if not (-2147483648 <= value <= 2147483647):
-                        raise ValueError(f"{name} ({value}) est en dehors des limites d'un entier signé 32 bits")
-
-                # Appel à struct.pack avec les valeurs converties
-                entete = struct.pack(
-                    FORMAT_ENTETE,
-                    paquet_fichier,
-                    longueur_nom,
-                    taille_donnees,
-                    offset,
-                    num_session,
-                    num_paquet_session,
-                    num_paquet,
-                    nb_paquets,
-                    taille_fichier,
-                    date_fichier,
-                    crc32
-                )
-                print(f"Type de paquet envoyé : {PAQUET_FICHIER}")
-                paquet = entete + nom_fichier_dest + donnees
-                s.sendto(paquet, (HOST, PORT))
+            pourcent_affiche = -1
+            lot = []
+            for rang, num_paquet in enumerate(ordre):
+                if IDENTIFIANTS and rang % REPETITION_ANNONCE == 0:
+                    lot.append(annonce(num_paquet_session))
+                    num_paquet_session += 1
+                offset = num_paquet * taille_donnees_max
+                # vue sur le fichier projeté: envoyée sans copie
+                donnees = source.tranche(offset, min(taille_donnees_max, taille_flux - offset))
+                taille_donnees = len(donnees)
+                if crc_continu:
+                    crc32 = binascii.crc32(donnees, crc32)
+                elif crc_paquets is not None:
+                    crc_paquets.ajouter(num_paquet, donnees)
+                entete = entetes[len(lot)]
+                ENTETE_VARIABLE.pack_into(entete, OFFSET_ENTETE_VARIABLE,
+                    taille_donnees, offset, num_session, num_paquet_session, num_paquet)
+                # scatter-gather: entête, nom et données ne sont pas concaténés
+                lot.append((entete, nom_paquets, donnees))
+                num_paquet_session += 1
+                if fec_k:
+                    groupe, i = divmod(num_paquet, fec_k)
+                    if groupe not in groupes_fec:
+                        groupes_fec[groupe] = [[0] * fec_r, [0] * fec_r,
+                                               min(fec_k, nb_paquets - groupe * fec_k)]
+                    parites, taille_parites, restants = groupe_fec = groupes_fec[groupe]
+                    parites[i % fec_r] ^= int.from_bytes(donnees, 'little')
+                    taille_parites[i % fec_r] = max(taille_parites[i % fec_r], taille_donnees)
+                    groupe_fec[2] = restants = restants - 1
+                    if restants == 0:
+                        # tout le groupe est émis: paquets de réparation
+                        del groupes_fec[groupe]
+                        for j in range(min(fec_r, nb_paquets - groupe * fec_k)):
+                            reparation = parites[j].to_bytes(taille_parites[j], 'little')
+                            lot.append((ENTETE.pack(PAQUET_REPARATION | (type_paquet & ~MASQUE_TYPE),
+                                            len(nom_paquets), SOUS_ENTETE_REPARATION.size + len(reparation),
+                                            groupe * fec_k * taille_donnees_max, num_session,
+                                            num_paquet_session, groupe, nb_paquets, taille_fichier,
+                                            date_fichier, entier_signe32(crc32 if not crc_fin else 0)),
+                                        nom_paquets,
+                                        SOUS_ENTETE_REPARATION.pack(fec_k, fec_r, j, taille_donnees_max),
+                                        reparation))
+                            num_paquet_session += 1
+                if IDENTIFIANTS and rang == nb_paquets - 1 and rang % REPETITION_ANNONCE:
+                    # dernière annonce: les paquets reçus avant la précédente
+                    # n'attendront pas le tour d'émission suivant
+                    lot.append(annonce(num_paquet_session))
+                    num_paquet_session += 1
+                # (les paquets de réparation et d'annonce peuvent faire déborder le lot)
+                if len(lot) < taille_lot and rang < nb_paquets - 1:
+                    continue
+                # émission du lot, au débit autorisé (cf. emettre_lots)
+                yield lot
+                lot = []
+                # affichage du pourcentage, seulement quand il change
+                pourcent = (100*(rang+1)) // nb_paquets
+                if pourcent != pourcent_affiche:
+                    pourcent_affiche = pourcent
+                    print(f"{pourcent}%\r", end='', flush=True)
+            if crc_fin:
+                if not crc_continu:
+                    # paquets émis dans le désordre
+                    crc32 = crc_paquets.crc32
+                # paquet de fin de fichier, avec le CRC32 calculé pendant l'envoi
+                fin = ENTETE.pack(PAQUET_FINFICHIER | (drapeaux & DRAPEAU_IDENTIFIANT), len(nom_paquets), 0, 0,
+                                  num_session, num_paquet_session, 0, nb_paquets,
+                                  taille_fichier, date_fichier, entier_signe32(crc32))
+                yield [(fin, nom_paquets)]
                 num_paquet_session += 1
-                limiteur_debit.ajouter_donnees(len(paquet))
-                #debug("debit moyen = %d" % limiteur_debit.debit_moyen())
-                #time.sleep(0.3)
-                pourcent = 100*(num_paquet+1)/nb_paquets
-                # affichage du pourcentage: la virgule évite un retour chariot
-                print(f"{pourcent:.0f}%\r", end='', flush=True)
         print(f"transfert en {limiteur_debit.temps_total():.3f} secondes - debit moyen {limiteur_debit.debit_moyen()*8/1000:.0f} Kbps")
+        return num_paquet_session
+
+    return lots()
+
+
+def envoyer(fichier_source, fichier_dest, limiteur_debit=None, num_session=None,
+    num_paquet_session=None, crc=None, source=None, tour=0, compression=None, patch=None):
+    """Pour émettre un fichier en paquets UDP BFTP.
+
+    fichier_source : chemin du fichier source sur le disque local
+    fichier_dest   : chemin relatif du fichier dans le répertoire destination
+    limiteur_debit : pour limiter le débit d'envoi
+    num_session    : numéro de session
+    num_paquet_session : compteur de paquets
+    crc            : CRC32 du fichier s'il est déjà connu. Sinon il est calculé
+                     par CalcCRC avant l'envoi ou, en mode CRC_FIN, pendant
+                     l'envoi puis transmis dans un paquet de fin de fichier.
+    source         : FichierMappe déjà ouvert sur fichier_source (par exemple
+                     préparé à l'avance par PipelineEmission), sinon le
+                     fichier est ouvert ici. Il n'est pas fermé par envoyer().
+    tour           : numéro du tour d'émission du fichier, qui fait tourner
+                     l'ordre des paquets si ENTRELACEMENT est actif.
+    compression    : FluxCompresse du fichier (cf. modules/Compression.py): les
+                     paquets transportent alors le flux compressé, l'entête
+                     décrivant toujours le fichier d'origine (taille, CRC32).
+                     Il n'est pas fermé par envoyer().
+    patch          : PatchDelta du fichier (cf. modules/Delta.py), transmis de
+                     la même façon que le flux compressé.
+    """
+
+    if limiteur_debit is None:
+        # si aucun limiteur fourni, on en initialise un:
+        limiteur_debit = LimiteurDebit(options.debit, options.rafale*1024)
+    lots = lots_fichier(fichier_source, fichier_dest, limiteur_debit, num_session,
+        num_paquet_session, crc, source, tour, compression, patch)
+    try:
+        return emettre_lots(lots, limiteur_debit)
     except IOError:
         msg = f"Ouverture du fichier {fichier_source}..."
         print("Erreur : " + msg)
         logging.error(msg)
-        num_paquet_session = -1
-    s.close()
-    return num_paquet_session
+        return -1
 
 
 #------------------------------------------------------------------------------
-# SortDictBy
-#-----------------
-def sortDictBy(nslist, key):
+# ENVOYER_PETITS_FICHIERS
+#-------------------
+
+def taille_entree_multifichier(fichier_dest, taille_fichier):
+    """Place occupée par un fichier dans un paquet multi-fichiers."""
+    return ENTREE_MULTIFICHIER.size + len(str(fichier_dest).encode('utf-8')) + taille_fichier
+
+def envoyer_petits_fichiers(petits_fichiers, limiteur_debit=None, num_session=None,
+    num_paquet_session=None):
+    """Pour émettre des petits fichiers regroupés dans des paquets UDP BFTP
+    multi-fichiers, remplis jusqu'à TAILLE_DATAGRAMME.
+
+    petits_fichiers : liste de tuples (fichier_dest, donnees, date_fichier, crc32),
+                      fichier_dest étant le chemin relatif dans le répertoire destination
+    limiteur_debit  : pour limiter le débit d'envoi
+    Renvoie le compteur de paquets de la session.
     """
-    Tri d'un dictionnaire sur un champ
+    if num_session is None:
+        num_session = int(time.time())
+        num_paquet_session = 0
+    if limiteur_debit is None:
+        limiteur_debit = LimiteurDebit(options.debit, options.rafale*1024)
+    # contenu des datagrammes: liste des tampons et nombre d'entrées de chacun
+    corps = []
+    tampons, nb_entrees, taille = [], 0, TAILLE_ENTETE
+    for fichier_dest, donnees, date_fichier, crc32 in petits_fichiers:
+        nom_fichier_dest = str(fichier_dest).encode('utf-8')
+        taille_entree = ENTREE_MULTIFICHIER.size + len(nom_fichier_dest) + len(donnees)
+        if TAILLE_ENTETE + taille_entree > TAILLE_DATAGRAMME:
+            raise ValueError(f"fichier trop gros pour un paquet multi-fichiers: {fichier_dest}")
+        if taille + taille_entree > TAILLE_DATAGRAMME:
+            corps.append((tampons, nb_entrees))
+            tampons, nb_entrees, taille = [], 0, TAILLE_ENTETE
+        tampons += [ENTREE_MULTIFICHIER.pack(len(nom_fichier_dest), date_fichier, len(donnees),
+                                             entier_signe32(crc32)),
+                    nom_fichier_dest, donnees]
+        nb_entrees += 1
+        taille += taille_entree
+    if nb_entrees:
+        corps.append((tampons, nb_entrees))
+    taille_lot = limiteur_debit.taille_lot(TAILLE_DATAGRAMME, TAILLE_LOT)
+
+    def lots():
+        nonlocal num_paquet_session
+        lot = []
+        for rang, (tampons, nb_entrees) in enumerate(corps):
+            donnees = b"".join(tampons)
+            entete = ENTETE.pack(PAQUET_MULTIFICHIER, 0, len(donnees), 0, num_session,
+                                 num_paquet_session, nb_entrees, 1, len(donnees), 0, 0)
+            lot.append((entete, donnees))
+            num_paquet_session += 1
+            if len(lot) < taille_lot and rang < len(corps) - 1:
+                continue
+            yield lot
+            lot = []
+
+    emettre_lots(lots(), limiteur_debit)
+    msg = f"{len(petits_fichiers)} petits fichiers envoyes en {len(corps)} paquets"
+    Console.Print_temp(msg)
+    logging.info(msg)
+    return num_paquet_session
+
+
+#------------------------------------------------------------------------------
+# PipelineEmission
+#-------------------
+
+class PipelineEmission:
+    """Emission en pipeline des fichiers d'une boucle de synchro_arbo.
+
+    Pendant que le fichier N est mis en paquets, régulé et envoyé par le
+    thread appelant, des threads de préparation vérifient, calculent le
+    CRC32 et ouvrent/lisent à l'avance les fichiers N+1 à N+profondeur. La
+    file des fichiers en préparation est bornée et respecte l'ordre d'émission.
+    Avec une profondeur nulle, la préparation se fait dans le thread appelant.
     """
-    return sorted(nslist, key=lambda x: x[key])
+
+    def __init__(self, profondeur=None, nb_preparateurs=None):
+        """Constructeur d'objet PipelineEmission.
+
+        profondeur      : nombre de fichiers préparés à l'avance.
+        nb_preparateurs : nombre de threads de préparation."""
+        self.profondeur = PROFONDEUR_PIPELINE if profondeur is None else profondeur
+        self.nb_preparateurs = NB_PREPARATEURS if nb_preparateurs is None else nb_preparateurs
+        self.executeur = None
+        if self.profondeur > 0:
+            self.executeur = concurrent.futures.ThreadPoolExecutor(
+                max(1, self.nb_preparateurs), thread_name_prefix='BFTP_preparation')
+        self.verrou = threading.Lock()
+        self.raz_stats()
+
+    def raz_stats(self):
+        """remise à zéro des statistiques"""
+        self.nb_fichiers = 0
+        # temps cumulé de chaque étape, en secondes. "attente" est le temps
+        # passé par l'émission à attendre un fichier pas encore préparé.
+        self.temps = {'preparation': 0.0, 'emission': 0.0, 'attente': 0.0}
+        self.prets_cumul = 0    # cumul du nombre de fichiers prêts à émettre
+        self.prets_max = 0
+
+    def _preparer(self, preparer, element):
+        debut = time.monotonic()
+        try:
+            return preparer(element)
+        finally:
+            with self.verrou:
+                self.temps['preparation'] += time.monotonic() - debut
+
+    def executer(self, elements, preparer, emettre, liberer):
+        """Prépare et émet les éléments dans l'ordre.
+
+        preparer(element)   : étape de préparation, exécutée en avance.
+        emettre(preparation): étape d'émission, renvoie False pour arrêter.
+        liberer(preparation): libère les ressources d'une préparation, émise
+                              ou non.
+        Renvoie True si tous les éléments ont été émis, False si emettre a
+        demandé l'arrêt."""
+        elements = iter(elements)
+        en_cours = collections.deque()
+        try:
+            while True:
+                if self.executeur is None:
+                    element = next(elements, None)
+                    if element is None:
+                        return True
+                    preparation = self._preparer(preparer, element)
+                else:
+                    while len(en_cours) < self.profondeur:
+                        element = next(elements, None)
+                        if element is None:
+                            break
+                        en_cours.append(self.executeur.submit(self._preparer, preparer, element))
+                    if not en_cours:
+                        return True
+                    prets = sum(1 for futur in en_cours if futur.done())
+                    self.prets_cumul += prets
+                    self.prets_max = max(self.prets_max, prets)
+                    debut = time.monotonic()
+                    preparation = en_cours.popleft().result()
+                    self.temps['attente'] += time.monotonic() - debut
+                    # on relance aussitôt une préparation pour garder la file pleine
+                    element = next(elements, None)
+                    if element is not None:
+                        en_cours.append(self.executeur.submit(self._preparer, preparer, element))
+                self.nb_fichiers += 1
+                debut = time.monotonic()
+                try:
+                    continuer = emettre(preparation)
+                finally:
+                    liberer(preparation)
+                    self.temps['emission'] += time.monotonic() - debut
+                if continuer is False:
+                    return False
+        finally:
+            # préparations faites d'avance mais non émises
+            for futur in en_cours:
+                if not futur.cancel():
+                    try:
+                        liberer(futur.result())
+                    except Exception:
+                        pass
+
+    def print_stats(self):
+        """affiche les statistiques du pipeline"""
+        prets_moyen = self.prets_cumul / self.nb_fichiers if self.nb_fichiers else 0
+        msg = ('Pipeline: {} fichiers, preparation {:.1f}s ({} threads), emission {:.1f}s, '
+               'attente preparation {:.1f}s, fichiers prets en file: moy {:.1f}, max {}'.format(
+               self.nb_fichiers, self.temps['preparation'], self.nb_preparateurs,
+               self.temps['emission'], self.temps['attente'], prets_moyen, self.prets_max))
+        logging.info(msg)
+
+    def fermer(self):
+        if self.executeur is not None:
+            self.executeur.shutdown(wait=True)
+
+
+#------------------------------------------------------------------------------
+# RacineSynchro
+#-------------------
+
+class RacineSynchro:
+    """Arborescence synchronisée par synchro_arbo: répertoire source,
+    préfixe de ses chemins sur le récepteur, poids dans le partage du débit,
+    fichier de reprise (DRef) et index des contenus livrés."""
+
+    def __init__(self, repertoire, prefixe="", poids=1, nom=None):
+        """Constructeur d'objet RacineSynchro: lit ou construit le fichier
+        de reprise.
+
+        repertoire : répertoire source.
+        prefixe    : répertoire destination des fichiers sur le récepteur.
+        poids      : poids de l'arborescence dans le partage du débit.
+        nom        : pour distinguer les fichiers de reprise de plusieurs
+                     arborescences avec -c (BFTPsynchro-<nom>.xml)."""
+        self.repertoire = path(repertoire)
+        prefixe = prefixe.strip('/')
+        self.prefixe = prefixe + '/' if prefixe else ''
+        self.poids = poids
+        print("Lecture/contruction du fichier de reprise")
+        working = TraitEncours.TraitEnCours()
+        working.StartIte()
+        self.fichier_reprise_id = False
+        self.fichier_bak = None
+        if options.reprise:
+            nom_reprise = "BFTPsynchro" if nom is None else "BFTPsynchro-" + nom
+            self.fichier_reprise = nom_reprise + ".xml"
+            self.fichier_bak = nom_reprise + ".bak"
+        else:
+            self.fichier_reprise_id, self.fichier_reprise = tempfile.mkstemp(prefix='BFTP_', suffix='.xml')
+        self.index_contenu = None
+        if DEDUP:
+            # index des contenus livrés, conservé avec le fichier de reprise
+            self.fichier_index = os.path.splitext(self.fichier_reprise)[0] + '.db'
+            self.index_contenu = IndexContenu(self.fichier_index)
+        self.arbre = xfl.DirTree()
+        if self.fichier_reprise_id:
+            debug("Fichier de reprise de la session : %s" % self.fichier_reprise)
+            self.arbre.read_disk(self.repertoire, working.AffCar)
+        else:
+            debug("Lecture du fichier de reprise : %s" % self.fichier_reprise)
+            try:
+                self.arbre.read_file(self.fichier_reprise)
+            except:
+                self.arbre.read_disk(self.repertoire, working.AffCar)
+
+    def destination(self, f):
+        "chemin d'un fichier de l'arborescence sur le récepteur."
+        return self.prefixe + f
+
+    def fermer(self):
+        "ferme l'index, et supprime les fichiers de reprise temporaires."
+        if self.index_contenu is not None:
+            self.index_contenu.fermer()
+        if self.fichier_reprise_id:
+            debug(f"Suppression du fichier de reprise temporaire : {self.fichier_reprise}")
+            os.close(self.fichier_reprise_id)
+            os.remove(self.fichier_reprise)
+            if self.index_contenu is not None:
+                os.remove(self.fichier_index)
+
 
 #------------------------------------------------------------------------------
 # SYNCHRO_ARBO
 #-------------------
-def synchro_arbo(repertoire):
+def synchro_arbo(racine, limiteur_debit=None):
     """
-    Synchroniser une arborescence en envoyant regulierement tous les
-    fichiers.
+    Synchroniser une arborescence (RacineSynchro) en envoyant regulierement
+    tous les fichiers.
+
+    limiteur_debit: LimiteurDebit ou PartDebit des émissions de cette
+    arborescence (par défaut, un LimiteurDebit au débit -l).
     """
-    XFLFile_id = None
+    repertoire = racine.repertoire
+    DRef = racine.arbre
+    index_contenu = racine.index_contenu
+    XFLFile, XFLFileBak = racine.fichier_reprise, racine.fichier_bak
     logging.info(f'Synchronisation du repertoire "{str_lat1(repertoire, errors="replace")}"')
 
-    # on utilise un objet LimiteurDebit global pour tout le transfert:
-    limiteur_debit = LimiteurDebit(options.debit)
+    if limiteur_debit is None:
+        # on utilise un objet LimiteurDebit global pour tout le transfert:
+        limiteur_debit = LimiteurDebit(options.debit, options.rafale*1024)
+    # fichiers préparés (vérification, CRC32, lecture) pendant l'émission des précédents
+    pipeline = PipelineEmission(options.profondeur_pipeline, options.nb_preparateurs)
+    # file des fichiers à émettre, tenue à jour au fil des émissions et des scrutations
+    file_emission = FilePriorite(options.priorites)
+
+    def planifier(f):
+        "met à jour la place d'un fichier dans la file d'émission."
+        element = DRef.dict[f]
+        file_emission.mettre_a_jour(f, int(element.get(ATTR_NBSEND) or 0),
+            float(element.get(ATTR_LASTSEND) or 0), int(element.get(xfl.ATTR_SIZE) or 0))
+
+    def preparer(item):
+        """Etape de préparation d'un fichier à émettre (thread de préparation):
+        vérification de sa stabilité, ouverture, calcul du CRC32 ou lecture anticipée."""
+        f=item['file']
+        logging.debug(f"Iteration: {item['iteration']}")
+        separator = '/'
+        fullpathfichier = repertoire + separator + f
+        preparation = {'file': f, 'chemin': fullpathfichier, 'present': False,
+                       'stable': False, 'envoi': False, 'crc': None,
+                       'crc_calcule': False, 'source': None,
+                       'compression': None, 'choix_compression': None,
+                       'patch': None, 'empreintes': None,
+                       'contenu': None, 'clone': None}
+        if not fullpathfichier.isfile():
+            return preparation
+        preparation['present'] = True
+        taille = fullpathfichier.getsize()
+        stable=(fullpathfichier.getmtime()==float(DRef.dict[f].get(xfl.ATTR_MTIME)) and \
+            taille==int(DRef.dict[f].get(xfl.ATTR_SIZE)))
+        preparation['stable'] = stable
+        if not (stable or taille<1024 or f=="BFTPsynchro.xml"):
+            return preparation
+        preparation['envoi'] = True
+        try:
+            source = preparation['source'] = FichierMappe(str(fullpathfichier))
+        except IOError:
+            # envoyer() signalera l'erreur d'ouverture
+            return preparation
+        if DEDUP and stable and source.taille >= TAILLE_MIN_DEDUP \
+        and not (PETITS_FICHIERS and source.taille <= PETITS_FICHIERS):
+            # l'empreinte du contenu est calculée avec le CRC32
+            preparer_dedup(preparation)
+            if preparation['clone'] is not None:
+                return preparation
+        if DELTA and stable and source.taille >= TAILLE_MIN_DELTA:
+            # les empreintes des blocs sont calculées avec le CRC32
+            preparer_delta(preparation)
+            if preparation['patch'] is not None:
+                return preparation
+        if COMPRESSION and source.taille >= TAILLE_MIN_COMPRESSION \
+        and not (PETITS_FICHIERS and source.taille <= PETITS_FICHIERS):
+            # la compression produit aussi le CRC32 du fichier
+            preparer_compression(preparation, stable)
+            if preparation['compression'] is not None:
+                return preparation
+        # un fichier instable voit son CRC32 remis à zéro
+        crc_value = DRef.dict[f].get(ATTR_CRC) if stable else None
+        if preparation['crc_calcule']:
+            source.precharger(0, PRECHARGEMENT)
+        elif crc_value is None or crc_value == '0':
+            if not CRC_FIN:
+                # la lecture pour le CRC32 amène aussi le fichier en cache
+                preparation['crc'] = CalcCRC(fullpathfichier, source)
+                preparation['crc_calcule'] = True
+            # sinon le CRC32 sera calculé par envoyer() pendant l'émission
+        else:
+            preparation['crc'] = int(crc_value)
+            source.precharger(0, PRECHARGEMENT)
+        return preparation
+
+    def preparer_delta(preparation):
+        """Calcule si besoin les empreintes des blocs d'un fichier et, si une
+        version de base est connue, prépare le patch de ses blocs modifiés."""
+        f, source = preparation['file'], preparation['source']
+        empreintes = preparation['empreintes'] or DRef.dict[f].get(ATTR_EMPREINTES)
+        if preparation['crc_calcule']:
+            crc_value = str(preparation['crc'])
+        else:
+            crc_value = DRef.dict[f].get(ATTR_CRC)
+        if empreintes and crc_value not in (None, '0'):
+            crc32, empreintes = int(crc_value), Delta.decoder_empreintes(empreintes)
+        else:
+            crc32, empreintes = Delta.calculer_empreintes(source)
+            preparation['crc'] = crc32
+            preparation['crc_calcule'] = True
+            preparation['empreintes'] = Delta.encoder_empreintes(empreintes)
+        base = DRef.dict[f].get(ATTR_BASE)
+        if not base:
+            return
+        taille_base, date_base, crc_base = (int(x) for x in base.split(':'))
+        patch = Delta.preparer_patch(source, crc32, empreintes, (taille_base, date_base, crc_base),
+            Delta.decoder_empreintes(DRef.dict[f].get(ATTR_BASE_EMPREINTES)))
+        if patch is None:
+            # trop de blocs modifiés: le fichier part en entier
+            return
+        debug(f"{f}: patch de {len(patch.indices)} bloc(s), {patch.taille} octets")
+        preparation['patch'] = patch
+        preparation['crc'] = crc32
+
+    def preparer_dedup(preparation):
+        """Calcule si besoin l'empreinte du contenu d'un fichier (avec son
+        CRC32 et, pour --delta, les empreintes de ses blocs, en une seule
+        lecture) et cherche dans l'index une copie déjà livrée."""
+        f, source = preparation['file'], preparation['source']
+        contenu = DRef.dict[f].get(ATTR_CONTENU)
+        crc_value = DRef.dict[f].get(ATTR_CRC)
+        if contenu in (None, '0') or crc_value in (None, '0'):
+            h = hachage()
+            if DELTA and source.taille >= TAILLE_MIN_DELTA and not DRef.dict[f].get(ATTR_EMPREINTES):
+                crc32, empreintes = Delta.calculer_empreintes(source, hachages=(h,))
+                preparation['empreintes'] = Delta.encoder_empreintes(empreintes)
+            else:
+                crc32 = CalcCRC(preparation['chemin'], source, (h,))
+            preparation['crc'] = crc32
+            preparation['crc_calcule'] = True
+            contenu = preparation['contenu'] = h.hexdigest()
+        else:
+            preparation['crc'] = int(crc_value)
+        preparation['clone'] = index_contenu.chercher(bytes.fromhex(contenu), source.taille, f)
+
+    def memoriser_base(element):
+        """Avant la prise en compte d'une modification: si la version
+        précédente du fichier a été émise MinFileRedundancy fois, elle devient
+        la version de base des patchs (sinon on garde la base précédente)."""
+        empreintes = element.get(ATTR_EMPREINTES)
+        if empreintes and int(element.get(ATTR_NBSEND) or 0) > MinFileRedundancy:
+            element.set(ATTR_BASE, "%d:%d:%s" % (int(element.get(xfl.ATTR_SIZE)),
+                int(float(element.get(xfl.ATTR_MTIME))), element.get(ATTR_CRC)))
+            element.set(ATTR_BASE_EMPREINTES, empreintes)
+        element.set(ATTR_EMPREINTES, '')
+
+    def preparer_compression(preparation, stable):
+        """Choisit la compression d'un fichier (ou reprend celle choisie lors
+        d'une boucle précédente) et le compresse."""
+        f, source = preparation['file'], preparation['source']
+        choix = DRef.dict[f].get(ATTR_COMPRESSION) if stable else None
+        try:
+            methode, niveau = Compression.lire_nom_compression(choix)
+        except (ValueError, AttributeError):
+            methode, niveau = Compression.choisir_compression(source,
+                options.debit*1000 if COMPRESSION == 'auto' else None,
+                METHODES_COMPRESSION[COMPRESSION])
+            preparation['choix_compression'] = Compression.nom_compression(methode, niveau)
+        if methode == Compression.AUCUNE:
+            return
+        flux = Compression.FluxCompresse(source, methode, niveau)
+        if flux.taille >= flux.taille_originale:
+            # l'échantillon était trompeur: le fichier part tel quel
+            flux.fermer()
+            preparation['choix_compression'] = Compression.nom_compression(Compression.AUCUNE, 0)
+            return
+        debug(f"{f}: compression {Compression.nom_compression(methode, niveau)}, ratio {flux.ratio():.2f}")
+        preparation['compression'] = flux
+        preparation['crc'] = flux.crc32
+        preparation['crc_calcule'] = True
+
+    def compter_envoi(f, arret_possible=True):
+        """Met à jour l'état d'un fichier qui vient d'être émis. Renvoie False
+        pour arrêter la boucle d'émission (redondance atteinte)."""
+        nonlocal LastFileSendMax, FileLessRedundancy, AllFileSendMax
+        DRef.dict[f].set(ATTR_LASTSEND, str(time.time()))
+        DRef.dict[f].set(ATTR_NBSEND, str(int(DRef.dict[f].get(ATTR_NBSEND) or 0) + 1))
+        planifier(f)
+        if not arret_possible:
+            return False
+        if int(DRef.dict[f].get(ATTR_NBSEND) or 0) > MinFileRedundancy:
+            contenu = DRef.dict[f].get(ATTR_CONTENU)
+            if DEDUP and contenu not in (None, '0'):
+                # fichier livré: ses copies pourront être clonées
+                index_contenu.enregistrer(bytes.fromhex(contenu), f,
+                    int(DRef.dict[f].get(xfl.ATTR_SIZE)), int(DRef.dict[f].get(ATTR_CRC)))
+            LastFileSendMax=True
+            if (FileLessRedundancy == 0): AllFileSendMax=True
+            return False
+        else:
+            FileLessRedundancy+=1
+        return True
+
+    # petits fichiers en attente d'un paquet multi-fichiers: (nom, données, date, crc32)
+    petits_fichiers = []
+    taille_petits_fichiers = 0
+
+    def vider_petits_fichiers():
+        """Emet les petits fichiers en attente. Renvoie False pour arrêter la
+        boucle d'émission."""
+        nonlocal taille_petits_fichiers
+        if not petits_fichiers:
+            return True
+        envoyer_petits_fichiers([(racine.destination(f), donnees, date_fichier, crc32)
+            for f, donnees, date_fichier, crc32 in petits_fichiers], limiteur_debit)
+        continuer = True
+        for f, donnees, date_fichier, crc32 in petits_fichiers:
+            # après un arrêt, les fichiers suivants sont comptés émis, sans plus
+            continuer = compter_envoi(f, continuer)
+        petits_fichiers.clear()
+        taille_petits_fichiers = 0
+        return continuer
+
+    def emettre(preparation):
+        """Etape d'émission d'un fichier préparé (thread principal).
+        Renvoie False pour arrêter la boucle d'émission."""
+        nonlocal taille_petits_fichiers
+        if boucleemission.temps_total() >= TransmitDelay*4:
+            return False
+        f = preparation['file']
+        if not preparation['present']:
+            return True
+        if not preparation['stable']:
+            DRef.dict[f].set(ATTR_CRC,'0')
+            DRef.dict[f].set(ATTR_NBSEND,'0')
+            DRef.dict[f].set(ATTR_COMPRESSION,'0')
+            DRef.dict[f].set(ATTR_EMPREINTES,'')
+            DRef.dict[f].set(ATTR_CONTENU,'0')
+            if DEDUP:
+                index_contenu.oublier(f)
+            planifier(f)
+        if not preparation['envoi']:
+            return True
+        if preparation['crc_calcule']:
+            DRef.dict[f].set(ATTR_CRC, str(preparation['crc']))
+        if preparation['empreintes'] is not None:
+            DRef.dict[f].set(ATTR_EMPREINTES, preparation['empreintes'])
+        if preparation['contenu'] is not None:
+            DRef.dict[f].set(ATTR_CONTENU, preparation['contenu'])
+        if preparation['choix_compression'] is not None:
+            DRef.dict[f].set(ATTR_COMPRESSION, preparation['choix_compression'])
+        source = preparation['source']
+        if preparation['clone'] is not None:
+            # contenu déjà livré sous un autre chemin: le récepteur le recopie
+            envoyer_clone(racine.destination(f), racine.destination(preparation['clone']), source.taille,
+                int(os.fstat(source.fichier.fileno()).st_mtime), preparation['crc'], limiteur_debit)
+            return compter_envoi(f)
+        if PETITS_FICHIERS and source is not None and source.taille <= PETITS_FICHIERS \
+        and TAILLE_ENTETE + taille_entree_multifichier(racine.destination(f), source.taille) <= TAILLE_DATAGRAMME:
+            # petit fichier: regroupé avec d'autres dans un paquet multi-fichiers
+            donnees = bytes(source.tranche(0, source.taille))
+            crc32 = preparation['crc']
+            if crc32 is None:
+                crc32 = binascii.crc32(donnees)
+                DRef.dict[f].set(ATTR_CRC, str(crc32))
+            taille_entree = taille_entree_multifichier(racine.destination(f), len(donnees))
+            if taille_petits_fichiers + taille_entree > TAILLE_LOT * TAILLE_DATAGRAMME:
+                if not vider_petits_fichiers():
+                    return False
+            petits_fichiers.append((f, donnees, int(os.fstat(source.fichier.fileno()).st_mtime), crc32))
+            taille_petits_fichiers += taille_entree
+            return True
+        if (envoyer(preparation['chemin'], racine.destination(f), limiteur_debit, crc=preparation['crc'],
+                    source=source, tour=int(DRef.dict[f].get(ATTR_NBSEND) or 0),
+                    compression=preparation['compression'], patch=preparation['patch']) != -1):
+            return compter_envoi(f)
+        return True
+
+    def liberer(preparation):
+        if preparation['compression'] is not None:
+            preparation['compression'].fermer()
+        if preparation['patch'] is not None:
+            preparation['patch'].fermer()
+        if preparation['source'] is not None:
+            preparation['source'].fermer()
 
     # TODO : Distinguer le traitement d'une arborescence locale / distante
     if (0):
@@ -1024,8 +3405,14 @@ def synchro_arbo(repertoire):
                 Dscrutation.read_disk(repertoire, None, monaff.AffCar)
             logging.info(f"{mtime2str(time.time())} - Analyse arborescence")
             same, different, only1, only2 = xfl.compare_DT(Dscrutation, DRef)
+            if iteration_count == 1:
+                # fichiers du fichier de reprise: la file est ensuite tenue à jour
+                for f in DRef.dict:
+                    if DRef.dict[f].tag == xfl.TAG_FILE:
+                        planifier(f)
             logging.info(f"{mtime2str(time.time())} - Traitement des fichiers supprimes")
             logging.debug("\n========== Supprimes ========== ")
+            fichiers_supprimes = []
             for f in sorted(only2, reverse=True):
                 logging.debug(f"S  {f}")
                 monaff.AffCar()
@@ -1046,19 +3433,28 @@ def synchro_arbo(repertoire):
                                 NbSend=-1
                         for attr in (ATTR_LASTSEND, ATTR_CRC):
                             DRef.dict[f].set(attr, str(0))
+                        if DEDUP:
+                            index_contenu.oublier(f)
                         if options.synchro_arbo_stricte:
-                            SendDeleteFileMessage(f)
+                            fichiers_supprimes.append(f)
                         NbSend-=1
                         if NbSend > -10:
                             DRef.dict[f].set(ATTR_NBSEND, str(NbSend))
                         else:
                             DeletionNeeded=True
+                if DRef.dict[f].tag == xfl.TAG_FILE:
+                    if DeletionNeeded:
+                        file_emission.retirer(f)
+                    else:
+                        planifier(f)
                 if DeletionNeeded:
                     logging.debug("****** Suppression")
                     if parent == '':
                         DRef.et.remove(DRef.dict[f])
                     else:
                         DRef.dict[parent].remove(DRef.dict[f])
+            if fichiers_supprimes:
+                SendDeleteFileMessage(*[racine.destination(f) for f in fichiers_supprimes])
             logging.info(f"{mtime2str(time.time())} - Traitement des nouveaux fichiers")
             logging.debug("\n========== Nouveaux  ========== ")
             RefreshDictNeeded=False
@@ -1074,7 +3470,7 @@ def synchro_arbo(repertoire):
                         RefreshDictNeeded=True
                         for attr in (xfl.ATTR_NAME, xfl.ATTR_MTIME, xfl.ATTR_SIZE):
                             DRef.et[index].set(attr, Dscrutation.dict[f].get(attr))
-                        for attr in (ATTR_LASTSEND, ATTR_CRC, ATTR_NBSEND):
+                        for attr in (ATTR_LASTSEND, ATTR_CRC, ATTR_NBSEND, ATTR_COMPRESSION, ATTR_CONTENU):
                             DRef.et[index].set(attr, str(0))
                         DRef.et[index].set(ATTR_LASTVIEW, Dscrutation.et.get(xfl.ATTR_TIME))
                     else:
@@ -1086,7 +3482,7 @@ def synchro_arbo(repertoire):
                         RefreshDictNeeded=True
                         for attr in (xfl.ATTR_NAME, xfl.ATTR_MTIME, xfl.ATTR_SIZE):
                             DRef.dict[parent][index].set(attr, Dscrutation.dict[f].get(attr))
-                        for attr in (ATTR_LASTSEND, ATTR_CRC, ATTR_NBSEND):
+                        for attr in (ATTR_LASTSEND, ATTR_CRC, ATTR_NBSEND, ATTR_COMPRESSION, ATTR_CONTENU):
                             DRef.dict[parent][index].set(attr, str(0))
                         DRef.dict[parent][index].set(ATTR_LASTVIEW, (Dscrutation.et.get(xfl.ATTR_TIME)))
                     else:
@@ -1096,17 +3492,25 @@ def synchro_arbo(repertoire):
                     RefreshDict=False
             if RefreshDictNeeded:
                 DRef.pathdict()
+            for f in only1:
+                if Dscrutation.dict[f].tag == xfl.TAG_FILE:
+                    planifier(f)
             logging.info(f"{mtime2str(time.time())} - Traitement des fichiers modifies")
             logging.debug("\n========== Differents  ========== ")
             for f in different:
                 monaff.AffCar()
                 logging.debug(f"D  {f}")
                 if (Dscrutation.dict[f].tag == xfl.TAG_FILE):
+                    if DELTA:
+                        memoriser_base(DRef.dict[f])
+                    if DEDUP:
+                        index_contenu.oublier(f)
                     for attr in (xfl.ATTR_MTIME, xfl.ATTR_SIZE):
                         DRef.dict[f].set(attr, Dscrutation.dict[f].get(attr))
-                    for attr in (ATTR_LASTSEND, ATTR_CRC, ATTR_NBSEND):
+                    for attr in (ATTR_LASTSEND, ATTR_CRC, ATTR_NBSEND, ATTR_COMPRESSION, ATTR_CONTENU):
                         DRef.dict[f].set(attr, str(0))
                     DRef.dict[f].set(ATTR_LASTVIEW, (Dscrutation.et.get(xfl.ATTR_TIME)))
+                    planifier(f)
             logging.info(f"{mtime2str(time.time())} - Traitement des fichiers identiques")
             logging.debug("\n========== Identiques ========== ")
             for f in same:
@@ -1116,7 +3520,7 @@ def synchro_arbo(repertoire):
                     DRef.dict[f].set(ATTR_LASTVIEW, (Dscrutation.et.get(xfl.ATTR_TIME)))
             logging.info(f"{mtime2str(time.time())} - Sauvegarde du fichier de reprise")
             DRef.et.set(xfl.ATTR_TIME, str(time.time()))
-            if XFLFile == "BFTPsynchro.xml":
+            if XFLFileBak is not None:
                 if os.path.isfile(XFLFile):
                     try:
                         os.rename(XFLFile,XFLFileBak)
@@ -1124,16 +3528,15 @@ def synchro_arbo(repertoire):
                         os.remove(XFLFileBak)
                         os.rename(XFLFile,XFLFileBak)
             DRef.write_file(XFLFile)
-            logging.info(f"{mtime2str(time.time())} - Selection des fichiers les moins emis")
-            FileToSend=[]
-            for f in DRef.dict:
-                if (DRef.dict[f].tag == xfl.TAG_FILE):
-                    nbsend = DRef.dict[f].get(ATTR_NBSEND)
-                    FileToSend.append({'file':f, 'iteration':int(nbsend) if nbsend is not None else 0})
+            if DEDUP:
+                index_contenu.valider()
             logging.info(f"{mtime2str(time.time())} - Selection des fichiers a emettre")
-            FileToSend=sortDictBy(FileToSend, 'iteration')
-            logging.info(f"Nombre de fichiers a synchroniser : {len(FileToSend)}")
-            if len(FileToSend)==0:
+            # fichiers les moins émis d'abord, dans l'ordre de la file d'émission
+            parcours = file_emission.parcourir()
+            FileToSend = ({'file': f, 'iteration': int(DRef.dict[f].get(ATTR_NBSEND) or 0)}
+                          for f in parcours)
+            logging.info(f"Nombre de fichiers a synchroniser : {len(file_emission)}")
+            if len(file_emission)==0:
                 AllFileSendMax=True
             boucleemission = LimiteurDebit(options.debit)
             boucleemission.depart_chrono()
@@ -1141,44 +3544,24 @@ def synchro_arbo(repertoire):
             TransmitDelay=max(300, time.time()-float(Dscrutation.et.get(xfl.ATTR_TIME)))
             FileLessRedundancy=0
             LastFileSendMax=False
-            while (boucleemission.temps_total() < TransmitDelay*4) and (not LastFileSendMax):
-                if len(FileToSend)!=0:
-                    item=FileToSend.pop(0)
-                    f=item['file']
-                    i=item['iteration']
-                    logging.debug(f"Iteration: {i}")
-                    separator = '/'
-                    fullpathfichier = repertoire + separator + f
-                    if fullpathfichier.isfile():
-                        stable=(fullpathfichier.getmtime()==float(DRef.dict[f].get(xfl.ATTR_MTIME)) and \
-                            fullpathfichier.getsize()==int(DRef.dict[f].get(xfl.ATTR_SIZE)))
-                        if not stable:
-                            DRef.dict[f].set(ATTR_CRC,'0')
-                            DRef.dict[f].set(ATTR_NBSEND,'0')
-                        if (stable or fullpathfichier.getsize()<1024 or f=="BFTPsynchro.xml"):
-                            crc_value = DRef.dict[f].get(ATTR_CRC)
-                            if crc_value is None or crc_value == '0':
-                                current_CRC = str(CalcCRC(fullpathfichier))
-                                DRef.dict[f].set(ATTR_CRC, current_CRC)
-                                crc_value = current_CRC
-                            if (envoyer(fullpathfichier, f, limiteur_debit, crc=int(crc_value)) != -1):
-                                DRef.dict[f].set(ATTR_LASTSEND, str(time.time()))
-                                DRef.dict[f].set(ATTR_NBSEND, str(int(DRef.dict[f].get(ATTR_NBSEND) or 0) + 1))
-                                if int(DRef.dict[f].get(ATTR_NBSEND) or 0) > MinFileRedundancy:
-                                    LastFileSendMax=True
-                                    if (FileLessRedundancy == 0): AllFileSendMax=True
-                                else:
-                                    FileLessRedundancy+=1
-                else:
-                    LastFileSendMax=True
-                    if options.boucle:
-                        attente=options.pause-boucleemission.temps_total()
-                        if attente > 0:
-                            logging.info(f"{mtime2str(time.time())} - Attente avant nouvelle scrutation")
-                            time.sleep(attente)
+            pipeline.raz_stats()
+            termine = pipeline.executer(FileToSend, preparer, emettre, liberer)
+            # les fichiers non parcourus retrouvent leur place dans la file
+            parcours.close()
+            # les petits fichiers encore en attente sont émis dans tous les cas
+            termine = vider_petits_fichiers() and termine
+            if termine:
+                # tous les fichiers de la liste ont été traités
+                LastFileSendMax=True
+                if options.boucle:
+                    attente=options.pause-boucleemission.temps_total()
+                    if attente > 0:
+                        logging.info(f"{mtime2str(time.time())} - Attente avant nouvelle scrutation")
+                        time.sleep(attente)
+            pipeline.print_stats()
             logging.info(f"{mtime2str(time.time())} - Sauvegarde du fichier de reprise")
             DRef.et.set(xfl.ATTR_TIME, str(time.time()))
-            if XFLFile == "BFTPsynchro.xml":
+            if XFLFileBak is not None:
                 if os.path.isfile(XFLFile):
                     try:
                         os.rename(XFLFile,XFLFileBak)
@@ -1186,6 +3569,8 @@ def synchro_arbo(repertoire):
                         os.remove(XFLFileBak)
                         os.rename(XFLFile,XFLFileBak)
             DRef.write_file(XFLFile)
+            if DEDUP:
+                index_contenu.valider()
             
             if options.boucle is not None:
                 if iteration_count >= options.boucle:
@@ -1195,16 +3580,42 @@ def synchro_arbo(repertoire):
                     logging.info(f"Fin de l'itération {iteration_count}. Attente de {options.pause} secondes avant la prochaine itération.")
                     time.sleep(options.pause)
 
-        if XFLFile_id is not None and XFLFile_id != False:
-            try:
-                debug(f"Suppression du fichier de reprise temporaire : {XFLFile}")
-                os.close(XFLFile_id)
-                os.remove(XFLFile)
-            except OSError as e:
-                logging.warning(f"Erreur lors de la fermeture/suppression du fichier temporaire : {e}")
+        pipeline.fermer()
 
     return True  # Indique que la synchronisation est terminée
 
+#------------------------------------------------------------------------------
+# SYNCHRONISER_RACINES
+#-------------------
+def synchroniser_racines(racines):
+    """
+    Synchroniser plusieurs arborescences (RacineSynchro) en parallèle, un
+    thread par arborescence, le débit -l étant partagé entre elles au
+    prorata de leur poids.
+    """
+    partage = PartageDebit(options.debit, options.rafale*1024)
+    resultats = {}
+
+    def synchroniser(racine):
+        part = partage.part(racine.poids)
+        try:
+            resultats[racine] = synchro_arbo(racine, part)
+        except Exception:
+            logging.exception(f'Erreur de synchronisation du repertoire "{racine.repertoire}"')
+            resultats[racine] = False
+        finally:
+            # les autres arborescences ne doivent pas attendre une part arrêtée
+            part.fermer()
+
+    threads = [threading.Thread(target=synchroniser, args=(racine,), daemon=True,
+                                name=f'BFTP_synchro_{racine.prefixe or racine.repertoire}')
+               for racine in racines]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return all(resultats.values())
+
 #==============================================================================
 # PROGRAMME PRINCIPAL
 #=====================
@@ -1220,7 +3631,26 @@ if __name__ == '__main__':
     cible = path(args[0])
     HOST = options.adresse
     PORT = options.port_UDP
+    LIENS = options.liens
     MODE_DEBUG = options.debug
+    NB_PROCESSUS_RECEPTION = options.nb_processus
+    NB_ECRIVAINS = options.nb_ecrivains
+    TAMPON_RECEPTION = options.tampon_reception*1024 if options.tampon_reception else None
+    REPERTOIRE_ETAT = options.repertoire_etat
+    TAILLE_LOT = options.taille_lot
+    CRC_FIN = options.crc_fin
+    FEC_K = options.fec_k
+    FEC_R = options.fec_r
+    ENTRELACEMENT = options.entrelacement
+    PETITS_FICHIERS = options.petits_fichiers
+    COMPRESSION = options.compression
+    DELTA = options.delta
+    DEDUP = options.dedup
+    IDENTIFIANTS = options.identifiants
+    if options.mtu:
+        MTU_LIEN = options.mtu
+        TAILLE_DATAGRAMME = taille_datagramme_mtu(options.mtu,
+            any(':' in adresse for adresse, port in resoudre_liens()))
     # pour mesurer les stats de reception:
     stats = Stats()
 
@@ -1231,11 +3661,22 @@ if __name__ == '__main__':
                 filemode='a')
     logging.info("Demarrage de BlindFTP")
 
+    if not(options.recevoir):
+        # socket d'émission unique pour toute la session
+        transport = Transport(resoudre_liens(), TAILLE_LOT,
+            options.tampon_emission*1024 if options.tampon_emission else None,
+            options.dscp, options.port_source, [lien[2] for lien in liens_session()])
+
     # Emission de messages heartbeat
     HB_emis = HeartBeat()
     HB_recus = HeartBeat()
     if not(options.recevoir):
-        HB_emis.Th_envoyer_BoucleheartbeatT()
+        if options.asynchrone:
+            # données, suppressions et heartbeat émis par une boucle asyncio
+            moteur_async = MoteurAsync(transport)
+            moteur_async.demarrer(HB_emis)
+        else:
+            HB_emis.Th_envoyer_BoucleheartbeatT()
 
     try:
         if options.envoi_fichier:
@@ -1243,41 +3684,25 @@ if __name__ == '__main__':
         elif (options.synchro_arbo or options.synchro_arbo_stricte):
             # Délais pour considérer un fichier "hors ligne" comme définitivement effacé
             OffLineDelay = OFFLINEDELAY
-            # Fichier référence de l'arborescence synchronisée
-            # TODO : Nom du fichier transmis en paramètre
-            print("Lecture/contruction du fichier de reprise")
-            XFLFile_id = False
-            working = TraitEncours.TraitEnCours()
-            working.StartIte()
-            if options.reprise:
-                XFLFile = "BFTPsynchro.xml"
-                XFLFileBak = "BFTPsynchro.bak"
-            else:
-                XFLFile_id, XFLFile = tempfile.mkstemp(prefix='BFTP_', suffix='.xml')
-            DRef = xfl.DirTree()
-            if (XFLFile_id):
-                debug("Fichier de reprise de la session : %s" % XFLFile)
-                DRef.read_disk(cible, working.AffCar)
-            else:
-                debug("Lecture du fichier de reprise : %s" % XFLFile)
-                try:
-                    DRef.read_file(XFLFile)
-                except:
-                    DRef.read_disk(cible, working.AffCar)
-            
-            # Appel de la fonction synchro_arbo modifiée
-            synchronisation_effectuee = synchro_arbo(cible)
-
-            if synchronisation_effectuee:
-                logging.info("La synchronisation a été effectuée avec succès.")
-            else:
-                logging.info("Aucune synchronisation n'a été effectuée.")
+            # arborescences synchronisées, chacune avec son fichier de reprise
+            racines = []
+            try:
+                for repertoire, prefixe, poids in options.racines:
+                    nom = prefixe.replace('/', '_') if len(options.racines) > 1 else None
+                    racines.append(RacineSynchro(repertoire, prefixe, poids, nom))
+                if len(racines) == 1:
+                    synchronisation_effectuee = synchro_arbo(racines[0])
+                else:
+                    synchronisation_effectuee = synchroniser_racines(racines)
 
-            # Nettoyage après la synchronisation
-            if (XFLFile_id):
-                debug(f"Suppression du fichier de reprise temporaire : {XFLFile}")
-                os.close(XFLFile_id)
-                os.remove(XFLFile)
+                if synchronisation_effectuee:
+                    logging.info("La synchronisation a été effectuée avec succès.")
+                else:
+                    logging.info("Aucune synchronisation n'a été effectuée.")
+            finally:
+                # Nettoyage après la synchronisation
+                for racine in racines:
+                    racine.fermer()
 
         elif options.recevoir:
             CHEMIN_DEST = path(args[0])
@@ -1288,5 +3713,9 @@ if __name__ == '__main__':
         # Arrêter les threads de heartbeat
         HB_emis.stop()
         HB_recus.stop()
+        if moteur_async is not None:
+            moteur_async.fermer()
+        if transport is not None:
+            transport.print_stats()
         logging.info("Arret de BlindFTP")
         print("Le script BlindFTP s'est terminé correctement.")
\ No newline at end of file
@@ -0,0 +1,1455 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bftp_bench: mesures de performance de BlindFTP sur la boucle locale.
+
+usage: python bftp_bench.py <mesure> [<mesure> ...]
+
+Mesures disponibles:
+    envoi : paquets/s de la boucle d'émission de envoyer(), comparée à
+            l'ancienne construction des paquets (ctypes + concaténation)
+    debit : débit mesuré par LimiteurDebit, comparé à la consigne -l,
+            de 1 Mbps à 2 Gbps
+    liens : paquets/s de envoyer() répartis sur 1, 2 et 4 liens
+            (127.0.0.x, un port par lien) et répartition par lien
+    fec   : proportion de fichiers reçus complets en un seul tour d'émission
+            avec 0,5% de pertes aléatoires, sans et avec paquets de réparation
+    rafales: nombre de tours d'émission nécessaires pour recevoir un fichier
+            sur un canal à pertes en rafales et périodiques, avec et sans
+            entrelacement de l'ordre d'émission
+    petits: fichiers/s pour un grand nombre de petits fichiers, un envoi
+            par fichier ou regroupés en paquets multi-fichiers
+    compression: compression choisie, taux et débit utile effectif selon le
+            débit du lien, pour un journal texte et des données aléatoires
+    delta : volume émis et durées de préparation et de reconstruction pour
+            un gros fichier dont quelques blocs ont changé, envoyé en entier
+            ou sous forme de patch
+    dedup : volume émis et durée de réception pour de nombreuses copies
+            d'un même fichier, envoyées en entier ou par paquets de clonage
+    mtu   : tours d'émission nécessaires pour recevoir un fichier à travers
+            un relais UDP qui simule la perte de fragments IP, selon la
+            taille des datagrammes (64 Ko fragmentés, MTU 9000, MTU 1500)
+    identifiants: octets émis, durée de décodage et tours d'émission avec
+            pertes pour un fichier au chemin profond, avec le nom dans chaque
+            paquet ou un identifiant de 64 bits annoncé à part
+    ordonnancement: durée de sélection des fichiers d'une boucle de
+            synchro_arbo pour un million de fichiers, liste reconstruite et
+            triée à chaque boucle ou file de priorité tenue à jour
+    partage: débit de plusieurs arborescences émises en parallèle, avec un
+            LimiteurDebit chacune (un processus par arborescence) ou un
+            PartageDebit pondéré commun
+    async : régularité du heartbeat pendant un transfert régulé, et durée
+            d'émission de nombreux fichiers en parallèle, émetteur synchrone
+            (un thread par fichier) ou moteur asyncio (--async)
+    reception: paquets/s reçus seuls, puis reçus et décodés, sur la boucle
+            locale, et octets alloués au plus fort du traitement de chaque
+            paquet, avec
+            recvfrom (un objet bytes par datagramme) ou ReceptionLot
+            (recvmmsg dans des tampons préalloués, décodage sur memoryview)
+    processus: fichiers reçus complets en un tour à plein débit, par un
+            récepteur (bftp.py -r) d'un seul processus ou réparti sur
+            plusieurs processus (--processus)
+    ecriture: fichiers reçus complets en un tour à plein débit, datagrammes
+            perdus par le noyau et plus longue file d'écriture, avec
+            décodage et écriture dans la boucle de réception ou dans des
+            threads (--ecrivains), selon le tampon de réception (--rcvbuf)
+    destination: octets écrits (appels système) et durée de réception d'un
+            gros fichier, écrit dans un fichier temporaire puis recopié à
+            destination, ou écrit en place dans un fichier partiel renommé
+    crc   : délai entre le dernier paquet d'un gros fichier et son arrivée
+            à destination, CRC32 combiné au fil des paquets (CRCPaquets),
+            comparé à la relecture du fichier pour calculer son CRC32
+    reprise: tours d'émission nécessaires pour recevoir un gros fichier avec
+            pertes quand le récepteur redémarre après chaque tour, sans ou
+            avec points de reprise (--etat), et durées de sauvegarde et de
+            reprise
+"""
+
+#=== IMPORTS ==================================================================
+import sys, os, socket, struct, time, tempfile, ctypes, random, logging, filecmp, shutil, re
+import threading, asyncio, subprocess, signal
+import binascii
+import tracemalloc
+
+import bftp
+import modules.Compression as Compression
+import modules.Delta as Delta
+from bftp_utils import debug
+from modules.EmissionLot import EmissionLot
+from modules.FilePriorite import FilePriorite
+from modules.ReceptionLot import ReceptionLot
+
+#=== CONSTANTES ===============================================================
+
+ADRESSE_BENCH = "127.0.0.1"
+TAILLE_FICHIER_BENCH = 64 * 1024 * 1024     # 64 Mo
+DEBIT_ILLIMITE = 100_000_000                # en Kbps, soit 100 Gbps
+DEBITS_BENCH = (1000, 10000, 100000, 1000000, 2000000)  # en Kbps
+DUREE_MESURE_DEBIT = 3.0                    # secondes par débit mesuré
+TOLERANCE_DEBIT = 0.01                      # écart toléré sur le débit: 1%
+NB_LIENS_BENCH = (1, 2, 4)                  # nombres de liens mesurés
+TAILLE_FICHIER_FEC = 16 * 1024 * 1024       # 16 Mo, soit environ 260 paquets
+TAUX_PERTE_FEC = 0.005                      # 0,5% de datagrammes perdus
+NB_ESSAIS_FEC = 20                          # transferts par configuration
+CONFIGS_FEC = ((0, 1), (16, 1), (16, 2), (8, 2))   # (K, R)
+TAILLE_FICHIER_RAFALES = 32 * 1024 * 1024   # 32 Mo, soit environ 520 paquets
+TAUX_PERTE_RAFALES = 0.03                   # pertes en rafales: 3% en moyenne,
+LONGUEUR_RAFALE = 16                        # par rafales de 16 datagrammes en moyenne
+PERIODE_INTERFERENCE = 100                  # plus 1 datagramme perdu sur 100 à chaque tour
+NB_ESSAIS_RAFALES = 10
+MAX_TOURS_RAFALES = 10
+NB_PETITS_FICHIERS = 5000
+TAILLE_PETIT_FICHIER = 300
+TAILLE_FICHIER_COMPRESSION = 32 * 1024 * 1024
+DEBITS_COMPRESSION = (10000, 100000, 1000000)   # en Kbps
+TAILLE_FICHIER_DELTA = 256 * 1024 * 1024
+NB_BLOCS_MODIFIES = 4                       # blocs de Delta.TAILLE_BLOC modifiés
+NB_COPIES_DEDUP = 40
+TAILLE_FICHIER_DEDUP = 16 * 1024 * 1024
+TAILLE_FICHIER_MTU = 8 * 1024 * 1024
+TAUX_PERTE_FRAGMENTS = 0.005                # 0,5% des fragments IP perdus
+MTU_RELAIS = 1500                           # MTU simulée par le relais
+MTUS_BENCH = (None, 9000, 1500)             # None: datagrammes de TAILLE_PAQUET
+DEBIT_MTU = 50000                           # en Kbps, à la portée du relais
+NB_ESSAIS_MTU = 5
+MAX_TOURS_MTU = 10
+TAILLE_FICHIER_IDENTIFIANTS = 16 * 1024 * 1024
+NOM_PROFOND = "/".join("niveau%02d_repertoire_de_projet" % i for i in range(12)) + "/donnees.bin"
+TAUX_PERTE_IDENTIFIANTS = 0.02
+NB_ESSAIS_IDENTIFIANTS = 10
+NB_FICHIERS_ORDONNANCEMENT = 1000000
+NB_EMIS_ORDONNANCEMENT = 10000              # fichiers émis par boucle
+NB_MODIFIES_ORDONNANCEMENT = 1000           # fichiers modifiés entre deux boucles
+NB_BOUCLES_ORDONNANCEMENT = 3
+DEBIT_PARTAGE = 200000                      # en Kbps, débit -l total
+DUREE_MESURE_PARTAGE = 3.0
+TAILLE_DATAGRAMME_PARTAGE = 8192
+DEBIT_ASYNC = 100000                        # en Kbps, transfert régulé pendant le heartbeat
+DELAI_HEARTBEAT_ASYNC = 1                   # secondes entre deux heartbeats (entier)
+TAILLE_FICHIER_ASYNC = 64 * 1024 * 1024
+NB_FICHIERS_ASYNC = 100                     # fichiers émis en parallèle
+TAILLE_PETIT_FICHIER_ASYNC = 2 * 1024 * 1024
+TAILLE_FICHIER_RECEPTION = 16 * 1024 * 1024  # en datagrammes de MTU 1500: environ 11600
+TAMPON_RECEPTION = 256 * 1024 * 1024        # SO_RCVBUF: tous les datagrammes en attente
+NB_ESSAIS_RECEPTION = 5
+NB_FICHIERS_PROCESSUS = 16
+TAILLE_FICHIER_PROCESSUS = 2 * 1024 * 1024
+NB_PROCESSUS_BENCH = (1, 2, 4)
+DEBITS_PROCESSUS = (100000, 300000, 1000000)    # en Kbps
+DEMARRAGE_PROCESSUS = 2.0                   # secondes de démarrage du récepteur
+ATTENTE_PROCESSUS = 2.0                     # secondes d'attente des derniers paquets
+DEBITS_ECRITURE = (300000, 1000000)         # en Kbps
+TAILLE_FICHIER_DESTINATION = 256 * 1024 * 1024
+MTU_CRC = (None, 9000, 1500)                # None: datagrammes de 64 Ko
+TAILLE_FICHIER_REPRISE = 64 * 1024 * 1024   # en datagrammes de MTU 1500: environ 46000
+TAUX_PERTE_REPRISE = 0.02
+MAX_TOURS_REPRISE = 6
+ECRITURE_BENCH = (                          # (threads d'écriture, tampon de réception en Ko)
+    (0, None), (2, None), (0, 16384), (2, 16384))
+CONFIGS_RAFALES = ((0, 0, 1), (16, 0, 1), (0, 16, 1), (16, 16, 1), (16, 16, 2))  # (D, K, R)
+
+
+#------------------------------------------------------------------------------
+# outils communs
+#-------------------
+
+def creer_fichier(taille):
+    "crée un fichier temporaire de données aléatoires, renvoie son chemin."
+    fd, chemin = tempfile.mkstemp(prefix='BFTP_bench_')
+    with os.fdopen(fd, 'wb') as f:
+        bloc = os.urandom(1024 * 1024)
+        reste = taille
+        while reste > 0:
+            f.write(bloc[:reste])
+            reste -= len(bloc)
+    return chemin
+
+def ouvrir_puits(adresse=ADRESSE_BENCH):
+    """ouvre une socket UDP jamais lue sur la boucle locale: le noyau jette
+    les datagrammes quand son tampon est plein. Renvoie (socket, port)."""
+    puits = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    puits.bind((adresse, 0))
+    return puits, puits.getsockname()[1]
+
+def afficher(nom, nb_paquets, duree):
+    print(f"  {nom:<28} {nb_paquets:>8} paquets en {duree:6.3f} s"
+          f" : {nb_paquets/duree:>10.0f} paquets/s")
+
+
+#------------------------------------------------------------------------------
+# mesure "envoi"
+#-------------------
+
+def _envoi_ancien(chemin, nom, port):
+    """reproduction de la boucle d'émission d'origine de envoyer(): conversions
+    ctypes, vérification des bornes 32 bits, debug() construits même hors
+    mode debug, concaténation entête + nom + données, un sendto par paquet."""
+    nom_fichier_dest = nom.encode('utf-8')
+    longueur_nom = len(nom_fichier_dest)
+    taille_fichier = os.path.getsize(chemin)
+    date_fichier = int(os.path.getmtime(chemin))
+    crc32 = 0
+    num_session = int(time.time())
+    num_paquet_session = 0
+    taille_donnees_max = bftp.TAILLE_PAQUET - bftp.TAILLE_ENTETE - longueur_nom
+    nb_paquets = (taille_fichier + taille_donnees_max - 1) // taille_donnees_max
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    reste_a_envoyer = taille_fichier
+    with open(chemin, 'rb') as f:
+        for num_paquet in range(nb_paquets):
+            taille_donnees = min(reste_a_envoyer, taille_donnees_max)
+            reste_a_envoyer -= taille_donnees
+            offset = f.tell()
+            donnees = f.read(taille_donnees)
+            paquet_fichier = ctypes.c_int(int(bftp.PAQUET_FICHIER)).value
+            longueur_nom = ctypes.c_int(int(longueur_nom)).value
+            taille_donnees = ctypes.c_int(int(taille_donnees)).value
+            offset = ctypes.c_uint64(int(offset)).value
+            num_session = ctypes.c_uint64(int(num_session)).value
+            num_paquet_session = ctypes.c_int(int(num_paquet_session)).value
+            num_paquet = ctypes.c_int(int(num_paquet)).value
+            nb_paquets = ctypes.c_int(int(nb_paquets)).value
+            taille_fichier = ctypes.c_uint64(int(taille_fichier)).value
+            date_fichier = ctypes.c_uint64(int(date_fichier)).value
+            crc32 = ctypes.c_int(int(crc32)).value
+            for valeur in (paquet_fichier, longueur_nom, taille_donnees,
+                           num_paquet_session, num_paquet, nb_paquets, crc32):
+                if not (-2147483648 <= valeur <= 2147483647):
+                    raise ValueError
+            for valeur in (paquet_fichier, longueur_nom, taille_donnees, offset,
+                           num_session, num_paquet_session, num_paquet,
+                           nb_paquets, taille_fichier, date_fichier, crc32):
+                debug(f"valeur: {valeur} ({type(valeur)})")
+            entete = struct.pack(bftp.FORMAT_ENTETE, paquet_fichier, longueur_nom,
+                taille_donnees, offset, num_session, num_paquet_session, num_paquet,
+                nb_paquets, taille_fichier, date_fichier, crc32)
+            paquet = entete + nom_fichier_dest + donnees
+            s.sendto(paquet, (bftp.HOST, port))
+            num_paquet_session += 1
+            print(f"{100*(num_paquet+1)/nb_paquets:.0f}%\r", end='', flush=True)
+    s.close()
+    return nb_paquets
+
+def bench_envoi():
+    "paquets/s de la boucle d'émission, avant/après l'entête précompilée."
+    print("Mesure envoi (fichier de %d Mo, debit non limite):" % (TAILLE_FICHIER_BENCH >> 20))
+    chemin = creer_fichier(TAILLE_FICHIER_BENCH)
+    puits, port = ouvrir_puits()
+    bftp.HOST, bftp.PORT = ADRESSE_BENCH, port
+    bftp.transport = bftp.Transport((ADRESSE_BENCH, port))
+    try:
+        # premier passage pour mettre le fichier en cache
+        with open(chemin, 'rb') as f:
+            while f.read(1 << 20):
+                pass
+        debut = time.perf_counter()
+        nb = _envoi_ancien(chemin, "bench.bin", port)
+        afficher("avant (ctypes + concat.)", nb, time.perf_counter() - debut)
+        limiteur = bftp.LimiteurDebit(DEBIT_ILLIMITE)
+        debut = time.perf_counter()
+        nb = bftp.envoyer(chemin, "bench.bin", limiteur, crc=0)
+        afficher("apres (Struct + lots sendmmsg)", nb, time.perf_counter() - debut)
+    finally:
+        puits.close()
+        os.remove(chemin)
+
+
+#------------------------------------------------------------------------------
+# mesure "debit"
+#-------------------
+
+def mesurer_debit(debit, taille_datagramme, duree, port, rafale=None):
+    """émet des datagrammes de taille_datagramme octets pendant duree
+    secondes, au rythme d'un LimiteurDebit de debit Kbps. Renvoie le débit
+    mesuré sur le lien (entêtes IP/UDP comprises), en Kbps."""
+    limiteur = bftp.LimiteurDebit(debit, rafale)
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    taille_lot = limiteur.taille_lot(taille_datagramme, bftp.TAILLE_LOT)
+    emission = EmissionLot(s, taille_lot)
+    lot = [(bytes(taille_datagramme),)] * taille_lot
+    octets_lot = taille_lot * (taille_datagramme + limiteur.surcout(taille_datagramme))
+    octets = 0
+    debut = fin = None
+    while fin is None or fin - debut < duree:
+        limiteur.limiter_debit()
+        fin = time.monotonic()
+        if debut is None:
+            debut = fin
+        else:
+            # octets émis entre le premier lot et celui-ci (exclu)
+            octets += octets_lot
+        limiteur.ajouter_donnees(emission.envoyer(lot, (ADRESSE_BENCH, port)), len(lot))
+    s.close()
+    return octets * 8 / 1000 / (fin - debut)
+
+def bench_debit():
+    "précision du LimiteurDebit entre 1 Mbps et 2 Gbps."
+    print("Mesure debit (%.0f s par consigne, tolerance %.0f%%):" % (DUREE_MESURE_DEBIT, 100*TOLERANCE_DEBIT))
+    puits, port = ouvrir_puits()
+    try:
+        for debit in DEBITS_BENCH:
+            # petits datagrammes aux faibles débits, pour avoir assez d'échantillons
+            taille = 1472 if debit <= 10000 else bftp.TAILLE_PAQUET
+            mesure = mesurer_debit(debit, taille, DUREE_MESURE_DEBIT, port)
+            ecart = (mesure - debit) / debit
+            verdict = "OK" if abs(ecart) <= TOLERANCE_DEBIT else "HORS TOLERANCE"
+            print(f"  consigne {debit:>8} Kbps, datagrammes de {taille:>5} octets :"
+                  f" {mesure:>10.0f} Kbps ({100*ecart:+.2f}%) {verdict}")
+    finally:
+        puits.close()
+
+
+#------------------------------------------------------------------------------
+# mesure "liens"
+#-------------------
+
+def bench_liens():
+    "paquets/s de envoyer() quand l'émission est répartie sur plusieurs liens."
+    print("Mesure liens (fichier de %d Mo, debit non limite):" % (TAILLE_FICHIER_BENCH >> 20))
+    chemin = creer_fichier(TAILLE_FICHIER_BENCH)
+    try:
+        for nb_liens in NB_LIENS_BENCH:
+            puits = [ouvrir_puits("127.0.0.%d" % (i + 1)) for i in range(nb_liens)]
+            bftp.transport = bftp.Transport([("127.0.0.%d" % (i + 1), port)
+                                             for i, (p, port) in enumerate(puits)])
+            limiteur = bftp.LimiteurDebit(DEBIT_ILLIMITE)
+            debut = time.perf_counter()
+            nb = bftp.envoyer(chemin, "bench.bin", limiteur, crc=0)
+            afficher("%d lien(s)" % nb_liens, nb, time.perf_counter() - debut)
+            print("    par lien: %s" % bftp.transport.nb_par_lien)
+            bftp.transport.fermer()
+            for p, port in puits:
+                p.close()
+    finally:
+        bftp.transport = None
+        os.remove(chemin)
+
+
+#------------------------------------------------------------------------------
+# mesure "fec"
+#-------------------
+
+class TransportPerte:
+    """remplace le Transport de bftp: garde une copie des datagrammes émis,
+    sauf ceux que la fonction perdu() déclare perdus."""
+
+    def __init__(self, perdu):
+        self.perdu = perdu
+        self.datagrammes = []
+        self.nb_emis = 0
+
+    def envoyer(self, datagrammes):
+        octets = 0
+        for datagramme in datagrammes:
+            paquet = b"".join(datagramme)
+            octets += len(paquet)
+            self.nb_emis += 1
+            if not self.perdu():
+                self.datagrammes.append(paquet)
+        return octets
+
+def pertes_aleatoires(taux_perte, alea):
+    "canal à pertes indépendantes."
+    return lambda: alea.random() < taux_perte
+
+def transfert_avec_pertes(chemin, destination, perdu, tour=0, crc=None):
+    """un tour d'émission de chemin à travers TransportPerte, décodé par le
+    récepteur de bftp dans destination, dont la réception en cours est
+    conservée d'un tour à l'autre. Renvoie (complet, datagrammes émis)."""
+    bftp.transport = TransportPerte(perdu)
+    bftp.envoyer(chemin, "fec.bin", bftp.LimiteurDebit(DEBIT_ILLIMITE),
+                 crc=bftp.CalcCRC(chemin) if crc is None else crc, tour=tour)
+    paquet = bftp.Paquet()
+    for datagramme in bftp.transport.datagrammes:
+        paquet.decoder(datagramme)
+    recu = os.path.join(destination, "fec.bin")
+    complet = os.path.exists(recu) and filecmp.cmp(chemin, recu, shallow=False)
+    return complet, bftp.transport.nb_emis
+
+def fin_transfert(destination):
+    "abandonne la réception en cours et efface le fichier reçu."
+    for f in list(bftp.fichiers.values()):
+        f.annuler_reception()
+    bftp.fichiers.clear()
+    recu = os.path.join(destination, "fec.bin")
+    if os.path.exists(recu):
+        os.remove(recu)
+
+class Silence:
+    "pour faire taire les affichages de l'émetteur et du récepteur."
+
+    def __enter__(self):
+        self.sortie = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        logging.disable(logging.INFO)
+
+    def __exit__(self, *exc):
+        sys.stdout.close()
+        sys.stdout = self.sortie
+        logging.disable(logging.NOTSET)
+
+def preparer_reception():
+    "prépare le récepteur de bftp dans un répertoire temporaire, renvoyé."
+    destination = tempfile.mkdtemp(prefix='BFTP_bench_')
+    bftp.CHEMIN_DEST = bftp.path(destination)
+    bftp.stats = bftp.Stats()
+    return destination
+
+def bench_fec():
+    "fichiers complets en un tour malgré les pertes, selon les paramètres FEC."
+    print("Mesure fec (fichier de %d Mo, %.1f%% de pertes, %d essais par configuration):"
+          % (TAILLE_FICHIER_FEC >> 20, 100*TAUX_PERTE_FEC, NB_ESSAIS_FEC))
+    chemin = creer_fichier(TAILLE_FICHIER_FEC)
+    destination = preparer_reception()
+    try:
+        for fec_k, fec_r in CONFIGS_FEC:
+            bftp.FEC_K, bftp.FEC_R = fec_k, fec_r
+            perdu = pertes_aleatoires(TAUX_PERTE_FEC, random.Random(1))
+            nb_complets = nb_emis = 0
+            for essai in range(NB_ESSAIS_FEC):
+                with Silence():
+                    complet, emis = transfert_avec_pertes(chemin, destination, perdu)
+                    fin_transfert(destination)
+                nb_complets += complet
+                nb_emis += emis
+            nom = "sans FEC" if fec_k == 0 else "K=%d R=%d" % (fec_k, fec_r)
+            print(f"  {nom:<10} : {100*nb_complets/NB_ESSAIS_FEC:5.0f}% de fichiers complets en un tour,"
+                  f" {nb_emis/NB_ESSAIS_FEC:.0f} datagrammes par tour")
+    finally:
+        bftp.FEC_K, bftp.FEC_R = 0, 1
+        bftp.transport = None
+        shutil.rmtree(destination)
+        os.remove(chemin)
+
+
+#------------------------------------------------------------------------------
+# mesure "rafales"
+#-------------------
+
+class CanalRafales:
+    """canal de Gilbert-Elliott (pertes en rafales de LONGUEUR_RAFALE
+    datagrammes en moyenne, TAUX_PERTE_RAFALES de pertes en moyenne), avec en
+    plus une interférence périodique qui perd un datagramme sur
+    PERIODE_INTERFERENCE depuis le début de chaque tour."""
+
+    def __init__(self, alea):
+        self.alea = alea
+        self.en_rafale = False
+        self.p_fin = 1.0 / LONGUEUR_RAFALE
+        self.p_debut = TAUX_PERTE_RAFALES * self.p_fin / (1 - TAUX_PERTE_RAFALES)
+        self.position = 0
+
+    def nouveau_tour(self):
+        self.position = 0
+
+    def __call__(self):
+        self.position += 1
+        if self.en_rafale:
+            self.en_rafale = self.alea.random() >= self.p_fin
+        else:
+            self.en_rafale = self.alea.random() < self.p_debut
+        return self.en_rafale or self.position % PERIODE_INTERFERENCE == 0
+
+def bench_rafales():
+    "tours d'émission nécessaires sur un canal à pertes en rafales."
+    print("Mesure rafales (fichier de %d Mo, %.0f%% de pertes par rafales de %d, 1 perte sur %d"
+          " periodique, %d essais):" % (TAILLE_FICHIER_RAFALES >> 20, 100*TAUX_PERTE_RAFALES,
+          LONGUEUR_RAFALE, PERIODE_INTERFERENCE, NB_ESSAIS_RAFALES))
+    chemin = creer_fichier(TAILLE_FICHIER_RAFALES)
+    crc = bftp.CalcCRC(chemin)
+    destination = preparer_reception()
+    try:
+        for profondeur, fec_k, fec_r in CONFIGS_RAFALES:
+            bftp.ENTRELACEMENT, bftp.FEC_K, bftp.FEC_R = profondeur, fec_k, fec_r
+            canal = CanalRafales(random.Random(1))
+            nb_tours = []
+            for essai in range(NB_ESSAIS_RAFALES):
+                with Silence():
+                    for tour in range(MAX_TOURS_RAFALES):
+                        canal.nouveau_tour()
+                        complet, emis = transfert_avec_pertes(chemin, destination, canal, tour, crc)
+                        if complet:
+                            break
+                    fin_transfert(destination)
+                nb_tours.append(tour + 1 if complet else None)
+            termines = [n for n in nb_tours if n is not None]
+            nom = ("entrelacement %d" % profondeur if profondeur else "sequentiel") + \
+                  (", FEC K=%d R=%d" % (fec_k, fec_r) if fec_k else "")
+            moyenne = "%.1f" % (sum(termines) / len(termines)) if termines else "-"
+            print(f"  {nom:<32} : {moyenne:>4} tours en moyenne,"
+                  f" {NB_ESSAIS_RAFALES - len(termines)} non recus apres {MAX_TOURS_RAFALES} tours")
+    finally:
+        bftp.ENTRELACEMENT, bftp.FEC_K, bftp.FEC_R = 0, 0, 1
+        bftp.transport = None
+        shutil.rmtree(destination)
+        os.remove(chemin)
+
+
+#------------------------------------------------------------------------------
+# mesure "petits"
+#-------------------
+
+def bench_petits():
+    "fichiers/s pour de nombreux petits fichiers, avec et sans regroupement."
+    print("Mesure petits (%d fichiers de %d octets, debit non limite):"
+          % (NB_PETITS_FICHIERS, TAILLE_PETIT_FICHIER))
+    repertoire = tempfile.mkdtemp(prefix='BFTP_bench_')
+    puits, port = ouvrir_puits()
+    bftp.transport = bftp.Transport((ADRESSE_BENCH, port))
+    try:
+        chemins = []
+        for i in range(NB_PETITS_FICHIERS):
+            chemin = os.path.join(repertoire, "conf%05d.ini" % i)
+            with open(chemin, 'wb') as f:
+                f.write(os.urandom(TAILLE_PETIT_FICHIER))
+            chemins.append(chemin)
+        limiteur = bftp.LimiteurDebit(DEBIT_ILLIMITE)
+        with Silence():
+            debut = time.perf_counter()
+            for chemin in chemins:
+                with bftp.FichierMappe(chemin) as source:
+                    bftp.envoyer(chemin, os.path.basename(chemin), limiteur, crc=0, source=source)
+            duree_seul = time.perf_counter() - debut
+            debut = time.perf_counter()
+            petits = []
+            for chemin in chemins:
+                with bftp.FichierMappe(chemin) as source:
+                    donnees = bytes(source.tranche(0, source.taille))
+                    petits.append((os.path.basename(chemin), donnees,
+                                   int(os.fstat(source.fichier.fileno()).st_mtime),
+                                   binascii.crc32(donnees)))
+            bftp.envoyer_petits_fichiers(petits, limiteur)
+            duree_groupe = time.perf_counter() - debut
+        for nom, duree in (("un envoi par fichier", duree_seul), ("paquets multi-fichiers", duree_groupe)):
+            print(f"  {nom:<28} {NB_PETITS_FICHIERS:>8} fichiers en {duree:6.3f} s"
+                  f" : {NB_PETITS_FICHIERS/duree:>10.0f} fichiers/s")
+    finally:
+        bftp.transport.fermer()
+        bftp.transport = None
+        puits.close()
+        shutil.rmtree(repertoire)
+
+
+#------------------------------------------------------------------------------
+# mesure "compression"
+#-------------------
+
+def creer_journal(taille):
+    "crée un fichier temporaire de type journal CSV, renvoie son chemin."
+    fd, chemin = tempfile.mkstemp(prefix='BFTP_bench_')
+    alea = random.Random(1)
+    with os.fdopen(fd, 'w') as f:
+        n = 0
+        while f.tell() < taille:
+            f.write("%d;2026-10-17 12:%02d:%02d;capteur%03d;%d;%s\n" % (n, n // 60 % 60, n % 60,
+                    alea.randrange(200), alea.randrange(100000), alea.choice(("OK", "ALERTE", "OK"))))
+            n += 1
+    return chemin
+
+def bench_compression():
+    "débit utile effectif avec la compression adaptative, selon le débit du lien."
+    print("Mesure compression (fichiers de %d Mo):" % (TAILLE_FICHIER_COMPRESSION >> 20))
+    for nom, chemin in (("journal CSV", creer_journal(TAILLE_FICHIER_COMPRESSION)),
+                        ("aleatoire", creer_fichier(TAILLE_FICHIER_COMPRESSION))):
+        try:
+            with bftp.FichierMappe(chemin) as source:
+                for debit in DEBITS_COMPRESSION:
+                    methode, niveau = Compression.choisir_compression(source, debit * 1000)
+                    debut = time.perf_counter()
+                    if methode == Compression.AUCUNE:
+                        taille_flux = source.taille
+                    else:
+                        flux = Compression.FluxCompresse(source, methode, niveau)
+                        taille_flux = flux.taille
+                        flux.fermer()
+                    duree_compression = time.perf_counter() - debut
+                    # compression et émission se recouvrent dans le pipeline d'émission
+                    duree = max(duree_compression, taille_flux * 8 / (debit * 1000))
+                    utile = source.taille * 8 / 1000 / duree
+                    print(f"  {nom:<12} lien {debit:>8} Kbps : {Compression.nom_compression(methode, niveau):<7}"
+                          f" ratio {taille_flux/source.taille:4.2f}, compression {duree_compression:5.2f} s,"
+                          f" debit utile {utile:>9.0f} Kbps (x{utile/debit:.1f})")
+        finally:
+            os.remove(chemin)
+
+
+#------------------------------------------------------------------------------
+# mesure "delta"
+#-------------------
+
+def emettre_et_recevoir(chemin, source, patch=None):
+    """émet chemin (en entier ou sous forme de patch) sans pertes et le fait
+    décoder par le récepteur de bftp. Renvoie (octets émis, durée de réception)."""
+    bftp.transport = TransportPerte(lambda: False)
+    bftp.envoyer(chemin, "fec.bin", bftp.LimiteurDebit(DEBIT_ILLIMITE),
+                 crc=patch.crc32 if patch else bftp.CalcCRC(chemin), source=source, patch=patch)
+    octets = sum(len(d) for d in bftp.transport.datagrammes)
+    paquet = bftp.Paquet()
+    debut = time.perf_counter()
+    for datagramme in bftp.transport.datagrammes:
+        paquet.decoder(datagramme)
+    return octets, time.perf_counter() - debut
+
+def bench_delta():
+    "volume émis et durées pour un fichier modifié, en entier ou par patch."
+    print("Mesure delta (fichier de %d Mo, %d blocs de %d Ko modifies):"
+          % (TAILLE_FICHIER_DELTA >> 20, NB_BLOCS_MODIFIES, Delta.TAILLE_BLOC >> 10))
+    chemin = creer_fichier(TAILLE_FICHIER_DELTA)
+    destination = preparer_reception()
+    recu = os.path.join(destination, "fec.bin")
+    try:
+        with bftp.FichierMappe(chemin) as source:
+            crc_base, empreintes_base = Delta.calculer_empreintes(source)
+        # version de base présente à destination, avec la date de l'émetteur
+        shutil.copyfile(chemin, recu)
+        date_base = int(os.path.getmtime(chemin))
+        os.utime(recu, (date_base, date_base))
+        alea = random.Random(1)
+        nb_blocs = TAILLE_FICHIER_DELTA // Delta.TAILLE_BLOC
+        with open(chemin, 'r+b') as f:
+            for i in alea.sample(range(nb_blocs), NB_BLOCS_MODIFIES):
+                f.seek(i * Delta.TAILLE_BLOC + alea.randrange(Delta.TAILLE_BLOC - 16))
+                f.write(os.urandom(16))
+        os.utime(chemin, (date_base + 60, date_base + 60))
+        with Silence(), bftp.FichierMappe(chemin) as source:
+            debut = time.perf_counter()
+            crc, empreintes = Delta.calculer_empreintes(source)
+            patch = Delta.preparer_patch(source, crc, empreintes,
+                (TAILLE_FICHIER_DELTA, date_base, crc_base), empreintes_base)
+            duree_patch = time.perf_counter() - debut
+            octets_patch, duree_reception = emettre_et_recevoir(chemin, source, patch)
+            patch.fermer()
+            identique = filecmp.cmp(chemin, recu, shallow=False)
+            fin_transfert(destination)
+            octets_complet, duree_complet = emettre_et_recevoir(chemin, source)
+            fin_transfert(destination)
+        print(f"  fichier entier : {octets_complet/2**20:9.1f} Mo emis, reception {duree_complet:5.2f} s")
+        print(f"  patch          : {octets_patch/2**20:9.1f} Mo emis (/{octets_complet/octets_patch:.0f}),"
+              f" preparation {duree_patch:5.2f} s, reconstruction {duree_reception:5.2f} s,"
+              f" fichier reconstruit {'identique' if identique else 'DIFFERENT'}")
+    finally:
+        os.remove(chemin)
+        shutil.rmtree(destination)
+
+
+#------------------------------------------------------------------------------
+# mesure "dedup"
+#-------------------
+
+def bench_dedup():
+    "volume émis et durée de réception pour des copies d'un même fichier."
+    print("Mesure dedup (%d copies d'un fichier de %d Mo):" % (NB_COPIES_DEDUP, TAILLE_FICHIER_DEDUP >> 20))
+    chemin = creer_fichier(TAILLE_FICHIER_DEDUP)
+    destination = preparer_reception()
+    try:
+        crc = bftp.CalcCRC(chemin)
+        date_fichier = int(os.path.getmtime(chemin))
+        limiteur = bftp.LimiteurDebit(DEBIT_ILLIMITE)
+        noms = ["projet%02d/setup.exe" % i for i in range(NB_COPIES_DEDUP)]
+        resultats = []
+        with Silence():
+            for clones in (False, True):
+                bftp.transport = TransportPerte(lambda: False)
+                with bftp.FichierMappe(chemin) as source:
+                    for i, nom in enumerate(noms):
+                        if clones and i > 0:
+                            bftp.envoyer_clone(nom, noms[0], source.taille, date_fichier, crc, limiteur)
+                        else:
+                            bftp.envoyer(chemin, nom, limiteur, crc=crc, source=source)
+                octets = sum(len(d) for d in bftp.transport.datagrammes)
+                paquet = bftp.Paquet()
+                debut = time.perf_counter()
+                for datagramme in bftp.transport.datagrammes:
+                    paquet.decoder(datagramme)
+                duree = time.perf_counter() - debut
+                recus = sum(filecmp.cmp(chemin, os.path.join(destination, nom), shallow=False) for nom in noms)
+                resultats.append((octets, duree, recus))
+                shutil.rmtree(destination)
+                os.mkdir(destination)
+        for nom, (octets, duree, recus) in zip(("envoi de chaque copie", "copie puis clonages"), resultats):
+            print(f"  {nom:<22}: {octets/2**20:8.1f} Mo emis, reception {duree:5.2f} s,"
+                  f" {recus}/{NB_COPIES_DEDUP} fichiers identiques")
+    finally:
+        os.remove(chemin)
+        shutil.rmtree(destination)
+
+
+#------------------------------------------------------------------------------
+# mesure "mtu"
+#-------------------
+
+class RelaisPertes(threading.Thread):
+    """relais UDP sur la boucle locale qui simule un lien de MTU_RELAIS octets:
+    un datagramme est perdu si l'un de ses fragments IP l'est (chacun avec la
+    probabilité TAUX_PERTE_FRAGMENTS). Les datagrammes transmis sont relus
+    par un second thread et gardés dans la liste recus."""
+
+    def __init__(self, alea):
+        threading.Thread.__init__(self, daemon=True)
+        self.alea = alea
+        self.entree = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.entree.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8*1024*1024)
+        self.entree.bind((ADRESSE_BENCH, 0))
+        self.entree.settimeout(0.1)
+        self.port = self.entree.getsockname()[1]
+        self.reception = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.reception.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8*1024*1024)
+        self.reception.bind((ADRESSE_BENCH, 0))
+        self.reception.settimeout(0.1)
+        self.sortie = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.recus = []
+        self.nb_relayes = self.nb_perdus = 0
+        self.actif = True
+        self.lecteur = threading.Thread(target=self.lire, daemon=True)
+        self.lecteur.start()
+        self.start()
+
+    def run(self):
+        while self.actif:
+            try:
+                datagramme = self.entree.recv(65536)
+            except socket.timeout:
+                continue
+            nb_fragments = -(-(len(datagramme) + 8) // (MTU_RELAIS - 20))
+            if self.alea.random() < 1 - (1 - TAUX_PERTE_FRAGMENTS) ** nb_fragments:
+                self.nb_perdus += 1
+            else:
+                self.nb_relayes += 1
+                self.sortie.sendto(datagramme, self.reception.getsockname())
+
+    def lire(self):
+        while self.actif:
+            try:
+                self.recus.append(self.reception.recv(65536))
+            except socket.timeout:
+                pass
+
+    def attendre(self):
+        "attend la fin du relais des datagrammes émis, et renvoie les datagrammes reçus."
+        while True:
+            nb = self.nb_relayes + self.nb_perdus, len(self.recus)
+            time.sleep(0.3)
+            if nb == (self.nb_relayes + self.nb_perdus, len(self.recus)):
+                break
+        recus, self.recus = self.recus, []
+        return recus
+
+    def fermer(self):
+        self.actif = False
+        self.join()
+        self.lecteur.join()
+        for s in (self.entree, self.reception, self.sortie):
+            s.close()
+
+def bench_mtu():
+    "tours d'émission nécessaires à travers un relais à pertes de fragments."
+    print("Mesure mtu (fichier de %d Mo, lien de MTU %d avec %.1f%% de fragments perdus, %d essais):"
+          % (TAILLE_FICHIER_MTU >> 20, MTU_RELAIS, 100*TAUX_PERTE_FRAGMENTS, NB_ESSAIS_MTU))
+    chemin = creer_fichier(TAILLE_FICHIER_MTU)
+    crc = bftp.CalcCRC(chemin)
+    destination = preparer_reception()
+    relais = RelaisPertes(random.Random(1))
+    bftp.transport = bftp.Transport((ADRESSE_BENCH, relais.port))
+    try:
+        for mtu in MTUS_BENCH:
+            bftp.TAILLE_DATAGRAMME = bftp.taille_datagramme_mtu(mtu) if mtu else bftp.TAILLE_PAQUET
+            nb_tours, nb_emis, nb_perdus = [], 0, 0
+            for essai in range(NB_ESSAIS_MTU):
+                with Silence():
+                    for tour in range(MAX_TOURS_MTU):
+                        emis = bftp.transport.nb_datagrammes
+                        perdus = relais.nb_perdus
+                        bftp.envoyer(chemin, "fec.bin", bftp.LimiteurDebit(DEBIT_MTU), crc=crc, tour=tour)
+                        paquet = bftp.Paquet()
+                        for datagramme in relais.attendre():
+                            paquet.decoder(datagramme)
+                        nb_emis += bftp.transport.nb_datagrammes - emis
+                        nb_perdus += relais.nb_perdus - perdus
+                        recu = os.path.join(destination, "fec.bin")
+                        complet = os.path.exists(recu) and filecmp.cmp(chemin, recu, shallow=False)
+                        if complet:
+                            break
+                    fin_transfert(destination)
+                nb_tours.append(tour + 1 if complet else None)
+            termines = [n for n in nb_tours if n is not None]
+            moyenne = "%.1f" % (sum(termines) / len(termines)) if termines else "-"
+            nom = "datagrammes de %d octets" % bftp.TAILLE_DATAGRAMME
+            print(f"  {nom:<28} : {moyenne:>4} tours en moyenne, {100*nb_perdus/nb_emis:5.1f}% de datagrammes"
+                  f" perdus, {NB_ESSAIS_MTU - len(termines)} non recus apres {MAX_TOURS_MTU} tours")
+    finally:
+        bftp.TAILLE_DATAGRAMME = bftp.TAILLE_PAQUET
+        bftp.transport.fermer()
+        bftp.transport = None
+        relais.fermer()
+        shutil.rmtree(destination)
+        os.remove(chemin)
+
+
+#------------------------------------------------------------------------------
+# mesure "identifiants"
+#-------------------
+
+def bench_identifiants():
+    "coût du nom dans chaque paquet, comparé aux identifiants annoncés."
+    print("Mesure identifiants (fichier de %d Mo, chemin de %d octets, MTU 1500):"
+          % (TAILLE_FICHIER_IDENTIFIANTS >> 20, len(NOM_PROFOND)))
+    chemin = creer_fichier(TAILLE_FICHIER_IDENTIFIANTS)
+    crc = bftp.CalcCRC(chemin)
+    destination = preparer_reception()
+    recu = os.path.join(destination, NOM_PROFOND)
+    bftp.TAILLE_DATAGRAMME = bftp.taille_datagramme_mtu(1500)
+    try:
+        for identifiants in (False, True):
+            bftp.IDENTIFIANTS = identifiants
+            with Silence():
+                bftp.transport = TransportPerte(lambda: False)
+                bftp.envoyer(chemin, NOM_PROFOND, bftp.LimiteurDebit(DEBIT_ILLIMITE), crc=crc)
+                datagrammes = bftp.transport.datagrammes
+                paquet = bftp.Paquet()
+                debut = time.perf_counter()
+                for datagramme in datagrammes:
+                    paquet.decoder(datagramme)
+                duree = time.perf_counter() - debut
+                complet = filecmp.cmp(chemin, recu, shallow=False)
+                fin_transfert(destination)
+                os.remove(recu)
+                # avec pertes (annonces comprises): tours pour recevoir le fichier
+                alea = random.Random(1)
+                nb_tours = []
+                for essai in range(NB_ESSAIS_IDENTIFIANTS):
+                    for tour in range(MAX_TOURS_MTU):
+                        bftp.transport = TransportPerte(pertes_aleatoires(TAUX_PERTE_IDENTIFIANTS, alea))
+                        bftp.envoyer(chemin, NOM_PROFOND, bftp.LimiteurDebit(DEBIT_ILLIMITE), crc=crc)
+                        for datagramme in bftp.transport.datagrammes:
+                            paquet.decoder(datagramme)
+                        if os.path.exists(recu) and filecmp.cmp(chemin, recu, shallow=False):
+                            os.remove(recu)
+                            break
+                    fin_transfert(destination)
+                    nb_tours.append(tour + 1)
+            octets = sum(len(d) for d in datagrammes)
+            nom = "identifiant de 64 bits" if identifiants else "nom dans chaque paquet"
+            print(f"  {nom:<24}: {len(datagrammes):6d} datagrammes, {octets/2**20:6.2f} Mo emis,"
+                  f" decodage {1e6*duree/len(datagrammes):5.1f} us/paquet, recu {'oui' if complet else 'NON'},"
+                  f" {sum(nb_tours)/len(nb_tours):.1f} tours avec {100*TAUX_PERTE_IDENTIFIANTS:.0f}% de pertes")
+    finally:
+        bftp.IDENTIFIANTS = False
+        bftp.TAILLE_DATAGRAMME = bftp.TAILLE_PAQUET
+        bftp.transport = None
+        shutil.rmtree(destination)
+        os.remove(chemin)
+
+
+#------------------------------------------------------------------------------
+# mesure "ordonnancement"
+#-------------------
+
+def bench_ordonnancement():
+    "sélection des fichiers à émettre: tri à chaque boucle ou file de priorité."
+    print("Mesure ordonnancement (%d fichiers, %d emis et %d modifies par boucle):"
+          % (NB_FICHIERS_ORDONNANCEMENT, NB_EMIS_ORDONNANCEMENT, NB_MODIFIES_ORDONNANCEMENT))
+    alea = random.Random(1)
+    # état des fichiers, comme les attributs de DRef: [NbSend, LastSend, taille]
+    etat = {"rep%04d/fichier%07d.dat" % (i % 1000, i): [alea.randrange(3), alea.random() * 1e9,
+            alea.randrange(1 << 30)] for i in range(NB_FICHIERS_ORDONNANCEMENT)}
+    chemins = list(etat)
+    for nom in ("liste triee", "file de priorite"):
+        file = FilePriorite([("rep0001/", 10)])
+        debut = time.perf_counter()
+        if nom == "file de priorite":
+            for f, (nb_envois, date, taille) in etat.items():
+                file.mettre_a_jour(f, nb_envois, date, taille)
+        initialisation = time.perf_counter() - debut
+        duree = 0.0
+        for boucle in range(NB_BOUCLES_ORDONNANCEMENT):
+            modifies = alea.sample(chemins, NB_MODIFIES_ORDONNANCEMENT)
+            debut = time.perf_counter()
+            if nom == "liste triee":
+                # ancienne sélection: liste reconstruite puis triée (sortDictBy)
+                a_emettre = [{'file': f, 'iteration': etat[f][0]} for f in etat]
+                a_emettre = sorted(a_emettre, key=lambda x: x['iteration'])
+                emis = [element['file'] for element in a_emettre[:NB_EMIS_ORDONNANCEMENT]]
+            else:
+                for f in modifies:
+                    file.mettre_a_jour(f, 0, 0.0, etat[f][2])
+                parcours = file.parcourir()
+                emis = []
+                for f in parcours:
+                    emis.append(f)
+                    file.mettre_a_jour(f, etat[f][0] + 1, time.time(), etat[f][2])
+                    if len(emis) == NB_EMIS_ORDONNANCEMENT:
+                        break
+                parcours.close()
+            duree += time.perf_counter() - debut
+        print(f"  {nom:<17}: initialisation {initialisation:5.2f} s,"
+              f" {1000*duree/NB_BOUCLES_ORDONNANCEMENT:8.1f} ms par boucle")
+
+
+#------------------------------------------------------------------------------
+# mesure "partage"
+#-------------------
+
+def emetteurs_paralleles(limiteurs, actifs, duree):
+    """Emet vers un puits depuis un thread par limiteur, pendant duree
+    secondes; actifs[i](t) indique si l'émetteur i a des fichiers à émettre à
+    l'instant t. Renvoie les débits de chaque émetteur, en Kbps."""
+    puits, port = ouvrir_puits()
+    transport = bftp.Transport((ADRESSE_BENCH, port))
+    datagramme = (bytes(TAILLE_DATAGRAMME_PARTAGE),)
+    octets = [0] * len(limiteurs)
+    debut = time.monotonic()
+
+    def emettre(i):
+        while True:
+            t = time.monotonic() - debut
+            if t >= duree:
+                break
+            if not actifs[i](t):
+                time.sleep(0.001)
+                continue
+            limiteurs[i].limiter_debit()
+            n = transport.envoyer([datagramme])
+            limiteurs[i].ajouter_donnees(n)
+            octets[i] += n
+        if hasattr(limiteurs[i], 'fermer'):
+            limiteurs[i].fermer()
+
+    threads = [threading.Thread(target=emettre, args=(i,)) for i in range(len(limiteurs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    transport.fermer()
+    puits.close()
+    return [n * 8 / 1000 / duree for n in octets]
+
+def bench_partage():
+    "débit par arborescence émise en parallèle, avec et sans partage du débit."
+    print("Mesure partage (-l %d Kbps, datagrammes de %d octets):"
+          % (DEBIT_PARTAGE, TAILLE_DATAGRAMME_PARTAGE))
+    toujours = lambda t: True
+    # B n'a des fichiers à émettre qu'une demi-seconde sur deux
+    intermittent = lambda t: int(t * 2) % 2 == 0
+    scenarios = (
+        ("un LimiteurDebit par arborescence, poids ignores", False, (3, 1), (toujours, toujours)),
+        ("PartageDebit, poids 3 et 1", True, (3, 1), (toujours, toujours)),
+        ("PartageDebit, poids 1 et 1, B intermittent", True, (1, 1), (toujours, intermittent)),
+        ("PartageDebit, 4 arborescences de poids 1", True, (1, 1, 1, 1), (toujours,) * 4),
+    )
+    for nom, partage, poids, actifs in scenarios:
+        if partage:
+            commun = bftp.PartageDebit(DEBIT_PARTAGE)
+            limiteurs = [commun.part(p) for p in poids]
+        else:
+            limiteurs = [bftp.LimiteurDebit(DEBIT_PARTAGE) for p in poids]
+        debits = emetteurs_paralleles(limiteurs, actifs, DUREE_MESURE_PARTAGE)
+        detail = ", ".join(f"{chr(65+i)}={d:6.0f}" for i, d in enumerate(debits))
+        print(f"  {nom:<49}: total {sum(debits):6.0f} Kbps ({100*sum(debits)/DEBIT_PARTAGE:3.0f}% de -l), {detail}")
+
+
+#------------------------------------------------------------------------------
+# mesure "async"
+#-------------------
+
+class PuitsHorodate(threading.Thread):
+    "reçoit des datagrammes et note l'heure d'arrivée des heartbeats."
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.sock, self.port = ouvrir_puits()
+        self.sock.settimeout(0.2)
+        self.heartbeats = []
+        self.nb_datagrammes = 0
+        self.arret = threading.Event()
+
+    def run(self):
+        while not self.arret.is_set():
+            try:
+                donnees = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            self.nb_datagrammes += 1
+            if struct.unpack_from("!i", donnees)[0] & bftp.MASQUE_TYPE == bftp.PAQUET_HEARTBEAT:
+                self.heartbeats.append(time.monotonic())
+
+    def fermer(self):
+        self.arret.set()
+        self.join()
+        self.sock.close()
+
+def bench_async():
+    "heartbeat et émissions parallèles: émetteur synchrone ou moteur asyncio."
+    print("Mesure async (heartbeat toutes les %d ms pendant un transfert de %d Mo a %d Mbps;"
+          % (1000 * DELAI_HEARTBEAT_ASYNC, TAILLE_FICHIER_ASYNC >> 20, DEBIT_ASYNC // 1000))
+    print("              %d fichiers de %d Ko emis en parallele, debit non limite):"
+          % (NB_FICHIERS_ASYNC, TAILLE_PETIT_FICHIER_ASYNC >> 10))
+    gros = creer_fichier(TAILLE_FICHIER_ASYNC)
+    petits = [creer_fichier(TAILLE_PETIT_FICHIER_ASYNC) for i in range(NB_FICHIERS_ASYNC)]
+    try:
+        for asynchrone in (False, True):
+            puits = PuitsHorodate()
+            puits.start()
+            bftp.transport = bftp.Transport((ADRESSE_BENCH, puits.port), tampon_emission=4 << 20)
+            hb = bftp.HeartBeat()
+            hb.hb_delay = DELAI_HEARTBEAT_ASYNC
+            with Silence():
+                if asynchrone:
+                    bftp.moteur_async = bftp.MoteurAsync(bftp.transport)
+                    bftp.moteur_async.demarrer(hb)
+                else:
+                    hb.Th_envoyer_BoucleheartbeatT()
+                try:
+                    bftp.envoyer(gros, "gros.bin", bftp.LimiteurDebit(DEBIT_ASYNC), crc=0)
+                    heartbeats = list(puits.heartbeats)
+                    # nombre maximal de threads pendant les émissions parallèles
+                    nb_threads = threading.active_count()
+                    fin_mesure = threading.Event()
+                    def compter_threads():
+                        nonlocal nb_threads
+                        while not fin_mesure.wait(0.001):
+                            nb_threads = max(nb_threads, threading.active_count())
+                    compteur = threading.Thread(target=compter_threads)
+                    compteur.start()
+                    debut = time.perf_counter()
+                    if asynchrone:
+                        async def tous():
+                            limiteur = bftp.LimiteurDebit(DEBIT_ILLIMITE)
+                            return await asyncio.gather(*(bftp.envoyer_async(chemin, "p%03d.bin" % i,
+                                limiteur, crc=0) for i, chemin in enumerate(petits)))
+                        bftp.moteur_async.executer(tous())
+                    else:
+                        limiteur = bftp.LimiteurDebit(DEBIT_ILLIMITE)
+                        threads = [threading.Thread(target=bftp.envoyer, args=(chemin, "p%03d.bin" % i,
+                                   limiteur), kwargs={'crc': 0}) for i, chemin in enumerate(petits)]
+                        for thread in threads:
+                            thread.start()
+                        for thread in threads:
+                            thread.join()
+                    duree = time.perf_counter() - debut
+                    fin_mesure.set()
+                    compteur.join()
+                finally:
+                    if asynchrone:
+                        bftp.moteur_async.fermer()
+                        bftp.moteur_async = None
+                    else:
+                        hb.stop()
+            puits.fermer()
+            bftp.transport.fermer()
+            bftp.transport = None
+            intervalles = [1000 * (b - a) for a, b in zip(heartbeats, heartbeats[1:])]
+            nom = "moteur asyncio" if asynchrone else "synchrone + threads"
+            print(f"  {nom:<20}: heartbeat {len(heartbeats)} recus, intervalle"
+                  f" {min(intervalles):6.1f} a {max(intervalles):6.1f} ms;"
+                  f" {NB_FICHIERS_ASYNC} fichiers en {duree:5.2f} s, {nb_threads - 1} threads au plus")
+            time.sleep(DELAI_HEARTBEAT_ASYNC * 2)
+    finally:
+        os.remove(gros)
+        for chemin in petits:
+            os.remove(chemin)
+
+
+#------------------------------------------------------------------------------
+# mesure "reception"
+#-------------------
+
+def recevoir_recvfrom(sock, paquet, mesure=None):
+    """ancienne boucle de réception: un recvfrom, donc un objet bytes de
+    TAILLE_PAQUET réduit ensuite, par datagramme. mesure: appelée avant
+    chaque datagramme. Renvoie (datagrammes, appels système)."""
+    nb = 0
+    while True:
+        if mesure:
+            mesure()
+        try:
+            donnees, emetteur = sock.recvfrom(bftp.TAILLE_PAQUET)
+        except BlockingIOError:
+            return nb, nb + 1
+        paquet.decoder(donnees)
+        nb += 1
+
+def recevoir_lot(sock, paquet, mesure=None):
+    "nouvelle boucle de réception, par ReceptionLot (cf. recevoir_recvfrom)."
+    reception = ReceptionLot(sock, bftp.TAILLE_LOT_RECEPTION, bftp.TAILLE_TAMPON_RECEPTION)
+    if mesure:
+        mesure()
+    while True:
+        lot = reception.recevoir()
+        if not lot:
+            return reception.nb_datagrammes, reception.nb_appels
+        for datagramme in lot:
+            paquet.decoder(datagramme)
+            if mesure:
+                mesure()
+
+class SansDecodage:
+    "à la place de Paquet, pour mesurer la réception seule."
+
+    def decoder(self, datagramme):
+        pass
+
+def remplir_socket(datagrammes):
+    """ouvre une socket de réception non bloquante au tampon assez grand, et
+    y met en attente tous les datagrammes."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, 33, TAMPON_RECEPTION)    # SO_RCVBUFFORCE
+    except OSError:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, TAMPON_RECEPTION)
+    sock.bind((ADRESSE_BENCH, 0))
+    sock.setblocking(False)
+    emetteur = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for datagramme in datagrammes:
+        emetteur.sendto(datagramme, sock.getsockname())
+    emetteur.close()
+    return sock
+
+def bench_reception():
+    "paquets/s et allocations de la boucle de réception, recvfrom ou ReceptionLot."
+    print("Mesure reception (fichier de %d Mo en datagrammes de MTU 1500, deja en attente"
+          " sur la socket):" % (TAILLE_FICHIER_RECEPTION >> 20))
+    chemin = creer_fichier(TAILLE_FICHIER_RECEPTION)
+    destination = preparer_reception()
+    recu = os.path.join(destination, "reception.bin")
+    bftp.TAILLE_DATAGRAMME = bftp.taille_datagramme_mtu(1500)
+    try:
+        with Silence():
+            bftp.transport = TransportPerte(lambda: False)
+            bftp.envoyer(chemin, "reception.bin", bftp.LimiteurDebit(DEBIT_ILLIMITE),
+                         crc=bftp.CalcCRC(chemin))
+            datagrammes = bftp.transport.datagrammes
+        for nom, recevoir in (("recvfrom", recevoir_recvfrom), ("ReceptionLot", recevoir_lot)):
+            durees_reception = []
+            for essai in range(NB_ESSAIS_RECEPTION):
+                sock = remplir_socket(datagrammes)
+                debut = time.perf_counter()
+                recevoir(sock, SansDecodage())
+                durees_reception.append(time.perf_counter() - debut)
+                sock.close()
+            durees = []
+            for essai in range(NB_ESSAIS_RECEPTION):
+                sock = remplir_socket(datagrammes)
+                with Silence():
+                    debut = time.perf_counter()
+                    nb, nb_appels = recevoir(sock, bftp.Paquet())
+                    durees.append(time.perf_counter() - debut)
+                    complet = nb == len(datagrammes) and filecmp.cmp(chemin, recu, shallow=False)
+                    fin_transfert(destination)
+                    os.remove(recu)
+                sock.close()
+            # allocations: pic de mémoire allouée au cours de chaque paquet
+            # (tracemalloc), au-delà de la mémoire déjà allouée avant lui
+            sock = remplir_socket(datagrammes)
+            pics = []
+            def mesure():
+                if pics:
+                    pics[-1] = tracemalloc.get_traced_memory()[1] - pics[-1]
+                pics.append(tracemalloc.get_traced_memory()[0])
+                tracemalloc.reset_peak()
+            with Silence():
+                tracemalloc.start()
+                recevoir(sock, bftp.Paquet(), mesure)
+                tracemalloc.stop()
+                fin_transfert(destination)
+            sock.close()
+            pics.pop()
+            print(f"  {nom:<13}: {nb} datagrammes en {nb_appels:6d} appels systeme, reception seule"
+                  f" {nb/min(durees_reception):8.0f} paquets/s, avec decodage {nb/min(durees):6.0f} paquets/s,"
+                  f" {sum(pics)/len(pics):6.0f} octets alloues/paquet au plus fort, recu {'oui' if complet else 'NON'}")
+    finally:
+        bftp.TAILLE_DATAGRAMME = bftp.TAILLE_PAQUET
+        bftp.transport = None
+        shutil.rmtree(destination)
+        os.remove(chemin)
+
+
+#------------------------------------------------------------------------------
+# mesure "processus"
+#-------------------
+
+def recevoir_bftp(chemins, crcs, destination, debit, options_reception):
+    """émet chemins en un tour à debit (Kbps), en datagrammes de MTU 1500,
+    vers un récepteur bftp.py -r lancé avec options_reception. Renvoie le
+    nombre de fichiers reçus complets et le bilan de réception affiché par
+    le récepteur à son arrêt ("" sans bilan)."""
+    puits, port = ouvrir_puits()
+    puits.close()
+    with tempfile.TemporaryFile(mode='w+', errors='replace') as sortie:
+        recepteur = subprocess.Popen([sys.executable, "bftp.py", "-r", destination,
+            "-a", ADRESSE_BENCH, "-p", str(port)] + list(options_reception),
+            cwd=os.path.dirname(os.path.abspath(__file__)), start_new_session=True,
+            stdout=sortie, stderr=subprocess.DEVNULL)
+        time.sleep(DEMARRAGE_PROCESSUS)
+        bftp.transport = bftp.Transport((ADRESSE_BENCH, port))
+        limiteur = bftp.LimiteurDebit(debit)
+        with Silence():
+            for i, chemin in enumerate(chemins):
+                bftp.envoyer(chemin, "f%02d.bin" % i, limiteur, crc=crcs[i])
+        bftp.transport.fermer()
+        # derniers paquets en cours de traitement
+        time.sleep(ATTENTE_PROCESSUS)
+        os.killpg(recepteur.pid, signal.SIGINT)
+        recepteur.wait()
+        sortie.seek(0)
+        bilans = [ligne for ligne in sortie if ligne.startswith("Reception: ")]
+    recus = sum(filecmp.cmp(chemin, os.path.join(destination, "f%02d.bin" % i), shallow=False)
+                for i, chemin in enumerate(chemins)
+                if os.path.exists(os.path.join(destination, "f%02d.bin" % i)))
+    for nom in os.listdir(destination):
+        os.remove(os.path.join(destination, nom))
+    return recus, bilans[-1] if bilans else ""
+
+def bench_processus():
+    "fichiers reçus en un tour, selon le débit et le nombre de processus de réception."
+    print("Mesure processus (%d fichiers de %d Mo en datagrammes de MTU 1500, %d processeur(s)):"
+          % (NB_FICHIERS_PROCESSUS, TAILLE_FICHIER_PROCESSUS >> 20, os.cpu_count()))
+    chemins = [creer_fichier(TAILLE_FICHIER_PROCESSUS) for i in range(NB_FICHIERS_PROCESSUS)]
+    crcs = [bftp.CalcCRC(chemin) for chemin in chemins]
+    destination = tempfile.mkdtemp(prefix='BFTP_bench_')
+    bftp.TAILLE_DATAGRAMME = bftp.taille_datagramme_mtu(1500)
+    try:
+        for debit in DEBITS_PROCESSUS:
+            for nb_processus in NB_PROCESSUS_BENCH:
+                recus, bilan = recevoir_bftp(chemins, crcs, destination, debit,
+                                             ["--processus", str(nb_processus)])
+                print(f"  {debit//1000:5d} Mbps, {nb_processus} processus: {recus:3d}/{len(chemins)} fichiers complets")
+    finally:
+        bftp.TAILLE_DATAGRAMME = bftp.TAILLE_PAQUET
+        bftp.transport = None
+        shutil.rmtree(destination)
+        for chemin in chemins:
+            os.remove(chemin)
+
+
+#------------------------------------------------------------------------------
+# mesure "ecriture"
+#-------------------
+
+def bench_ecriture():
+    "fichiers reçus en un tour et pertes du noyau, avec ou sans threads d'écriture."
+    print("Mesure ecriture (%d fichiers de %d Mo en datagrammes de MTU 1500, %d processeur(s)):"
+          % (NB_FICHIERS_PROCESSUS, TAILLE_FICHIER_PROCESSUS >> 20, os.cpu_count()))
+    chemins = [creer_fichier(TAILLE_FICHIER_PROCESSUS) for i in range(NB_FICHIERS_PROCESSUS)]
+    crcs = [bftp.CalcCRC(chemin) for chemin in chemins]
+    destination = tempfile.mkdtemp(prefix='BFTP_bench_')
+    bftp.TAILLE_DATAGRAMME = bftp.taille_datagramme_mtu(1500)
+    try:
+        for debit in DEBITS_ECRITURE:
+            for nb_ecrivains, tampon in ECRITURE_BENCH:
+                options_reception = ["--ecrivains", str(nb_ecrivains)]
+                if tampon:
+                    options_reception += ["--rcvbuf", str(tampon)]
+                recus, bilan = recevoir_bftp(chemins, crcs, destination, debit, options_reception)
+                pertes = re.search(r"(\d+) datagramme\(s\) perdu\(s\) par le noyau", bilan)
+                file = re.search(r"\(max (\d+), (\d+) Ko\)", bilan)
+                print(f"  {debit//1000:5d} Mbps, {nb_ecrivains} thread(s) d'ecriture, tampon "
+                      f"{(str(tampon) + ' Ko') if tampon else 'par defaut':>10s}: "
+                      f"{recus:3d}/{len(chemins)} fichiers complets, "
+                      f"{pertes.group(1) if pertes else '?':>6s} datagrammes perdus par le noyau"
+                      + (f", file d'ecriture max {file.group(1)} datagrammes ({file.group(2)} Ko)"
+                         if file else ""))
+    finally:
+        bftp.TAILLE_DATAGRAMME = bftp.TAILLE_PAQUET
+        bftp.transport = None
+        shutil.rmtree(destination)
+        for chemin in chemins:
+            os.remove(chemin)
+
+
+#------------------------------------------------------------------------------
+# mesure "destination"
+#-------------------
+
+def octets_ecrits():
+    "octets passés aux appels système d'écriture par ce processus (Linux)."
+    with open("/proc/self/io") as f:
+        for ligne in f:
+            if ligne.startswith("wchar:"):
+                return int(ligne.split()[1])
+
+def _reception_ancienne(datagrammes, destination):
+    """reproduction du stockage d'origine du récepteur: chaque paquet écrit
+    dans un NamedTemporaryFile (seek, write, flush), puis recopie complète à
+    destination avec calcul du CRC32."""
+    temp = tempfile.NamedTemporaryFile(prefix='BFTP_')
+    for datagramme in datagrammes:
+        entete = bftp.ENTETE.unpack_from(datagramme)
+        longueur_nom, taille_donnees, offset = entete[1:4]
+        temp.seek(offset)
+        temp.write(datagramme[bftp.TAILLE_ENTETE + longueur_nom:])
+        temp.flush()
+    temp.seek(0)
+    crc32 = 0
+    with open(os.path.join(destination, "fec.bin"), 'wb') as f_dest:
+        for buffer in iter(lambda: temp.read(16384), b''):
+            f_dest.write(buffer)
+            crc32 = binascii.crc32(buffer, crc32)
+    temp.close()
+    return crc32
+
+def bench_destination():
+    "octets écrits et durée de réception, recopie depuis un fichier temporaire ou écriture en place."
+    print("Mesure destination (fichier de %d Mo, temporaires et reception dans %s):"
+          % (TAILLE_FICHIER_DESTINATION >> 20, tempfile.gettempdir()))
+    chemin = creer_fichier(TAILLE_FICHIER_DESTINATION)
+    destination = preparer_reception()
+    try:
+        bftp.transport = TransportPerte(lambda: False)
+        with Silence():
+            bftp.envoyer(chemin, "fec.bin", bftp.LimiteurDebit(DEBIT_ILLIMITE), crc=bftp.CalcCRC(chemin))
+        datagrammes = bftp.transport.datagrammes
+        for nom in ("ancien", "en place"):
+            ecrits = octets_ecrits()
+            debut = time.perf_counter()
+            with Silence():
+                if nom == "ancien":
+                    _reception_ancienne(datagrammes, destination)
+                else:
+                    paquet = bftp.Paquet()
+                    for datagramme in datagrammes:
+                        paquet.decoder(datagramme)
+            duree = time.perf_counter() - debut
+            ecrits = octets_ecrits() - ecrits
+            identique = filecmp.cmp(chemin, os.path.join(destination, "fec.bin"), shallow=False)
+            fin_transfert(destination)
+            print(f"  {nom:9s}: {ecrits/2**20:7.1f} Mo ecrits ({ecrits/TAILLE_FICHIER_DESTINATION:.2f}"
+                  f" par octet recu), reception {duree:5.2f} s, fichier {'identique' if identique else 'DIFFERENT'}")
+    finally:
+        bftp.transport = None
+        os.remove(chemin)
+        shutil.rmtree(destination)
+
+
+#------------------------------------------------------------------------------
+# mesure "crc"
+#-------------------
+
+def bench_crc():
+    "fin de réception d'un gros fichier: CRC32 combiné au fil des paquets ou relecture."
+    print("Mesure crc (fichier de %d Mo, paquets dans le desordre):" % (TAILLE_FICHIER_DESTINATION >> 20))
+    chemin = creer_fichier(TAILLE_FICHIER_DESTINATION)
+    crc = bftp.CalcCRC(chemin)
+    destination = preparer_reception()
+    recu = os.path.join(destination, "fec.bin")
+    try:
+        for mtu in MTU_CRC:
+            bftp.TAILLE_DATAGRAMME = bftp.taille_datagramme_mtu(mtu) if mtu else bftp.TAILLE_PAQUET
+            bftp.transport = TransportPerte(lambda: False)
+            with Silence():
+                bftp.envoyer(chemin, "fec.bin", bftp.LimiteurDebit(DEBIT_ILLIMITE), crc=crc)
+            datagrammes = bftp.transport.datagrammes
+            random.Random(1).shuffle(datagrammes)
+            paquet = bftp.Paquet()
+            with Silence():
+                debut = time.perf_counter()
+                for datagramme in datagrammes[:-1]:
+                    paquet.decoder(datagramme)
+                duree = time.perf_counter() - debut
+                debut = time.perf_counter()
+                paquet.decoder(datagrammes[-1])
+                fin = time.perf_counter() - debut
+            identique = filecmp.cmp(chemin, recu, shallow=False)
+            # ce que coûtait le contrôle final: relecture du fichier reçu (en cache)
+            debut = time.perf_counter()
+            bftp.CalcCRC(recu)
+            relecture = time.perf_counter() - debut
+            fin_transfert(destination)
+            print(f"  {'MTU ' + str(mtu) if mtu else '64 Ko':8s}: {len(datagrammes):6d} paquets recus en {duree:5.2f} s,"
+                  f" dernier paquet -> fichier en place {fin*1000:6.1f} ms"
+                  f" (relecture et CRC32 du fichier: {relecture*1000:6.1f} ms),"
+                  f" fichier {'identique' if identique else 'DIFFERENT'}")
+    finally:
+        bftp.TAILLE_DATAGRAMME = bftp.TAILLE_PAQUET
+        bftp.transport = None
+        os.remove(chemin)
+        shutil.rmtree(destination)
+
+
+#------------------------------------------------------------------------------
+# mesure "reprise"
+#-------------------
+
+def bench_reprise():
+    "tours d'émission avec un redémarrage du récepteur après chacun, sans ou avec --etat."
+    print("Mesure reprise (fichier de %d Mo en MTU 1500, %.0f%% de pertes, recepteur redemarre"
+          " apres chaque tour):" % (TAILLE_FICHIER_REPRISE >> 20, 100*TAUX_PERTE_REPRISE))
+    chemin = creer_fichier(TAILLE_FICHIER_REPRISE)
+    crc = bftp.CalcCRC(chemin)
+    destination = preparer_reception()
+    etat = tempfile.mkdtemp(prefix='BFTP_etat_')
+    bftp.TAILLE_DATAGRAMME = bftp.taille_datagramme_mtu(1500)
+    try:
+        for repertoire_etat in (None, etat):
+            bftp.REPERTOIRE_ETAT = repertoire_etat
+            alea = random.Random(1)
+            sauvegarde = reprise = 0.0
+            with Silence():
+                for tour in range(MAX_TOURS_REPRISE):
+                    complet, nb_emis = transfert_avec_pertes(chemin, destination,
+                        pertes_aleatoires(TAUX_PERTE_REPRISE, alea), tour, crc)
+                    if complet:
+                        break
+                    # redémarrage: sauvegarde (ou abandon) à l'arrêt, puis
+                    # reprise à l'arrivée du premier paquet du tour suivant
+                    debut = time.perf_counter()
+                    bftp.fermer_receptions()
+                    sauvegarde = max(sauvegarde, time.perf_counter() - debut)
+                    if repertoire_etat is not None:
+                        bftp.charger_points_reprise()
+                        taille_etat = sum(os.path.getsize(os.path.join(etat, nom)) for nom in os.listdir(etat))
+                        bftp.transport = TransportPerte(lambda: False)
+                        bftp.envoyer(chemin, "fec.bin", bftp.LimiteurDebit(DEBIT_ILLIMITE), crc=crc, tour=tour)
+                        debut = time.perf_counter()
+                        bftp.Paquet().decoder(bftp.transport.datagrammes[0])
+                        reprise = max(reprise, time.perf_counter() - debut)
+                        bftp.fermer_receptions()
+                        bftp.charger_points_reprise()
+            fin_transfert(destination)
+            tours = "%d" % (tour + 1) if complet else "> %d" % MAX_TOURS_REPRISE
+            if repertoire_etat is None:
+                print(f"  sans --etat: fichier recu en {tours} tours (reception recommencee a chaque redemarrage)")
+            else:
+                print(f"  avec --etat: fichier recu en {tours} tours, point de reprise de {taille_etat // 1024} Ko,"
+                      f" sauvegarde (fsync compris) {sauvegarde*1000:.1f} ms, reprise {reprise*1000:.1f} ms")
+    finally:
+        bftp.REPERTOIRE_ETAT = None
+        bftp.TAILLE_DATAGRAMME = bftp.TAILLE_PAQUET
+        bftp.transport = None
+        os.remove(chemin)
+        shutil.rmtree(destination)
+        shutil.rmtree(etat)
+
+MESURES = {
+    'envoi': bench_envoi,
+    'debit': bench_debit,
+    'liens': bench_liens,
+    'fec': bench_fec,
+    'rafales': bench_rafales,
+    'petits': bench_petits,
+    'compression': bench_compression,
+    'delta': bench_delta,
+    'dedup': bench_dedup,
+    'mtu': bench_mtu,
+    'identifiants': bench_identifiants,
+    'ordonnancement': bench_ordonnancement,
+    'partage': bench_partage,
+    'async': bench_async,
+    'reception': bench_reception,
+    'processus': bench_processus,
+    'ecriture': bench_ecriture,
+    'destination': bench_destination,
+    'crc': bench_crc,
+    'reprise': bench_reprise,
+}
+
+#==============================================================================
+# PROGRAMME PRINCIPAL
+#=====================
+if __name__ == '__main__':
+    noms = sys.argv[1:] or list(MESURES)
+    for nom in noms:
+        if nom not in MESURES:
+            print(__doc__)
+            sys.exit(1)
+    for nom in noms:
+        MESURES[nom]()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import sys
+import sys, os
 import configparser
 from modules.OptionParser_doc import OptionParser_doc
 
@@ -21,11 +21,70 @@ def analyse_conf():
             param = config.get("blindftp", key)
     return param
 
+def analyse_liens(texte, adresse_defaut, port_defaut):
+    """Pour analyser une liste de liens "adresse[:port][*poids],..."
+    (port et poids par défaut: port_defaut et 1).
+    Renvoie une liste de tuples (adresse, port, poids)."""
+    liens = []
+    for element in texte.split(','):
+        element = element.strip()
+        poids = 1
+        if '*' in element:
+            element, poids = element.rsplit('*', 1)
+            poids = int(poids)
+            if poids < 1:
+                raise ValueError(f"poids invalide: {poids}")
+        adresse, port = element, port_defaut
+        if ':' in element:
+            adresse, port = element.rsplit(':', 1)
+            port = int(port)
+        liens.append((adresse or adresse_defaut, port, poids))
+    return liens
+
+def analyse_priorites(texte):
+    """Pour analyser une liste de règles de priorité "prefixe=priorite,..."
+    (chemins relatifs au répertoire synchronisé, priorité entière: les plus
+    hautes d'abord). Renvoie une liste de tuples (prefixe, priorite)."""
+    regles = []
+    for element in texte.split(','):
+        prefixe, separateur, priorite = element.strip().rpartition('=')
+        if not separateur:
+            raise ValueError(f"priorite manquante: {element}")
+        regles.append((prefixe.strip().lstrip('/'), int(priorite)))
+    return regles
+
+def analyse_racines(arguments):
+    """Pour analyser les arborescences à synchroniser "repertoire[=prefixe][*poids]"
+    (prefixe: répertoire destination sur le récepteur, poids dans le partage
+    du débit, 1 par défaut). Un argument qui est un répertoire existant est
+    pris tel quel. Avec plusieurs arborescences, le préfixe par défaut est le
+    nom du répertoire, et les préfixes doivent être distincts.
+    Renvoie une liste de tuples (repertoire, prefixe, poids)."""
+    racines = []
+    for element in arguments:
+        repertoire, prefixe, poids = element, "", 1
+        if not os.path.isdir(element):
+            if '*' in repertoire:
+                repertoire, poids = repertoire.rsplit('*', 1)
+                poids = int(poids)
+                if poids < 1:
+                    raise ValueError(f"poids invalide: {poids}")
+            if '=' in repertoire:
+                repertoire, prefixe = repertoire.rsplit('=', 1)
+        if len(arguments) > 1 and not prefixe.strip('/'):
+            prefixe = os.path.basename(os.path.normpath(repertoire))
+        racines.append((repertoire, prefixe.strip('/'), poids))
+    prefixes = [prefixe for repertoire, prefixe, poids in racines]
+    if len(set(prefixes)) != len(prefixes):
+        raise ValueError("prefixes en double")
+    return racines
+
 def analyse_options():
     """Pour analyser les options de ligne de commande.
     (à l'aide du module optparse)"""
 
-    parseur = OptionParser_doc(usage="%prog [options] <fichier ou repertoire>")
+    parseur = OptionParser_doc(usage="%prog [options] <fichier ou repertoire>\n"
+        "       %prog -s|-S [options] <repertoire[=prefixe][*poids]> [...]")
     parseur.doc = __doc__
 
     parseur.add_option("-e", "--envoi", action="store_true", dest="envoi_fichier",
@@ -40,8 +99,78 @@ def analyse_options():
         help="Adresse destination: Adresse IP ou nom de machine")
     parseur.add_option("-p", dest="port_UDP",
         help="Port UDP", type="int", default=36016)
+    parseur.add_option("--liens", dest="liens", default=None,
+        help="Liens sur lesquels repartir les datagrammes: adresse[:port][*poids],... "
+             "(en reception: adresses et ports d'ecoute)")
     parseur.add_option("-l", dest="debit",
         help="Limite du debit (Kbps)", type="int", default=8000)
+    parseur.add_option("--rafale", dest="rafale",
+        help="Taille maximale d'une rafale a plein debit (Ko)", type="int", default=128)
+    parseur.add_option("--lot", dest="taille_lot",
+        help="Nombre de datagrammes emis par appel systeme", type="int", default=32)
+    parseur.add_option("--sndbuf", dest="tampon_emission",
+        help="Taille du tampon d'emission de la socket (Ko)", type="int", default=None)
+    parseur.add_option("--rcvbuf", dest="tampon_reception",
+        help="Taille du tampon de reception des sockets (Ko)", type="int", default=None)
+    parseur.add_option("--dscp", dest="dscp",
+        help="Classe DSCP des datagrammes emis (0-63)", type="int", default=None)
+    parseur.add_option("--port-source", dest="port_source",
+        help="Port UDP source des datagrammes emis", type="int", default=None)
+    parseur.add_option("--mtu", dest="mtu", type="int", default=None,
+        help="MTU du lien: les datagrammes emis tiennent chacun dans une trame, sans "
+             "fragmentation IP (par exemple 1500 ou 9000). Par defaut, datagrammes de 64 Ko")
+    parseur.add_option("--identifiants", action="store_true", dest="identifiants", default=False,
+        help="Les paquets de donnees portent un identifiant de 64 bits au lieu du nom du fichier, "
+             "annonce regulierement dans des paquets dedies")
+    parseur.add_option("--priorite", dest="priorites", default=None,
+        help="Regles de priorite d'emission en synchronisation, \"prefixe=N,...\": les fichiers "
+             "dont le chemin commence par prefixe passent avant ceux de priorite inferieure "
+             "emis autant de fois (defaut 0)")
+    parseur.add_option("--async", action="store_true", dest="asynchrone", default=False,
+        help="Emission par une boucle asyncio: donnees, suppressions et heartbeat sur un "
+             "meme chemin d'emission, lecture des fichiers dans des threads")
+    parseur.add_option("--processus", dest="nb_processus", type="int", default=1,
+        help="En reception: nombre de processus recevant en parallele sur le meme port, "
+             "les paquets d'un meme fichier allant toujours au meme processus "
+             "(SO_REUSEPORT et filtre BPF, Linux)")
+    parseur.add_option("--ecrivains", dest="nb_ecrivains", type="int", default=0,
+        help="En reception: nombre de threads decodant et ecrivant les fichiers recus, la "
+             "boucle de reception ne faisant que capturer les datagrammes (0: tout dans "
+             "la boucle de reception)")
+    parseur.add_option("--etat", dest="repertoire_etat", default=None,
+        help="En reception: repertoire ou l'etat des fichiers en cours de reception est "
+             "sauvegarde regulierement et a l'arret, pour reprendre leur reception au "
+             "redemarrage sans perdre les paquets deja recus")
+    parseur.add_option("--pipeline", dest="profondeur_pipeline",
+        help="Nombre de fichiers prepares a l'avance pendant l'emission (0: pas de pipeline)",
+        type="int", default=4)
+    parseur.add_option("--preparateurs", dest="nb_preparateurs",
+        help="Nombre de threads de preparation des fichiers (CRC32, lecture)", type="int", default=2)
+    parseur.add_option("--fec", dest="fec_k",
+        help="Correction d'erreurs: paquets de reparation emis tous les K paquets (0: aucun)",
+        type="int", default=0)
+    parseur.add_option("--fec-r", dest="fec_r",
+        help="Nombre de paquets de reparation par groupe de K paquets", type="int", default=1)
+    parseur.add_option("--entrelacement", dest="entrelacement",
+        help="Profondeur d'entrelacement des paquets emis, en groupes de paquets "
+             "(0: ordre sequentiel; sinon l'ordre tourne a chaque emission du fichier)",
+        type="int", default=0)
+    parseur.add_option("--petits-fichiers", dest="petits_fichiers",
+        help="Taille maximale (octets) des fichiers regroupes a plusieurs dans un meme paquet "
+             "lors d'une synchronisation (0: pas de regroupement)", type="int", default=0)
+    parseur.add_option("--compression", dest="compression", default=None,
+        choices=["auto", "zlib", "lzma"],
+        help="Compression des fichiers synchronises: auto (methode choisie par fichier "
+             "d'apres le debit -l), zlib ou lzma. Les fichiers qui se compressent mal "
+             "sont envoyes tels quels")
+    parseur.add_option("--delta", action="store_true", dest="delta", default=False,
+        help="En synchronisation, un fichier modifie n'est envoye que sous forme de ses "
+             "blocs modifies (patch) par rapport a sa version precedente deja emise")
+    parseur.add_option("--dedup", action="store_true", dest="dedup", default=False,
+        help="En synchronisation, un fichier dont le contenu a deja ete livre sous un autre "
+             "chemin est recopie par le recepteur depuis ce chemin au lieu d'etre renvoye")
+    parseur.add_option("--crc-fin", action="store_true", dest="crc_fin",
+        default=False, help="CRC32 calcule pendant l'envoi et transmis en fin de fichier")
     parseur.add_option("-d", "--debug", action="store_true", dest="debug",
         default=False, help="Mode Debug")
     parseur.add_option("-b", "--boucle", dest="boucle", action="store", type="int", default=None,
@@ -57,8 +186,32 @@ def analyse_options():
     nb_actions = sum([options.envoi_fichier, options.synchro_arbo, options.synchro_arbo_stricte, options.recevoir])
     if nb_actions != 1:
         parseur.error(f"Vous devez indiquer une et une seule action. ({NOM_SCRIPT} -h pour l'aide complete)")
-    if len(args) != 1:
+    synchro = options.synchro_arbo or options.synchro_arbo_stricte
+    if len(args) != 1 and not (synchro and len(args) > 1):
         parseur.error(f"Vous devez indiquer un et un seul fichier/repertoire. ({NOM_SCRIPT} -h pour l'aide complete)")
+    options.racines = []
+    if synchro:
+        try:
+            options.racines = analyse_racines(args)
+        except ValueError as e:
+            parseur.error(f"Arborescences a synchroniser invalides ({e})")
+    if options.mtu is not None and not (576 <= options.mtu <= 65535):
+        parseur.error("MTU invalide: il faut 576 <= MTU <= 65535")
+    if options.nb_processus < 1:
+        parseur.error("Nombre de processus de reception invalide: il faut N >= 1")
+    if options.nb_ecrivains < 0:
+        parseur.error("Nombre de threads d'ecriture invalide: il faut N >= 0")
+    if options.fec_k < 0 or not (1 <= options.fec_r <= max(options.fec_k, 1)):
+        parseur.error("Parametres FEC invalides: il faut K >= 0 et 1 <= R <= K")
+    if options.liens:
+        try:
+            options.liens = analyse_liens(options.liens, options.adresse, options.port_UDP)
+        except ValueError as e:
+            parseur.error(f"Liste de liens invalide ({e})")
+    try:
+        options.priorites = analyse_priorites(options.priorites) if options.priorites else []
+    except ValueError as e:
+        parseur.error(f"Regles de priorite invalides ({e})")
     
     return (options, args)
 
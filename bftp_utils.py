@@ -26,6 +26,14 @@ def chemin_interdit(chemin):
             return True
     return False
 
+def entier_signe32(valeur):
+    """Convertit un entier non signé 32 bits (ex: CRC32) en entier signé,
+    tel qu'attendu par le format "i" de l'entête."""
+    valeur &= 0xFFFFFFFF
+    if valeur > 0x7FFFFFFF:
+        valeur -= 0x100000000
+    return valeur
+
 def augmenter_priorite():
     """Augmente la priorité du processus."""
     try:
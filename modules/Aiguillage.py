@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+----------------------------------------------------------------------------
+Aiguillage: répartition des paquets BFTP entre processus de réception.
+----------------------------------------------------------------------------
+
+version 0.01
+
+Plusieurs sockets UDP partagent le même port (SO_REUSEPORT). Un filtre BPF
+classique, attaché au groupe (SO_ATTACH_REUSEPORT_CBPF), choisit pour chaque
+datagramme la socket qui le reçoit, d'après une clé qui est la même pour
+tous les paquets d'un fichier:
+
+    paquet d'annonce: l'identifiant de 64 bits, après le nom annoncé
+    paquet portant un identifiant (drapeau): l'identifiant, après l'entête
+    autres paquets: NB_ECHANTILLONS+1 mots de 4 octets régulièrement
+                    espacés dans le nom, du premier au dernier (le
+                    filtre ne peut pas boucler sur tout le nom)
+
+La clé (32 bits, XOR des mots retenus) est mélangée par multiplication
+(hachage de Fibonacci) avant le modulo par le nombre de sockets. Les
+paquets sans nom (heartbeat, multi-fichiers) et les datagrammes trop
+courts vont à la première socket.
+
+Les noms de moins de 4 octets ont pour clé leur longueur. La méthode
+indice calcule en Python le même choix que le filtre.
+"""
+
+#=== IMPORTS ==================================================================
+
+import ctypes, socket, struct
+
+#=== CONSTANTES ===============================================================
+
+SO_ATTACH_REUSEPORT_CBPF = getattr(socket, 'SO_ATTACH_REUSEPORT_CBPF', 51)
+MULTIPLICATEUR = 0x9E3779B1     # 2**32 / nombre d'or
+DECALAGE = 16
+NB_ECHANTILLONS = 8             # mots du nom aux positions (longueur-4)*j/8, j = 0..8
+
+# instructions BPF classiques (linux/filter.h)
+BPF_LD, BPF_LDX, BPF_ST, BPF_ALU, BPF_JMP, BPF_RET, BPF_MISC = 0x00, 0x01, 0x02, 0x04, 0x05, 0x06, 0x07
+BPF_W, BPF_IMM, BPF_ABS, BPF_IND, BPF_MEM = 0x00, 0x00, 0x20, 0x40, 0x60
+BPF_SUB, BPF_MUL, BPF_AND, BPF_RSH, BPF_MOD, BPF_XOR = 0x10, 0x20, 0x50, 0x70, 0x90, 0xa0
+BPF_JA, BPF_JEQ, BPF_JGE, BPF_JSET = 0x00, 0x10, 0x30, 0x40
+BPF_K, BPF_X, BPF_A = 0x00, 0x08, 0x10
+BPF_TAX, BPF_TXA = 0x00, 0x80
+
+class sock_filter(ctypes.Structure):
+	_fields_ = [("code", ctypes.c_uint16),
+	            ("jt", ctypes.c_uint8),
+	            ("jf", ctypes.c_uint8),
+	            ("k", ctypes.c_uint32)]
+
+#------------------------------------------------------------------------------
+# classe Aiguillage
+#--------------------------
+
+class Aiguillage:
+	"""Filtre BPF d'aiguillage des paquets entre nb_sockets sockets."""
+
+	def __init__(self, nb_sockets, taille_entete, type_annonce, drapeau_identifiant):
+		"""constructeur d'Aiguillage.
+
+		nb_sockets: nombre de sockets du groupe SO_REUSEPORT.
+		taille_entete: taille de l'entête BFTP (le nom ou l'identifiant suit).
+		type_annonce: type des paquets d'annonce d'identifiant.
+		drapeau_identifiant: drapeau des paquets portant un identifiant.
+		"""
+		self.nb_sockets = nb_sockets
+		self.taille_entete = taille_entete
+		self.type_annonce = type_annonce
+		self.drapeau_identifiant = drapeau_identifiant
+
+	def programme(self):
+		"""instructions du filtre: liste de (code, jt, jf, k). Les sauts
+		sont relatifs à l'instruction suivante."""
+		e = self.taille_entete
+		# (code, étiquette si vrai, étiquette si faux, k), ou étiquette seule
+		source = [
+			(BPF_LD|BPF_W|BPF_ABS, None, None, 0),      # A = type et drapeaux
+			(BPF_ST, None, None, 0),                    # M[0] = A
+			(BPF_LD|BPF_W|BPF_ABS, None, None, 4),      # A = longueur du nom
+			(BPF_MISC|BPF_TAX, None, None, 0),          # X = longueur du nom
+			(BPF_LD|BPF_MEM, None, None, 0),
+			(BPF_ALU|BPF_AND|BPF_K, None, None, 0xFF),
+			(BPF_JMP|BPF_JEQ|BPF_K, "annonce", None, self.type_annonce),
+			(BPF_LD|BPF_MEM, None, None, 0),
+			(BPF_JMP|BPF_JSET|BPF_K, "identifiant", None, self.drapeau_identifiant),
+			# nom: clé d'après des mots échantillonnés, ou sa longueur s'il est court
+			(BPF_MISC|BPF_TXA, None, None, 0),
+			(BPF_JMP|BPF_JGE|BPF_K, None, "melange", 4),
+			(BPF_ST, None, None, 2),                    # M[2] = longueur du nom
+			(BPF_LD|BPF_IMM, None, None, 0),
+			(BPF_ST, None, None, 1),                    # M[1] = clé
+		]
+		for j in range(NB_ECHANTILLONS + 1):
+			source += [
+				(BPF_LD|BPF_MEM, None, None, 2),
+				(BPF_ALU|BPF_SUB|BPF_K, None, None, 4),
+				(BPF_ALU|BPF_MUL|BPF_K, None, None, j),
+				(BPF_ALU|BPF_RSH|BPF_K, None, None, 3),
+				(BPF_MISC|BPF_TAX, None, None, 0),
+				(BPF_LD|BPF_W|BPF_IND, None, None, e),
+				(BPF_LDX|BPF_MEM, None, None, 1),
+				(BPF_ALU|BPF_XOR|BPF_X, None, None, 0),
+				(BPF_ST, None, None, 1),
+			]
+		source += [
+			(BPF_JMP|BPF_JA, None, None, "melange"),
+			"identifiant",
+			(BPF_LD|BPF_W|BPF_ABS, None, None, e),
+			(BPF_MISC|BPF_TAX, None, None, 0),
+			(BPF_LD|BPF_W|BPF_ABS, None, None, e + 4),
+			(BPF_ALU|BPF_XOR|BPF_X, None, None, 0),
+			(BPF_JMP|BPF_JA, None, None, "melange"),
+			"annonce",
+			(BPF_LD|BPF_W|BPF_IND, None, None, e),
+			(BPF_ST, None, None, 1),
+			(BPF_LD|BPF_W|BPF_IND, None, None, e + 4),
+			(BPF_LDX|BPF_MEM, None, None, 1),
+			(BPF_ALU|BPF_XOR|BPF_X, None, None, 0),
+			"melange",
+			(BPF_ALU|BPF_MUL|BPF_K, None, None, MULTIPLICATEUR),
+			(BPF_ALU|BPF_RSH|BPF_K, None, None, DECALAGE),
+			(BPF_ALU|BPF_MOD|BPF_K, None, None, self.nb_sockets),
+			(BPF_RET|BPF_A, None, None, 0),
+		]
+		etiquettes, instructions = {}, []
+		for element in source:
+			if isinstance(element, str):
+				etiquettes[element] = len(instructions)
+			else:
+				instructions.append(element)
+		programme = []
+		for position, (code, vrai, faux, k) in enumerate(instructions):
+			saut = lambda etiquette: 0 if etiquette is None else etiquettes[etiquette] - position - 1
+			if isinstance(k, str):
+				k = saut(k)
+			elif max(saut(vrai), saut(faux)) > 255:
+				raise ValueError("saut conditionnel trop long")
+			programme.append((code, saut(vrai), saut(faux), k))
+		return programme
+
+	def attacher(self, sock):
+		"""attache le filtre au groupe SO_REUSEPORT de sock (déjà liée à son
+		port). Lève OSError si le système ne le permet pas."""
+		programme = self.programme()
+		filtre = (sock_filter * len(programme))(*programme)
+		sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF,
+			struct.pack("@HP", len(programme), ctypes.addressof(filtre)))
+
+	def indice(self, datagramme):
+		"indice de la socket à laquelle le filtre attribue ce datagramme."
+		e = self.taille_entete
+		def mot(offset):
+			if offset + 4 > len(datagramme):
+				raise IndexError
+			return struct.unpack_from("!I", datagramme, offset)[0]
+		try:
+			entete, x = mot(0), mot(4)
+			if entete & 0xFF == self.type_annonce:
+				cle = mot(x + e) ^ mot(x + e + 4)
+			elif entete & self.drapeau_identifiant:
+				cle = mot(e) ^ mot(e + 4)
+			elif x >= 4:
+				cle = 0
+				for j in range(NB_ECHANTILLONS + 1):
+					cle ^= mot(e + ((((x - 4) * j) & 0xFFFFFFFF) >> 3))
+			else:
+				cle = x
+		except IndexError:
+			# lecture hors du datagramme: le filtre s'arrête et renvoie 0
+			return 0
+		return (((cle * MULTIPLICATEUR) & 0xFFFFFFFF) >> DECALAGE) % self.nb_sockets
+
+
+#------------------------------------------------------------------------------
+# MAIN
+#-------------------
+if __name__ == "__main__":
+	# quelques tests si le module est lancé directement
+	import random
+	TAILLE_ENTETE, ANNONCE, IDENTIFIANT = 60, 21, 0x1000
+	aiguillage = Aiguillage(4, TAILLE_ENTETE, ANNONCE, IDENTIFIANT)
+	sockets = []
+	for i in range(4):
+		s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+		s.bind(("127.0.0.1", sockets[0].getsockname()[1] if sockets else 0))
+		s.settimeout(0.5)
+		sockets.append(s)
+	aiguillage.attacher(sockets[0])
+	print("filtre de %d instructions attache" % len(aiguillage.programme()))
+	alea = random.Random(1)
+	datagrammes = []
+	for n in range(200):
+		nom = ("rep%d/fichier_%d.csv" % (n % 3, n)).encode()[:alea.choice((2, 6, 40))]
+		ident = alea.getrandbits(64).to_bytes(8, 'big')
+		entete = bytearray(TAILLE_ENTETE)
+		choix = n % 3
+		if choix == 0:
+			struct.pack_into("!ii", entete, 0, 0, len(nom))
+			datagrammes.append(bytes(entete) + nom + b"donnees")
+		elif choix == 1:
+			struct.pack_into("!ii", entete, 0, IDENTIFIANT, 8)
+			datagrammes.append(bytes(entete) + ident + b"donnees")
+		else:
+			struct.pack_into("!ii", entete, 0, ANNONCE, len(nom))
+			datagrammes.append(bytes(entete) + nom + ident)
+	datagrammes.append(b"court")
+	emetteur = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	for d in datagrammes:
+		emetteur.sendto(d, sockets[0].getsockname())
+	recus = {}
+	for i, s in enumerate(sockets):
+		try:
+			while True:
+				recus[s.recv(2000)] = i
+		except socket.timeout:
+			pass
+	conformes = sum(recus.get(d) == aiguillage.indice(d) for d in datagrammes)
+	print("%d datagrammes, %d aiguilles comme prevu" % (len(datagrammes), conformes))
+	print("repartition:", [list(recus.values()).count(i) for i in range(4)])
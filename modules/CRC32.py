@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+----------------------------------------------------------------------------
+CRC32: CRC32 d'un fichier à partir de ceux de ses paquets, dans le désordre.
+----------------------------------------------------------------------------
+
+version 0.01
+
+Le CRC32 (celui de binascii et zlib) de la concaténation A+B se calcule à
+partir de crc(A), crc(B) et de la longueur de B, sans relire les données
+(crc32_combine, comme dans zlib): crc(A) est décalé de 8*len(B) bits, c'est
+à dire multiplié par x^(8*len(B)) modulo le polynôme du CRC, puis combiné
+par XOR avec crc(B).
+
+La classe CRCPaquets garde le CRC32 de chaque paquet reçu (ou émis), dans
+un ordre quelconque. Les paquets sont regroupés en blocs de TAILLE_BLOC: le
+CRC32 d'un bloc est calculé dès qu'il est complet, et intégré au CRC32 du
+début du fichier dès que les blocs qui le précèdent le sont. A l'arrivée du
+dernier paquet, il ne reste donc qu'un bloc et les blocs en attente à
+combiner, même si les paquets sont arrivés dans le désordre. Le décalage
+d'une longueur donnée étant linéaire, il est précalculé en 4 tables de 256
+entrées (une par octet du CRC): combiner un paquet ou un bloc coûte 4
+lectures de table, quelle que soit sa taille.
+
+L'état des blocs complets (méthode etat) permet de reprendre le calcul plus
+tard, par exemple après le redémarrage d'un récepteur: seuls les paquets des
+blocs incomplets sont alors à ajouter de nouveau.
+"""
+
+#=== IMPORTS ==================================================================
+
+import array, binascii
+
+#=== CONSTANTES ===============================================================
+
+POLYNOME = 0xEDB88320       # polynôme du CRC32, bits inversés
+MAX_DECALAGES = 16          # longueurs de paquets dont les tables sont gardées
+TAILLE_BLOC = 64            # paquets par bloc (cf. CRCPaquets)
+
+#------------------------------------------------------------------------------
+# arithmétique modulo le polynôme du CRC32 (représentation inversée)
+#-------------------
+
+def multmodp(a, b):
+	"produit de a et b modulo le polynôme du CRC32."
+	m = 1 << 31
+	p = 0
+	while True:
+		if a & m:
+			p ^= b
+			if (a & (m - 1)) == 0:
+				break
+		m >>= 1
+		b = (b >> 1) ^ POLYNOME if b & 1 else b >> 1
+	return p
+
+def _puissances():
+	"x^(2^k) modulo le polynôme, pour k = 0..31."
+	puissances = [1 << 30]      # x^1
+	for k in range(31):
+		puissances.append(multmodp(puissances[-1], puissances[-1]))
+	return puissances
+
+X2N = _puissances()
+
+def x8nmodp(n):
+	"x^(8*n) modulo le polynôme: décalage de n octets."
+	p = 1 << 31                 # x^0
+	k = 3
+	while n:
+		if n & 1:
+			p = multmodp(X2N[k & 31], p)
+		n >>= 1
+		k += 1
+	return p
+
+def crc32_combine(crc1, crc2, longueur2):
+	"""CRC32 de la concaténation de deux blocs de CRC32 crc1 et crc2, le
+	second de longueur2 octets."""
+	return multmodp(x8nmodp(longueur2), crc1) ^ crc2
+
+
+#------------------------------------------------------------------------------
+# classe Decalage
+#--------------------------
+
+class Decalage:
+	"""Décalage d'un CRC32 d'un nombre fixe d'octets (multiplication par
+	x^(8*longueur)), par tables."""
+
+	def __init__(self, longueur):
+		x = x8nmodp(longueur)
+		self.tables = []
+		for octet in range(4):
+			# images des 8 bits de cet octet, puis de leurs combinaisons
+			bits = [multmodp(x, 1 << (8 * octet + i)) for i in range(8)]
+			table = [0] * 256
+			for valeur in range(1, 256):
+				bas = valeur & -valeur
+				table[valeur] = table[valeur ^ bas] ^ bits[bas.bit_length() - 1]
+			self.tables.append(table)
+
+	def __call__(self, crc):
+		t0, t1, t2, t3 = self.tables
+		return t0[crc & 0xFF] ^ t1[(crc >> 8) & 0xFF] ^ t2[(crc >> 16) & 0xFF] ^ t3[crc >> 24]
+
+
+#------------------------------------------------------------------------------
+# classe CRCPaquets
+#--------------------------
+
+class CRCPaquets:
+	"""CRC32 d'un fichier découpé en nb_paquets paquets consécutifs, ajoutés
+	dans un ordre quelconque."""
+
+	def __init__(self, nb_paquets, etat=None):
+		"""constructeur de CRCPaquets.
+
+		nb_paquets: nombre de paquets du fichier.
+		etat: état renvoyé par etat() (optionnel): les blocs qui y étaient
+		      complets le restent, sans leurs paquets.
+		"""
+		self.nb_paquets = nb_paquets
+		self.crcs = array.array('I', bytes(4 * nb_paquets))
+		self.longueurs = array.array('I', bytes(4 * nb_paquets))
+		self.presents = bytearray(nb_paquets)
+		nb_blocs = (nb_paquets + TAILLE_BLOC - 1) // TAILLE_BLOC
+		# paquets manquants, puis CRC32 et longueur de chaque bloc
+		self.manquants = array.array('I', [min(TAILLE_BLOC, nb_paquets - b * TAILLE_BLOC)
+		                                   for b in range(nb_blocs)])
+		self.crcs_blocs = array.array('I', bytes(4 * nb_blocs))
+		self.longueurs_blocs = array.array('Q', bytes(8 * nb_blocs))
+		self.crc32 = 0              # CRC32 des nb_blocs_integres premiers blocs
+		self.nb_blocs_integres = 0
+		self.decalages = {}         # longueur -> Decalage
+		if etat is not None:
+			self._restaurer(etat)
+
+	def ajouter(self, num_paquet, donnees):
+		"ajoute le paquet num_paquet (les paquets déjà ajoutés sont ignorés)."
+		if self.presents[num_paquet]:
+			return
+		self.crcs[num_paquet] = binascii.crc32(donnees)
+		self.longueurs[num_paquet] = len(donnees)
+		self.presents[num_paquet] = 1
+		bloc = num_paquet // TAILLE_BLOC
+		self.manquants[bloc] -= 1
+		if self.manquants[bloc] == 0:
+			debut = bloc * TAILLE_BLOC
+			self.crcs_blocs[bloc], self.longueurs_blocs[bloc] = self._combiner(0, 0,
+				self.crcs, self.longueurs, debut, min(debut + TAILLE_BLOC, self.nb_paquets))
+			if bloc == self.nb_blocs_integres:
+				# blocs complets qui suivent le début du fichier
+				fin = bloc
+				while fin < len(self.manquants) and self.manquants[fin] == 0:
+					fin += 1
+				self.crc32 = self._combiner(self.crc32, 0,
+					self.crcs_blocs, self.longueurs_blocs, bloc, fin)[0]
+				self.nb_blocs_integres = fin
+
+	def _combiner(self, crc, longueur, crcs, longueurs, debut, fin):
+		"""ajoute à (crc, longueur) les éléments debut à fin-1 de crcs et
+		longueurs; renvoie le (crc, longueur) obtenu."""
+		decalages = self.decalages
+		for n in range(debut, fin):
+			longueur_n = longueurs[n]
+			decalage = decalages.get(longueur_n)
+			if decalage is None:
+				if len(decalages) >= MAX_DECALAGES:
+					decalages.clear()
+				decalage = decalages[longueur_n] = Decalage(longueur_n)
+			crc = decalage(crc) ^ crcs[n]
+			longueur += longueur_n
+		return crc, longueur
+
+	def etat(self):
+		"""état des blocs complets (CRC32 et longueur de chaque bloc, puis un
+		octet par bloc, non nul s'il est complet), pour reprendre le calcul
+		plus tard (cf. constructeur). Les CRC32 des paquets des blocs
+		incomplets n'y sont pas: leurs paquets seront à ajouter de nouveau."""
+		return (self.crcs_blocs.tobytes() + self.longueurs_blocs.tobytes()
+		        + bytes(manquants == 0 for manquants in self.manquants))
+
+	def _restaurer(self, etat):
+		"reprend l'état des blocs complets sauvegardé par etat()."
+		nb_blocs = len(self.manquants)
+		fin_crcs = nb_blocs * self.crcs_blocs.itemsize
+		fin_longueurs = fin_crcs + nb_blocs * self.longueurs_blocs.itemsize
+		if len(etat) != fin_longueurs + nb_blocs:
+			raise ValueError("etat de CRCPaquets incorrect")
+		self.crcs_blocs = array.array('I', etat[:fin_crcs])
+		self.longueurs_blocs = array.array('Q', etat[fin_crcs:fin_longueurs])
+		for bloc, complet in enumerate(etat[fin_longueurs:]):
+			if complet:
+				debut = bloc * TAILLE_BLOC
+				fin = min(debut + TAILLE_BLOC, self.nb_paquets)
+				self.presents[debut:fin] = b"\x01" * (fin - debut)
+				self.manquants[bloc] = 0
+		# blocs complets du début du fichier
+		fin = 0
+		while fin < nb_blocs and self.manquants[fin] == 0:
+			fin += 1
+		self.crc32 = self._combiner(0, 0, self.crcs_blocs, self.longueurs_blocs, 0, fin)[0]
+		self.nb_blocs_integres = fin
+
+	def complet(self):
+		"vrai si tous les paquets sont intégrés: crc32 est celui du fichier."
+		return self.nb_blocs_integres == len(self.manquants)
+
+
+#------------------------------------------------------------------------------
+# MAIN
+#-------------------
+if __name__ == "__main__":
+	# quelques tests si le module est lancé directement
+	import os, random, time
+	alea = random.Random(1)
+	a, b = os.urandom(1000), os.urandom(3000)
+	print("crc32_combine:", crc32_combine(binascii.crc32(a), binascii.crc32(b), len(b))
+	      == binascii.crc32(a + b))
+	donnees = os.urandom(10 * 1024 * 1024 + 123)
+	taille_paquet = 1400
+	paquets = [donnees[i:i + taille_paquet] for i in range(0, len(donnees), taille_paquet)]
+	ordre = list(range(len(paquets)))
+	alea.shuffle(ordre)
+	debut = time.perf_counter()
+	crc_paquets = CRCPaquets(len(paquets))
+	for n in ordre:
+		crc_paquets.ajouter(n, paquets[n])
+	duree = time.perf_counter() - debut
+	print("%d paquets dans le desordre: %s, %.3f s" % (len(paquets),
+		crc_paquets.complet() and crc_paquets.crc32 == binascii.crc32(donnees), duree))
+	for nb in (1, TAILLE_BLOC - 1, TAILLE_BLOC, TAILLE_BLOC + 1, 3 * TAILLE_BLOC):
+		ordre = list(range(nb))
+		alea.shuffle(ordre)
+		crc_paquets = CRCPaquets(nb)
+		for n in ordre + ordre[:3]:
+			crc_paquets.ajouter(n, paquets[n])
+		assert crc_paquets.complet() and crc_paquets.crc32 == binascii.crc32(b"".join(paquets[:nb])), nb
+	print("tailles limites de blocs: OK")
+	# reprise: état sauvegardé à mi-parcours, paquets des blocs incomplets ajoutés de nouveau
+	nb = 5 * TAILLE_BLOC + 7
+	ordre = list(range(nb))
+	alea.shuffle(ordre)
+	crc_paquets = CRCPaquets(nb)
+	for n in ordre[:nb // 2]:
+		crc_paquets.ajouter(n, paquets[n])
+	for n in range(TAILLE_BLOC, 3 * TAILLE_BLOC):
+		crc_paquets.ajouter(n, paquets[n])
+	reprise = CRCPaquets(nb, crc_paquets.etat())
+	for n in ordre:
+		if not reprise.presents[n]:
+			reprise.ajouter(n, paquets[n])
+	print("reprise:", reprise.complet() and reprise.crc32 == binascii.crc32(b"".join(paquets[:nb])))
+	vide = CRCPaquets(1)
+	vide.ajouter(0, b"")
+	print("fichier vide:", vide.complet() and vide.crc32 == 0)
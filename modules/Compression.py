@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+----------------------------------------------------------------------------
+Compression: compression adaptative des fichiers émis, par blocs.
+----------------------------------------------------------------------------
+
+version 0.01
+
+Un fichier compressé est transmis sous forme d'un flux de blocs
+indépendants: chaque bloc de TAILLE_BLOC octets du fichier d'origine est
+compressé seul, et précédé de sa taille d'origine et de sa taille compressée
+(entête de bloc). Le récepteur décompresse le flux bloc par bloc, sans avoir
+à le garder en mémoire.
+
+La méthode (zlib ou lzma) et son niveau sont choisis pour chaque fichier
+d'après quelques échantillons: on retient la méthode qui minimise la durée
+estimée du transfert au débit du lien, compression comprise, ou aucune si
+le fichier se compresse mal.
+"""
+
+#=== IMPORTS ==================================================================
+
+import binascii, lzma, struct, tempfile, time, zlib
+
+try:
+	from modules.FichierMappe import FichierMappe
+except ImportError:
+	from FichierMappe import FichierMappe
+
+#=== CONSTANTES ===============================================================
+
+# méthodes de compression
+AUCUNE = 0
+ZLIB = 1
+LZMA = 2
+NOMS_METHODES = {AUCUNE: "aucune", ZLIB: "zlib", LZMA: "lzma"}
+
+# (méthode, niveau) essayés par choisir_compression, du plus rapide au plus lent
+CANDIDATS = ((ZLIB, 1), (ZLIB, 6), (LZMA, 1))
+# niveau utilisé quand la méthode est imposée
+NIVEAUX_DEFAUT = {ZLIB: 6, LZMA: 1}
+
+TAILLE_BLOC = 4 * 1024 * 1024       # taille d'origine d'un bloc compressé
+TAILLE_ECHANTILLON = 64 * 1024      # taille d'un échantillon pour le choix
+NB_ECHANTILLONS = 3                 # début, milieu et fin du fichier
+RATIO_MAX = 0.9                     # au-delà, le fichier n'est pas compressé
+
+ENTETE_BLOC = struct.Struct("!II")  # taille d'origine, taille compressée
+
+#------------------------------------------------------------------------------
+# fonctions de compression d'un bloc
+#-------------------
+
+def compresser_bloc(donnees, methode, niveau):
+	"compresse un bloc de données, indépendamment des autres."
+	if methode == ZLIB:
+		return zlib.compress(donnees, niveau)
+	if methode == LZMA:
+		return lzma.compress(donnees, format=lzma.FORMAT_XZ, check=lzma.CHECK_NONE, preset=niveau)
+	raise ValueError("methode de compression inconnue: %r" % methode)
+
+def decompresser_bloc(donnees, methode):
+	"décompresse un bloc produit par compresser_bloc."
+	if methode == ZLIB:
+		return zlib.decompress(donnees)
+	if methode == LZMA:
+		return lzma.decompress(donnees, format=lzma.FORMAT_XZ)
+	raise ValueError("methode de compression inconnue: %r" % methode)
+
+def nom_compression(methode, niveau):
+	"""nom d'un choix de compression, par exemple "zlib:6" ou "aucune"
+	(conservé d'une boucle d'émission à l'autre)."""
+	if methode == AUCUNE:
+		return NOMS_METHODES[AUCUNE]
+	return "%s:%d" % (NOMS_METHODES[methode], niveau)
+
+def lire_nom_compression(nom):
+	"inverse de nom_compression: renvoie (méthode, niveau)."
+	if nom == NOMS_METHODES[AUCUNE]:
+		return AUCUNE, 0
+	nom_methode, niveau = nom.split(':')
+	for methode, n in NOMS_METHODES.items():
+		if n == nom_methode:
+			return methode, int(niveau)
+	raise ValueError("compression inconnue: %r" % nom)
+
+#------------------------------------------------------------------------------
+# choix de la compression
+#-------------------
+
+def echantillon(source):
+	"""quelques tranches réparties dans le fichier source (objet offrant
+	taille et tranche(offset, taille), comme FichierMappe)."""
+	if source.taille <= TAILLE_ECHANTILLON * NB_ECHANTILLONS:
+		return bytes(source.tranche(0, source.taille))
+	pas = (source.taille - TAILLE_ECHANTILLON) // (NB_ECHANTILLONS - 1)
+	return b"".join(bytes(source.tranche(i * pas, TAILLE_ECHANTILLON)) for i in range(NB_ECHANTILLONS))
+
+def choisir_compression(source, debit, methodes=None):
+	"""Choisit la compression d'un fichier. Renvoie (méthode, niveau).
+
+	source : fichier à compresser (taille, tranche(offset, taille)).
+	debit  : débit du lien en bits/s, pour estimer la durée du transfert
+	         (None: on retient simplement le meilleur taux de compression).
+	methodes : méthodes autorisées (par défaut, toutes).
+
+	Chaque candidat est essayé sur un échantillon; la durée estimée du
+	transfert est la plus longue de la compression et de l'émission du
+	résultat, les deux se recouvrant dans le pipeline d'émission."""
+	donnees = echantillon(source)
+	if not donnees:
+		return AUCUNE, 0
+	meilleur = (AUCUNE, 0)
+	duree_meilleure = source.taille * 8 / debit if debit else 1.0
+	for methode, niveau in CANDIDATS:
+		if methodes is not None and methode not in methodes:
+			continue
+		debut = time.perf_counter()
+		ratio = len(compresser_bloc(donnees, methode, niveau)) / len(donnees)
+		duree = time.perf_counter() - debut
+		if ratio > RATIO_MAX:
+			if methode == ZLIB:
+				# données incompressibles: inutile d'essayer plus fort
+				break
+			continue
+		if debit:
+			estimation = max(duree / len(donnees) * source.taille, ratio * source.taille * 8 / debit)
+		else:
+			estimation = ratio
+		if estimation < duree_meilleure:
+			meilleur, duree_meilleure = (methode, niveau), estimation
+	return meilleur
+
+#------------------------------------------------------------------------------
+# classe FluxCompresse
+#--------------------------
+
+class FluxCompresse:
+	"""Flux compressé d'un fichier, écrit dans un fichier temporaire.
+
+	Attributs: methode, niveau, taille_originale, crc32 (du fichier d'origine),
+	taille (du flux), fichier (fichier temporaire du flux, ouvert), et flux:
+	FichierMappe sur le fichier temporaire, pour lire le flux par tranches."""
+
+	def __init__(self, source, methode, niveau, taille_bloc=TAILLE_BLOC):
+		"""constructeur de FluxCompresse: compresse tout le fichier source.
+
+		source: fichier à compresser (taille, tranches(taille_tranche)).
+		methode, niveau: compression à utiliser (cf. choisir_compression).
+		"""
+		self.methode = methode
+		self.niveau = niveau
+		self.taille_originale = 0
+		self.crc32 = 0
+		self.fichier = tempfile.TemporaryFile(prefix='BFTP_')
+		for bloc in source.tranches(taille_bloc):
+			self.crc32 = binascii.crc32(bloc, self.crc32)
+			self.taille_originale += len(bloc)
+			compresse = compresser_bloc(bloc, methode, niveau)
+			self.fichier.write(ENTETE_BLOC.pack(len(bloc), len(compresse)))
+			self.fichier.write(compresse)
+		self.taille = self.fichier.tell()
+		self.fichier.flush()
+		self.fichier.seek(0)
+		self.flux = FichierMappe(self.fichier)
+
+	def ratio(self):
+		"taille du flux rapportée à celle du fichier d'origine."
+		return self.taille / self.taille_originale if self.taille_originale else 1.0
+
+	def fermer(self):
+		"ferme et supprime le fichier temporaire du flux."
+		self.flux.fermer()
+
+#------------------------------------------------------------------------------
+# décompression d'un flux
+#-------------------
+
+def decompresser(fichier, methode, taille_originale):
+	"""Générateur des blocs d'origine d'un flux compressé lu dans fichier
+	(objet fichier positionné au début du flux). Le flux peut être suivi de
+	données quelconques (paquet final complété par des zéros): la lecture
+	s'arrête quand taille_originale octets ont été produits.
+	Lève IOError si le flux est incorrect."""
+	reste = taille_originale
+	while reste > 0:
+		entete = fichier.read(ENTETE_BLOC.size)
+		if len(entete) != ENTETE_BLOC.size:
+			raise IOError("flux compresse tronque")
+		taille_bloc, taille_compresse = ENTETE_BLOC.unpack(entete)
+		compresse = fichier.read(taille_compresse)
+		if len(compresse) != taille_compresse or taille_bloc > reste:
+			raise IOError("flux compresse incorrect")
+		try:
+			bloc = decompresser_bloc(compresse, methode)
+		except (zlib.error, lzma.LZMAError, ValueError) as e:
+			raise IOError("decompression impossible: %s" % e)
+		if len(bloc) != taille_bloc:
+			raise IOError("bloc decompresse de taille incorrecte")
+		reste -= taille_bloc
+		yield bloc
+
+
+#------------------------------------------------------------------------------
+# MAIN
+#-------------------
+if __name__ == "__main__":
+	# quelques tests si le module est lancé directement
+	import sys
+	chemin = sys.argv[1] if len(sys.argv) > 1 else __file__
+	with FichierMappe(chemin) as source:
+		for debit in (10**7, 10**9):
+			methode, niveau = choisir_compression(source, debit)
+			print("debit %d bit/s: %s" % (debit, nom_compression(methode, niveau)))
+		for methode in (ZLIB, LZMA):
+			flux = FluxCompresse(source, methode, NIVEAUX_DEFAUT[methode], taille_bloc=4096)
+			resultat = b"".join(decompresser(flux.fichier, methode, flux.taille_originale))
+			print("%s: ratio %.2f, CRC32 %08X, relu %s" % (NOMS_METHODES[methode], flux.ratio(),
+				flux.crc32 & 0xFFFFFFFF, binascii.crc32(resultat) == flux.crc32))
+			flux.fermer()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+----------------------------------------------------------------------------
+Delta: transfert des seuls blocs modifiés d'un fichier (patch).
+----------------------------------------------------------------------------
+
+version 0.01
+
+L'émetteur garde pour chaque fichier une empreinte par bloc de TAILLE_BLOC
+octets (BLAKE2b sur 8 octets). Quand un fichier déjà transmis est modifié,
+les empreintes de la nouvelle version sont comparées à celles de la version
+de base (supposée reçue), et seuls les blocs différents sont transmis dans
+un patch:
+
+    entête: taille, date et CRC32 de la base, taille des blocs, nombre de blocs
+    indices des blocs transmis (entiers 32 bits)
+    contenu des blocs transmis, dans l'ordre des indices
+
+Le récepteur reconstruit la nouvelle version à partir de sa copie de la base
+et des blocs du patch, à côté de la base qui reste intacte jusqu'à la
+vérification du CRC32 du fichier complet.
+"""
+
+#=== IMPORTS ==================================================================
+
+import base64, binascii, hashlib, struct, tempfile, os
+
+try:
+	from modules.FichierMappe import FichierMappe
+except ImportError:
+	from FichierMappe import FichierMappe
+
+#=== CONSTANTES ===============================================================
+
+TAILLE_BLOC = 1024 * 1024       # taille des blocs comparés
+TAILLE_EMPREINTE = 8            # octets d'empreinte BLAKE2b par bloc
+RATIO_MAX = 0.5                 # au-delà, le fichier est renvoyé en entier
+
+ENTETE_PATCH = struct.Struct("!QQIII")  # taille, date, CRC32 de la base; taille des blocs; nb de blocs
+INDICE = struct.Struct("!I")
+
+#------------------------------------------------------------------------------
+# empreintes
+#-------------------
+
+def empreinte(bloc):
+	"empreinte d'un bloc."
+	return hashlib.blake2b(bloc, digest_size=TAILLE_EMPREINTE).digest()
+
+def calculer_empreintes(source, taille_bloc=TAILLE_BLOC, hachages=()):
+	"""Calcule en une seule lecture le CRC32 du fichier source (objet offrant
+	tranches(taille_tranche), comme FichierMappe) et les empreintes de ses
+	blocs. Renvoie (crc32, empreintes), empreintes étant leur concaténation.
+	hachages: autres calculs (objets hashlib) alimentés par la même lecture."""
+	crc32 = 0
+	empreintes = []
+	for bloc in source.tranches(taille_bloc):
+		crc32 = binascii.crc32(bloc, crc32)
+		empreintes.append(empreinte(bloc))
+		for h in hachages:
+			h.update(bloc)
+	return crc32, b"".join(empreintes)
+
+def encoder_empreintes(empreintes):
+	"empreintes sous forme de texte, pour un attribut XML."
+	return base64.b64encode(empreintes).decode('ascii')
+
+def decoder_empreintes(texte):
+	"inverse de encoder_empreintes."
+	return base64.b64decode(texte.encode('ascii'), validate=True)
+
+def blocs_modifies(empreintes, empreintes_base):
+	"""Indices des blocs dont l'empreinte diffère de celle du bloc de même
+	indice de la base, ou qui n'existent pas dans la base."""
+	t = TAILLE_EMPREINTE
+	return [i for i in range(len(empreintes) // t)
+		if empreintes[i*t:(i+1)*t] != empreintes_base[i*t:(i+1)*t]]
+
+#------------------------------------------------------------------------------
+# classe PatchDelta
+#--------------------------
+
+class PatchDelta:
+	"""Patch d'un fichier par rapport à une version de base, écrit dans un
+	fichier temporaire.
+
+	Attributs: taille_originale et crc32 (du fichier complet), taille (du
+	patch), indices (des blocs transmis), flux: FichierMappe sur le patch."""
+
+	def __init__(self, source, crc32, base, indices, taille_bloc=TAILLE_BLOC):
+		"""constructeur de PatchDelta.
+
+		source: nouvelle version du fichier (taille, tranche(offset, taille)).
+		crc32: CRC32 de la nouvelle version.
+		base: tuple (taille, date, crc32) de la version de base.
+		indices: blocs à transmettre (cf. blocs_modifies).
+		"""
+		self.taille_originale = source.taille
+		self.crc32 = crc32
+		self.indices = indices
+		fichier = tempfile.TemporaryFile(prefix='BFTP_')
+		fichier.write(ENTETE_PATCH.pack(base[0], base[1], base[2] & 0xFFFFFFFF, taille_bloc, len(indices)))
+		fichier.write(b"".join(INDICE.pack(i) for i in indices))
+		for i in indices:
+			fichier.write(source.tranche(i * taille_bloc, taille_bloc))
+		self.taille = fichier.tell()
+		fichier.flush()
+		self.flux = FichierMappe(fichier)
+
+	def fermer(self):
+		"ferme et supprime le fichier temporaire du patch."
+		self.flux.fermer()
+
+def preparer_patch(source, crc32, empreintes, base, empreintes_base,
+                   taille_bloc=TAILLE_BLOC, ratio_max=RATIO_MAX):
+	"""Renvoie le PatchDelta de source par rapport à la base, ou None si le
+	patch ne serait pas assez petit devant le fichier complet."""
+	indices = blocs_modifies(empreintes, empreintes_base)
+	volume = sum(min(taille_bloc, source.taille - i * taille_bloc) for i in indices)
+	if volume > ratio_max * source.taille:
+		return None
+	return PatchDelta(source, crc32, base, indices, taille_bloc)
+
+#------------------------------------------------------------------------------
+# application d'un patch
+#-------------------
+
+def lire_entete_patch(fichier):
+	"""Lit l'entête et les indices d'un patch (objet fichier positionné au
+	début du patch). Renvoie (taille_base, date_base, crc_base, taille_bloc,
+	indices). Lève IOError si le patch est incorrect."""
+	entete = fichier.read(ENTETE_PATCH.size)
+	if len(entete) != ENTETE_PATCH.size:
+		raise IOError("patch tronque")
+	taille_base, date_base, crc_base, taille_bloc, nb_blocs = ENTETE_PATCH.unpack(entete)
+	donnees = fichier.read(nb_blocs * INDICE.size)
+	if taille_bloc == 0 or len(donnees) != nb_blocs * INDICE.size:
+		raise IOError("patch incorrect")
+	indices = [i for (i,) in INDICE.iter_unpack(donnees)]
+	return taille_base, date_base, crc_base, taille_bloc, indices
+
+def appliquer(fichier_patch, base, taille_bloc, indices, taille_cible):
+	"""Générateur des blocs successifs de la nouvelle version: blocs du patch
+	(lus dans fichier_patch, positionné après les indices) ou blocs de la
+	base (objet fichier ouvert, lu par os.pread) pour les autres.
+	Lève IOError si le patch est incorrect."""
+	transmis = set(indices)
+	if len(transmis) != len(indices) or list(indices) != sorted(indices):
+		raise IOError("patch incorrect")
+	for i in range((taille_cible + taille_bloc - 1) // taille_bloc):
+		taille = min(taille_bloc, taille_cible - i * taille_bloc)
+		if i in transmis:
+			bloc = fichier_patch.read(taille)
+		else:
+			bloc = os.pread(base.fileno(), taille, i * taille_bloc)
+		if len(bloc) != taille:
+			raise IOError("patch ou fichier de base incorrect")
+		yield bloc
+
+
+#------------------------------------------------------------------------------
+# MAIN
+#-------------------
+if __name__ == "__main__":
+	# quelques tests si le module est lancé directement
+	import random
+	alea = random.Random(1)
+	ancien = bytes(alea.randrange(256) for i in range(5 * 4096 + 100))
+	nouveau = bytearray(ancien)
+	nouveau[4096*2 + 10] ^= 0xFF
+	nouveau += b"suite"
+	class Source:
+		def __init__(self, donnees):
+			self.donnees, self.taille = bytes(donnees), len(donnees)
+		def tranche(self, offset, taille):
+			return self.donnees[offset:offset+taille]
+		def tranches(self, taille):
+			return (self.tranche(o, taille) for o in range(0, self.taille, taille))
+	crc_base, empreintes_base = calculer_empreintes(Source(ancien), 4096)
+	crc, empreintes = calculer_empreintes(Source(nouveau), 4096)
+	patch = preparer_patch(Source(nouveau), crc, empreintes, (len(ancien), 0, crc_base),
+		empreintes_base, 4096)
+	print("blocs transmis: %s, patch de %d octets pour %d" % (patch.indices, patch.taille, len(nouveau)))
+	with open(patch.flux.fichier.fileno(), 'rb', closefd=False) as f, tempfile.TemporaryFile() as base:
+		f.seek(0)
+		base.write(ancien)
+		base.flush()
+		taille_base, date_base, crc_lu, taille_bloc, indices = lire_entete_patch(f)
+		resultat = b"".join(appliquer(f, base, taille_bloc, indices, len(nouveau)))
+	print("reconstruction correcte: %s" % (resultat == nouveau))
+	patch.fermer()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+----------------------------------------------------------------------------
+EmissionLot: émission de lots de datagrammes UDP en un seul appel système.
+----------------------------------------------------------------------------
+
+version 0.02
+
+Sous Linux, les datagrammes d'un lot sont passés au noyau en un seul appel à
+sendmmsg(2) (via ctypes). Chaque datagramme est une liste de tampons
+(bytes, bytearray, memoryview) envoyés en scatter-gather, sans concaténation.
+Si sendmmsg n'est pas disponible, le lot est envoyé par une boucle de
+socket.sendmsg.
+
+Sur une socket non bloquante (boucle d'événements), envoyer_partiel émet ce
+que le tampon d'émission accepte et rend la main au lieu d'attendre: le reste
+du lot est émis quand la socket redevient disponible en écriture.
+"""
+
+#=== IMPORTS ==================================================================
+
+import ctypes, errno, socket, struct
+
+#=== CONSTANTES ===============================================================
+
+PyBUF_SIMPLE = 0
+
+#------------------------------------------------------------------------------
+# structures C
+#-------------------
+
+class iovec(ctypes.Structure):
+	_fields_ = [("iov_base", ctypes.c_void_p),
+	            ("iov_len", ctypes.c_size_t)]
+
+class msghdr(ctypes.Structure):
+	_fields_ = [("msg_name", ctypes.c_void_p),
+	            ("msg_namelen", ctypes.c_uint32),
+	            ("msg_iov", ctypes.c_void_p),
+	            ("msg_iovlen", ctypes.c_size_t),
+	            ("msg_control", ctypes.c_void_p),
+	            ("msg_controllen", ctypes.c_size_t),
+	            ("msg_flags", ctypes.c_int)]
+
+class mmsghdr(ctypes.Structure):
+	_fields_ = [("msg_hdr", msghdr),
+	            ("msg_len", ctypes.c_uint)]
+
+class Py_buffer(ctypes.Structure):
+	_fields_ = [("buf", ctypes.c_void_p),
+	            ("obj", ctypes.py_object),
+	            ("len", ctypes.c_ssize_t),
+	            ("itemsize", ctypes.c_ssize_t),
+	            ("readonly", ctypes.c_int),
+	            ("ndim", ctypes.c_int),
+	            ("format", ctypes.c_char_p),
+	            ("shape", ctypes.c_void_p),
+	            ("strides", ctypes.c_void_p),
+	            ("suboffsets", ctypes.c_void_p),
+	            ("internal", ctypes.c_void_p)]
+
+def _charger_sendmmsg():
+	"renvoie la fonction sendmmsg de la libc, ou None si indisponible."
+	try:
+		libc = ctypes.CDLL(None, use_errno=True)
+		fonction = libc.sendmmsg
+		PyObject_GetBuffer = ctypes.pythonapi.PyObject_GetBuffer
+		PyBuffer_Release = ctypes.pythonapi.PyBuffer_Release
+	except (OSError, AttributeError):
+		return None
+	fonction.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+	fonction.restype = ctypes.c_int
+	PyObject_GetBuffer.argtypes = [ctypes.py_object, ctypes.POINTER(Py_buffer), ctypes.c_int]
+	PyObject_GetBuffer.restype = ctypes.c_int
+	PyBuffer_Release.argtypes = [ctypes.POINTER(Py_buffer)]
+	PyBuffer_Release.restype = None
+	return fonction
+
+_sendmmsg = _charger_sendmmsg()
+
+def sockaddr_in(adresse):
+	"""construit une struct sockaddr_in (IPv4) à partir d'un tuple
+	(adresse IP, port) déjà résolu."""
+	ip, port = adresse[0], adresse[1]
+	donnees = (struct.pack("=H", socket.AF_INET) + struct.pack("!H", port)
+	           + socket.inet_aton(ip) + bytes(8))
+	return ctypes.create_string_buffer(donnees, len(donnees))
+
+
+#------------------------------------------------------------------------------
+# classe EmissionLot
+#--------------------------
+
+class EmissionLot:
+	"""Emission de lots de datagrammes sur une socket UDP (IPv4)."""
+
+	def __init__(self, sock, taille_lot=32, tampons_par_datagramme=3):
+		"""constructeur de EmissionLot.
+
+		sock: socket UDP (AF_INET, SOCK_DGRAM) utilisée pour l'émission.
+		taille_lot: nombre maximum de datagrammes par appel système.
+		tampons_par_datagramme: nombre maximum de tampons par datagramme.
+		"""
+		self.sock = sock
+		self.taille_lot = taille_lot
+		self.tampons_par_datagramme = tampons_par_datagramme
+		self.nb_appels = 0          # nombre d'appels système d'émission
+		self.nb_datagrammes = 0     # nombre de datagrammes émis
+		self.sendmmsg = _sendmmsg is not None
+		if self.sendmmsg:
+			self._iov = (iovec * (taille_lot * tampons_par_datagramme))()
+			self._msgs = (mmsghdr * taille_lot)()
+			self._vues = [Py_buffer() for i in range(taille_lot * tampons_par_datagramme)]
+			self._adresses = {}
+
+	def envoyer(self, datagrammes, destination):
+		"""Pour émettre un lot de datagrammes.
+
+		datagrammes: liste de séquences de tampons, un datagramme par séquence.
+		destination: tuple (adresse IP, port) déjà résolu.
+		Renvoie le nombre d'octets émis.
+		"""
+		return self._envoyer(datagrammes, destination, True)[1]
+
+	def envoyer_partiel(self, datagrammes, destination):
+		"""Pour émettre un lot de datagrammes sur une socket non bloquante:
+		s'arrête quand le tampon d'émission est plein (EAGAIN) au lieu
+		d'attendre. Renvoie le nombre de datagrammes et le nombre d'octets
+		émis; les datagrammes suivants sont à émettre plus tard.
+		"""
+		return self._envoyer(datagrammes, destination, False)
+
+	def _envoyer(self, datagrammes, destination, bloquant):
+		if not self.sendmmsg:
+			return self._envoyer_boucle(datagrammes, destination, bloquant)
+		nb_total = 0
+		total = 0
+		for debut in range(0, len(datagrammes), self.taille_lot):
+			lot = datagrammes[debut:debut+self.taille_lot]
+			nb, octets = self._envoyer_mmsg(lot, destination, bloquant)
+			nb_total += nb
+			total += octets
+			if nb < len(lot):
+				break
+		return nb_total, total
+
+	def _envoyer_boucle(self, datagrammes, destination, bloquant=True):
+		"repli: un appel à sendmsg par datagramme."
+		total = 0
+		nb = 0
+		for datagramme in datagrammes:
+			try:
+				total += self.sock.sendmsg(datagramme, (), 0, destination)
+			except BlockingIOError:
+				if bloquant:
+					raise
+				break
+			finally:
+				self.nb_appels += 1
+			nb += 1
+		self.nb_datagrammes += nb
+		return nb, total
+
+	def _envoyer_mmsg(self, datagrammes, destination, bloquant=True):
+		"""émission d'au plus taille_lot datagrammes par sendmmsg. Renvoie le
+		nombre de datagrammes et le nombre d'octets émis."""
+		adresse = self._adresses.get(destination)
+		if adresse is None:
+			adresse = self._adresses[destination] = sockaddr_in(destination)
+		pointeur_adresse = ctypes.addressof(adresse)
+		iov, msgs, vues = self._iov, self._msgs, self._vues
+		base_iov, base_msgs = ctypes.addressof(iov), ctypes.addressof(msgs)
+		GetBuffer = ctypes.pythonapi.PyObject_GetBuffer
+		nb_vues = 0
+		try:
+			for i, datagramme in enumerate(datagrammes):
+				premier = nb_vues
+				for tampon in datagramme:
+					vue = vues[nb_vues]
+					GetBuffer(tampon, ctypes.byref(vue), PyBUF_SIMPLE)
+					iov[nb_vues].iov_base = vue.buf
+					iov[nb_vues].iov_len = vue.len
+					nb_vues += 1
+				hdr = msgs[i].msg_hdr
+				hdr.msg_name = pointeur_adresse
+				hdr.msg_namelen = len(adresse)
+				hdr.msg_iov = base_iov + premier * ctypes.sizeof(iovec)
+				hdr.msg_iovlen = nb_vues - premier
+			nb = len(datagrammes)
+			envoyes = 0
+			total = 0
+			while envoyes < nb:
+				resultat = _sendmmsg(self.sock.fileno(), base_msgs + envoyes * ctypes.sizeof(mmsghdr),
+				                     nb - envoyes, 0)
+				self.nb_appels += 1
+				if resultat < 0:
+					code = ctypes.get_errno()
+					if code == errno.EINTR:
+						continue
+					if code in (errno.EAGAIN, errno.EWOULDBLOCK) and not bloquant:
+						break
+					raise OSError(code, "sendmmsg: " + errno.errorcode.get(code, str(code)))
+				for i in range(envoyes, envoyes + resultat):
+					total += msgs[i].msg_len
+				envoyes += resultat
+			self.nb_datagrammes += envoyes
+			return envoyes, total
+		finally:
+			Release = ctypes.pythonapi.PyBuffer_Release
+			for i in range(nb_vues):
+				Release(ctypes.byref(vues[i]))
+
+
+#------------------------------------------------------------------------------
+# MAIN
+#-------------------
+if __name__ == "__main__":
+	# quelques tests si le module est lancé directement
+	recepteur = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	recepteur.bind(("127.0.0.1", 0))
+	emetteur = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	lot = EmissionLot(emetteur, taille_lot=4)
+	print("sendmmsg disponible: %s" % lot.sendmmsg)
+	datagrammes = [(b"entete%d-" % i, bytearray(b"nom-"), memoryview(b"donnees")) for i in range(10)]
+	print("octets envoyes: %d" % lot.envoyer(datagrammes, recepteur.getsockname()))
+	print("appels systeme: %d" % lot.nb_appels)
+	for i in range(10):
+		print(recepteur.recv(100))
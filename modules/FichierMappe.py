@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+----------------------------------------------------------------------------
+FichierMappe: lecture d'un fichier source par projection mémoire (mmap).
+----------------------------------------------------------------------------
+
+version 0.01
+
+Les données sont fournies sous forme de tranches memoryview de la projection:
+elles peuvent être passées à socket.sendmsg ou binascii.crc32 sans aucune
+copie intermédiaire en espace utilisateur.
+
+Les fichiers réguliers trop petits pour que la projection soit rentable sont
+lus en mémoire en une seule fois à l'ouverture; les fichiers vides ou
+spéciaux sont lus normalement (os.pread).
+
+Attention: comme pour tout fichier projeté, un fichier tronqué par un autre
+processus pendant la lecture provoque un SIGBUS à l'accès des pages
+disparues. On ne projette donc que des fichiers d'au moins TAILLE_MIN_MMAP
+octets, ce qui exclut la plupart des fichiers instables.
+"""
+
+#=== IMPORTS ==================================================================
+
+import mmap, os, stat
+
+#=== CONSTANTES ===============================================================
+
+# taille minimale d'un fichier pour qu'il soit projeté en mémoire
+TAILLE_MIN_MMAP = 256 * 1024
+
+#------------------------------------------------------------------------------
+# classe FichierMappe
+#--------------------------
+
+class FichierMappe:
+	"""Fichier source en lecture seule, lu par tranches."""
+
+	def __init__(self, chemin, taille_min_mmap=TAILLE_MIN_MMAP):
+		"""constructeur de FichierMappe: ouvre et projette le fichier.
+
+		chemin: chemin du fichier à lire, ou fichier déjà ouvert en lecture
+		binaire (il sera fermé par fermer()).
+		taille_min_mmap: taille en dessous de laquelle le fichier est lu
+		normalement plutôt que projeté.
+		"""
+		self.fichier = chemin if hasattr(chemin, 'fileno') else open(chemin, 'rb')
+		infos = os.fstat(self.fichier.fileno())
+		self.taille = infos.st_size
+		self.mappe = None
+		self._vue = None
+		if stat.S_ISREG(infos.st_mode) and self.taille > 0 and self.taille >= taille_min_mmap:
+			try:
+				self.mappe = mmap.mmap(self.fichier.fileno(), 0, access=mmap.ACCESS_READ)
+			except (OSError, ValueError):
+				# projection impossible: on se rabat sur les lectures classiques
+				self.mappe = None
+			else:
+				if hasattr(self.mappe, 'madvise'):
+					self.mappe.madvise(mmap.MADV_SEQUENTIAL)
+				self._vue = memoryview(self.mappe)
+		elif stat.S_ISREG(infos.st_mode) and self.taille > 0:
+			# petit fichier: lu entièrement dès l'ouverture
+			donnees = os.pread(self.fichier.fileno(), self.taille, 0)
+			self.taille = len(donnees)
+			self._vue = memoryview(donnees)
+
+	def tranche(self, offset, taille):
+		"""Renvoie au plus taille octets à partir de offset: memoryview de la
+		projection ou du contenu lu, bytes lus sinon."""
+		if self._vue is not None:
+			return self._vue[offset:offset+taille]
+		return os.pread(self.fichier.fileno(), taille, offset)
+
+	def tranches(self, taille_tranche, offset=0):
+		"Générateur des tranches successives du fichier, à partir de offset."
+		while offset < self.taille:
+			donnees = self.tranche(offset, taille_tranche)
+			if not donnees:
+				break
+			yield donnees
+			offset += len(donnees)
+
+	def precharger(self, offset=0, taille=None):
+		"""Demande au noyau de lire à l'avance une zone du fichier
+		(sans effet si le fichier n'est pas projeté)."""
+		if self.mappe is not None and hasattr(self.mappe, 'madvise'):
+			if taille is None:
+				taille = self.taille - offset
+			debut = offset - offset % mmap.PAGESIZE
+			taille = min(taille + offset - debut, self.taille - debut)
+			if taille > 0:
+				self.mappe.madvise(mmap.MADV_WILLNEED, debut, taille)
+
+	def fermer(self):
+		"""Ferme la projection et le fichier. Si des tranches sont encore
+		référencées, la projection sera fermée par le ramasse-miettes."""
+		if self._vue is not None:
+			self._vue.release()
+			self._vue = None
+		if self.mappe is not None:
+			try:
+				self.mappe.close()
+			except BufferError:
+				pass
+			self.mappe = None
+		self.fichier.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.fermer()
+
+
+#------------------------------------------------------------------------------
+# MAIN
+#-------------------
+if __name__ == "__main__":
+	# quelques tests si le module est lancé directement
+	import binascii, sys
+	chemin = sys.argv[1] if len(sys.argv) > 1 else __file__
+	with FichierMappe(chemin, taille_min_mmap=0) as f:
+		crc = 0
+		for t in f.tranches(16384):
+			crc = binascii.crc32(t, crc)
+		print("projete: %s, taille: %d, CRC32: %08X" % (f.mappe is not None, f.taille, crc))
+	with open(chemin, 'rb') as f:
+		print("CRC32 attendu: %08X" % binascii.crc32(f.read()))
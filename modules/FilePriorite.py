@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+----------------------------------------------------------------------------
+FilePriorite: ordonnancement des fichiers à émettre par synchro_arbo.
+----------------------------------------------------------------------------
+
+version 0.02
+
+Les fichiers sont rangés dans un tas (heapq) par ordre de:
+
+    nombre d'émissions (NbSend, le plus petit d'abord)
+    priorité de l'opérateur (règles par préfixe de chemin, la plus haute d'abord)
+    date de dernière émission (LastSend, la plus ancienne d'abord)
+    classe de taille (les petits fichiers d'abord)
+
+Le tas est tenu à jour au fil de l'eau (fichier émis, nouveau, modifié ou
+supprimé) au lieu d'être reconstruit et trié à chaque boucle: une mise à
+jour ajoute une nouvelle entrée, l'ancienne devenant périmée; les entrées
+périmées sont ignorées à l'extraction et purgées quand elles deviennent
+trop nombreuses.
+
+Le nombre d'émissions passe avant la priorité: synchro_arbo arrête une
+boucle au premier fichier émis plus de MinFileRedundancy fois, un fichier
+prioritaire déjà assez émis ne doit donc pas passer devant des fichiers
+jamais émis. La priorité départage les fichiers émis autant de fois.
+"""
+
+#=== IMPORTS ==================================================================
+
+import heapq, itertools
+
+#=== CONSTANTES ===============================================================
+
+BITS_CLASSE_TAILLE = 4      # une classe de taille par facteur 16
+MIN_PURGE = 1024            # entrées périmées tolérées avant reconstruction du tas
+
+#------------------------------------------------------------------------------
+# classe FilePriorite
+#--------------------------
+
+class FilePriorite:
+	"""File de priorité persistante des fichiers à émettre."""
+
+	def __init__(self, regles=()):
+		"""constructeur de FilePriorite.
+
+		regles: liste de (préfixe de chemin, priorité); pour chaque fichier,
+		        la règle au préfixe le plus long s'applique (priorité 0 sinon).
+		"""
+		self.regles = sorted(regles, key=lambda regle: len(regle[0]), reverse=True)
+		self.tas = []
+		self.entrees = {}   # chemin -> entrée courante du tas
+		self.compteur = itertools.count()
+
+	def priorite(self, chemin):
+		"priorité de l'opérateur pour un chemin."
+		for prefixe, priorite in self.regles:
+			if chemin.startswith(prefixe):
+				return priorite
+		return 0
+
+	def mettre_a_jour(self, chemin, nb_envois, derniere_emission, taille):
+		"""ajoute un fichier ou met à jour sa place dans la file, d'après son
+		nombre d'émissions, la date de sa dernière émission et sa taille."""
+		entree = (nb_envois, -self.priorite(chemin), derniere_emission,
+			taille.bit_length() // BITS_CLASSE_TAILLE, next(self.compteur), chemin)
+		self.entrees[chemin] = entree
+		heapq.heappush(self.tas, entree)
+		self._purger()
+
+	def retirer(self, chemin):
+		"retire un fichier de la file."
+		if self.entrees.pop(chemin, None) is not None:
+			self._purger()
+
+	def __len__(self):
+		return len(self.entrees)
+
+	def __contains__(self, chemin):
+		return chemin in self.entrees
+
+	def _purger(self):
+		"reconstruit le tas quand les entrées périmées y sont majoritaires."
+		if len(self.tas) > 2 * len(self.entrees) + MIN_PURGE:
+			self.tas = list(self.entrees.values())
+			heapq.heapify(self.tas)
+
+	def parcourir(self):
+		"""Générateur des chemins dans l'ordre de priorité, pour une boucle
+		d'émission: chaque fichier est donné au plus une fois, ceux mis à
+		jour pendant le parcours reprennent leur place pour la boucle
+		suivante. Les fichiers restent dans la file."""
+		debut = next(self.compteur)
+		extraites = []
+		try:
+			while self.tas:
+				entree = heapq.heappop(self.tas)
+				chemin = entree[-1]
+				if self.entrees.get(chemin) is not entree:
+					continue
+				extraites.append(entree)
+				if entree[-2] < debut:
+					yield chemin
+		finally:
+			for entree in extraites:
+				if self.entrees.get(entree[-1]) is entree:
+					heapq.heappush(self.tas, entree)
+
+
+#------------------------------------------------------------------------------
+# MAIN
+#-------------------
+if __name__ == "__main__":
+	# quelques tests si le module est lancé directement
+	file = FilePriorite([("urgent/", 10), ("archives/", -5)])
+	file.mettre_a_jour("archives/vieux.zip", 0, 0, 10**9)
+	file.mettre_a_jour("gros.iso", 0, 0, 4 * 10**9)
+	file.mettre_a_jour("petit.txt", 0, 0, 100)
+	file.mettre_a_jour("deja_emis.txt", 1, 1000.0, 100)
+	file.mettre_a_jour("urgent/alerte.txt", 0, 0, 100)
+	file.mettre_a_jour("urgent/rapport.txt", 2, 2000.0, 100)
+	ordre = []
+	for n, chemin in enumerate(file.parcourir()):
+		ordre.append(chemin)
+		# émis pendant le parcours: ne revient pas dans la même boucle
+		file.mettre_a_jour(chemin, 3, 3000.0 + n, 100)
+		if n == 2:
+			file.retirer("archives/vieux.zip")
+	print("premiere boucle:", ordre)
+	print("seconde boucle:", list(file.parcourir()))
+	print("fichiers dans la file: %d" % len(file))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+----------------------------------------------------------------------------
+IndexContenu: index des contenus de fichiers déjà livrés (déduplication).
+----------------------------------------------------------------------------
+
+version 0.01
+
+L'émetteur associe l'empreinte forte du contenu de chaque fichier livré
+(émis MinFileRedundancy fois) à son chemin dans l'arborescence synchronisée.
+Un autre fichier de même contenu peut alors être envoyé sous forme d'un
+simple ordre de copie depuis ce chemin, au lieu de ses données.
+
+L'index est une base SQLite sur disque: sa taille en mémoire est bornée par
+le cache de SQLite, quel que soit le nombre de fichiers, et il est conservé
+d'une session à l'autre avec le fichier de reprise.
+"""
+
+#=== IMPORTS ==================================================================
+
+import hashlib, sqlite3, threading
+
+#=== CONSTANTES ===============================================================
+
+TAILLE_EMPREINTE = 16       # octets de l'empreinte BLAKE2b du contenu
+TAILLE_CACHE = 2048         # cache de SQLite en Ko
+
+#------------------------------------------------------------------------------
+# empreinte du contenu
+#-------------------
+
+def hachage():
+	"""objet de calcul de l'empreinte d'un contenu (méthode update, puis
+	digest ou hexdigest), à alimenter pendant la lecture du fichier."""
+	return hashlib.blake2b(digest_size=TAILLE_EMPREINTE)
+
+#------------------------------------------------------------------------------
+# classe IndexContenu
+#--------------------------
+
+class IndexContenu:
+	"""Index persistant empreinte -> chemins livrés, utilisable depuis
+	plusieurs threads."""
+
+	def __init__(self, chemin, taille_cache=TAILLE_CACHE):
+		"""constructeur d'IndexContenu: ouvre ou crée la base.
+
+		chemin: fichier de la base SQLite.
+		taille_cache: mémoire maximale du cache de SQLite, en Ko.
+		"""
+		self.verrou = threading.Lock()
+		self.base = sqlite3.connect(str(chemin), check_same_thread=False)
+		self.base.execute("PRAGMA cache_size = -%d" % taille_cache)
+		self.base.execute("PRAGMA synchronous = NORMAL")
+		self.base.execute("""CREATE TABLE IF NOT EXISTS contenu (
+			empreinte BLOB NOT NULL, chemin TEXT NOT NULL,
+			taille INTEGER NOT NULL, crc32 INTEGER NOT NULL,
+			PRIMARY KEY (empreinte, chemin))""")
+		self.base.execute("CREATE INDEX IF NOT EXISTS contenu_chemin ON contenu (chemin)")
+		self.base.commit()
+
+	def chercher(self, empreinte, taille, exclure=None):
+		"""Renvoie le chemin d'un fichier livré de même contenu (empreinte et
+		taille), autre que exclure, ou None."""
+		with self.verrou:
+			ligne = self.base.execute("SELECT chemin FROM contenu WHERE empreinte = ? "
+				"AND taille = ? AND chemin != ? LIMIT 1", (empreinte, taille, exclure or "")).fetchone()
+		return ligne[0] if ligne else None
+
+	def enregistrer(self, empreinte, chemin, taille, crc32):
+		"enregistre un fichier livré."
+		with self.verrou:
+			self.base.execute("INSERT OR REPLACE INTO contenu VALUES (?, ?, ?, ?)",
+				(empreinte, chemin, taille, crc32 & 0xFFFFFFFF))
+
+	def oublier(self, chemin):
+		"retire un fichier modifié ou supprimé de l'index."
+		with self.verrou:
+			self.base.execute("DELETE FROM contenu WHERE chemin = ?", (chemin,))
+
+	def __len__(self):
+		with self.verrou:
+			return self.base.execute("SELECT COUNT(*) FROM contenu").fetchone()[0]
+
+	def valider(self):
+		"écrit les modifications sur disque."
+		with self.verrou:
+			self.base.commit()
+
+	def fermer(self):
+		"valide les modifications et ferme la base."
+		self.valider()
+		self.base.close()
+
+
+#------------------------------------------------------------------------------
+# MAIN
+#-------------------
+if __name__ == "__main__":
+	# quelques tests si le module est lancé directement
+	import os, tempfile
+	fd, chemin = tempfile.mkstemp(suffix='.db')
+	os.close(fd)
+	index = IndexContenu(chemin)
+	h = hachage()
+	h.update(b"installeur" * 1000)
+	index.enregistrer(h.digest(), "projet01/setup.exe", 10000, 1234)
+	print("copie de projet01 trouvee:", index.chercher(h.digest(), 10000, "projet02/setup.exe"))
+	print("fichier lui-meme exclu:", index.chercher(h.digest(), 10000, "projet01/setup.exe"))
+	index.fermer()
+	index = IndexContenu(chemin)
+	print("apres reouverture: %d entree(s)" % len(index))
+	index.oublier("projet01/setup.exe")
+	print("apres oubli:", index.chercher(h.digest(), 10000))
+	index.fermer()
+	os.remove(chemin)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+----------------------------------------------------------------------------
+ReceptionLot: réception de lots de datagrammes UDP sans allocation.
+----------------------------------------------------------------------------
+
+version 0.01
+
+Les datagrammes sont reçus dans un anneau de tampons (bytearray) alloués
+une fois pour toutes, et rendus sous forme de memoryview: aucun objet bytes
+n'est créé par datagramme. Sous Linux, un lot entier est reçu en un seul
+appel à recvmmsg(2) (via ctypes); sinon, par une boucle de
+socket.recvfrom_into.
+
+Les vues d'un lot ne restent valides que jusqu'à la réception suivante:
+les données à conserver au-delà doivent être copiées (bytes(vue)).
+
+La fonction etat_noyau donne l'occupation du tampon de réception d'une
+socket et le nombre de datagrammes perdus faute d'y trouver place.
+"""
+
+#=== IMPORTS ==================================================================
+
+import ctypes, errno, os, socket, struct
+
+try:
+	from modules.EmissionLot import iovec, mmsghdr
+except ImportError:
+	from EmissionLot import iovec, mmsghdr
+
+#=== CONSTANTES ===============================================================
+
+TAILLE_ADRESSE = 128        # sizeof(struct sockaddr_storage)
+TABLES_UDP = ("/proc/net/udp", "/proc/net/udp6")
+
+#------------------------------------------------------------------------------
+# recvmmsg
+#-------------------
+
+def _charger_recvmmsg():
+	"renvoie la fonction recvmmsg de la libc, ou None si indisponible."
+	try:
+		libc = ctypes.CDLL(None, use_errno=True)
+		fonction = libc.recvmmsg
+	except (OSError, AttributeError):
+		return None
+	fonction.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+	fonction.restype = ctypes.c_int
+	return fonction
+
+_recvmmsg = _charger_recvmmsg()
+
+def adresse_sockaddr(donnees):
+	"""décode une struct sockaddr_in ou sockaddr_in6 en tuple (adresse IP,
+	port), comme renvoyé par socket.recvfrom."""
+	famille, = struct.unpack_from("=H", donnees)
+	port, = struct.unpack_from("!H", donnees, 2)
+	if famille == socket.AF_INET6:
+		return (socket.inet_ntop(socket.AF_INET6, bytes(donnees[8:24])), port)
+	return (socket.inet_ntop(socket.AF_INET, bytes(donnees[4:8])), port)
+
+def etat_noyau(sock):
+	"""état du tampon de réception de la socket dans le noyau: tuple (octets
+	en attente de lecture, datagrammes perdus faute de place), d'après
+	/proc/net/udp (Linux); None si indisponible."""
+	inode = str(os.fstat(sock.fileno()).st_ino)
+	for table in TABLES_UDP:
+		try:
+			with open(table) as f:
+				lignes = f.readlines()[1:]
+		except OSError:
+			continue
+		for ligne in lignes:
+			# sl local rem st tx_queue:rx_queue tr:tm retrnsmt uid timeout inode ref pointer drops
+			champs = ligne.split()
+			if len(champs) >= 13 and champs[9] == inode:
+				return (int(champs[4].split(':')[1], 16), int(champs[12]))
+	return None
+
+
+#------------------------------------------------------------------------------
+# classe ReceptionLot
+#--------------------------
+
+class ReceptionLot:
+	"""Réception de lots de datagrammes sur une socket UDP non bloquante."""
+
+	def __init__(self, sock, taille_lot=32, taille_tampon=65536):
+		"""constructeur de ReceptionLot.
+
+		sock: socket UDP (SOCK_DGRAM) utilisée pour la réception.
+		taille_lot: nombre maximum de datagrammes par appel système.
+		taille_tampon: taille de chaque tampon, supérieure au plus grand
+		               datagramme attendu.
+		"""
+		self.sock = sock
+		self.taille_lot = taille_lot
+		self.nb_appels = 0          # nombre d'appels système de réception
+		self.nb_datagrammes = 0     # nombre de datagrammes reçus
+		self.tampons = [bytearray(taille_tampon) for i in range(taille_lot)]
+		self.vues = [memoryview(tampon) for tampon in self.tampons]
+		self.recvmmsg = _recvmmsg is not None
+		if self.recvmmsg:
+			self._iov = (iovec * taille_lot)()
+			self._msgs = (mmsghdr * taille_lot)()
+			self._adresses = ctypes.create_string_buffer(taille_lot * TAILLE_ADRESSE)
+			# les tableaux ctypes maintiennent les tampons en place
+			self._c_tampons = [(ctypes.c_char * taille_tampon).from_buffer(tampon)
+			                   for tampon in self.tampons]
+			base_iov = ctypes.addressof(self._iov)
+			base_adresses = ctypes.addressof(self._adresses)
+			for i in range(taille_lot):
+				self._iov[i].iov_base = ctypes.addressof(self._c_tampons[i])
+				self._iov[i].iov_len = taille_tampon
+				hdr = self._msgs[i].msg_hdr
+				hdr.msg_iov = base_iov + i * ctypes.sizeof(iovec)
+				hdr.msg_iovlen = 1
+				hdr.msg_name = base_adresses + i * TAILLE_ADRESSE
+			self._base_msgs = ctypes.addressof(self._msgs)
+		else:
+			self._emetteurs = [None] * taille_lot
+
+	def recevoir(self):
+		"""Pour recevoir les datagrammes disponibles, sans attendre.
+
+		Renvoie la liste des datagrammes reçus (au plus taille_lot), sous
+		forme de memoryview sur les tampons de l'anneau, valides jusqu'à
+		l'appel suivant. Liste vide si aucun datagramme n'est disponible.
+		"""
+		if not self.recvmmsg:
+			return self._recevoir_boucle()
+		msgs = self._msgs
+		for i in range(self.taille_lot):
+			msgs[i].msg_hdr.msg_namelen = TAILLE_ADRESSE
+		while True:
+			resultat = _recvmmsg(self.sock.fileno(), self._base_msgs, self.taille_lot,
+			                     socket.MSG_DONTWAIT, None)
+			self.nb_appels += 1
+			if resultat >= 0:
+				break
+			code = ctypes.get_errno()
+			if code == errno.EINTR:
+				continue
+			if code in (errno.EAGAIN, errno.EWOULDBLOCK):
+				return []
+			raise OSError(code, "recvmmsg: " + errno.errorcode.get(code, str(code)))
+		self.nb_datagrammes += resultat
+		vues = self.vues
+		return [vues[i][:msgs[i].msg_len] for i in range(resultat)]
+
+	def _recevoir_boucle(self):
+		"repli: un appel à recvfrom_into par datagramme."
+		datagrammes = []
+		for vue in self.vues:
+			try:
+				taille, emetteur = self.sock.recvfrom_into(vue)
+			except BlockingIOError:
+				break
+			finally:
+				self.nb_appels += 1
+			self._emetteurs[len(datagrammes)] = emetteur
+			datagrammes.append(vue[:taille])
+		self.nb_datagrammes += len(datagrammes)
+		return datagrammes
+
+	def emetteur(self, i):
+		"adresse (IP, port) de l'émetteur du i-ème datagramme du dernier lot."
+		if not self.recvmmsg:
+			return self._emetteurs[i]
+		return adresse_sockaddr(ctypes.string_at(
+			ctypes.addressof(self._adresses) + i * TAILLE_ADRESSE, TAILLE_ADRESSE))
+
+
+#------------------------------------------------------------------------------
+# MAIN
+#-------------------
+if __name__ == "__main__":
+	# quelques tests si le module est lancé directement
+	recepteur = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	recepteur.bind(("127.0.0.1", 0))
+	recepteur.setblocking(False)
+	emetteur = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	lot = ReceptionLot(recepteur, taille_lot=4, taille_tampon=100)
+	print("recvmmsg disponible: %s" % lot.recvmmsg)
+	for i in range(10):
+		emetteur.sendto(b"datagramme %d" % i, recepteur.getsockname())
+	while True:
+		datagrammes = lot.recevoir()
+		if not datagrammes:
+			break
+		print([bytes(d) for d in datagrammes], lot.emetteur(0)[1] == emetteur.getsockname()[1])
+	print("appels systeme: %d pour %d datagrammes" % (lot.nb_appels, lot.nb_datagrammes))
+	# tampon minimal: les datagrammes en excès sont perdus par le noyau
+	recepteur.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1)
+	for i in range(100):
+		emetteur.sendto(b"x" * 1000, recepteur.getsockname())
+	print("noyau (octets en attente, pertes):", etat_noyau(recepteur))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests de FilePriorite (ordre d'émission des fichiers de synchro_arbo,
+--priorite).
+
+usage: python -m pytest test/   (ou python -m unittest discover -s test)
+"""
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bftp
+from modules.FilePriorite import FilePriorite
+
+
+def boucle_emission(file, nb_envois):
+    """boucle d'émission de synchro_arbo réduite à son ordonnancement: les
+    fichiers sont émis dans l'ordre de la file, et la boucle s'arrête au
+    premier dont le nombre d'émissions dépasse MinFileRedundancy (voir
+    compter_envoi). Renvoie les fichiers émis."""
+    emis = []
+    for chemin in file.parcourir():
+        emis.append(chemin)
+        nb_envois[chemin] += 1
+        file.mettre_a_jour(chemin, nb_envois[chemin], float(len(emis)), 100)
+        if nb_envois[chemin] > bftp.MinFileRedundancy:
+            break
+    return emis
+
+
+class TestFilePriorite(unittest.TestCase):
+
+    def test_priorite_a_nombre_d_envois_egal(self):
+        "la priorité départage les fichiers émis autant de fois, puis la taille."
+        file = FilePriorite([("urgent/", 10), ("archives/", -5)])
+        file.mettre_a_jour("archives/vieux.zip", 0, 0, 100)
+        file.mettre_a_jour("gros.iso", 0, 0, 4 * 10**9)
+        file.mettre_a_jour("petit.txt", 0, 0, 100)
+        file.mettre_a_jour("urgent/alerte.txt", 0, 0, 4 * 10**9)
+        file.mettre_a_jour("deja_emis.txt", 1, 1000.0, 100)
+        self.assertEqual(list(file.parcourir()), ["urgent/alerte.txt", "petit.txt", "gros.iso",
+                                                  "archives/vieux.zip", "deja_emis.txt"])
+
+    def test_prioritaire_redondant(self):
+        """un fichier prioritaire déjà émis plus de MinFileRedundancy fois ne
+        passe pas devant des fichiers moins prioritaires jamais émis: ils sont
+        tous émis avant que la boucle s'arrête sur lui."""
+        file = FilePriorite([("urgent/", 10)])
+        nb_envois = {"urgent/alerte.txt": bftp.MinFileRedundancy}
+        file.mettre_a_jour("urgent/alerte.txt", nb_envois["urgent/alerte.txt"], 1.0, 100)
+        for n in range(20):
+            chemin = "normal/%02d.txt" % n
+            nb_envois[chemin] = 0
+            file.mettre_a_jour(chemin, 0, 0, 100)
+        emis = boucle_emission(file, nb_envois)
+        self.assertEqual(emis[-1], "urgent/alerte.txt")
+        self.assertEqual(sorted(emis[:-1]), sorted(c for c in nb_envois if c.startswith("normal/")))
+
+    def test_emissions_pendant_le_parcours(self):
+        """un fichier émis pendant le parcours n'y revient pas, un fichier
+        retiré n'est plus donné."""
+        file = FilePriorite()
+        for chemin in ("a", "b", "c"):
+            file.mettre_a_jour(chemin, 0, 0, 100)
+        ordre = []
+        for chemin in file.parcourir():
+            ordre.append(chemin)
+            file.mettre_a_jour(chemin, 1, 1.0, 100)
+            if chemin == "a":
+                file.retirer("c")
+        self.assertEqual(ordre, ["a", "b"])
+        self.assertEqual(list(file.parcourir()), ["a", "b"])
+        self.assertEqual(len(file), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
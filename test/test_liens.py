@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests de la répartition de l'émission sur plusieurs liens (Transport de
+bftp, --liens): tourniquet pondéré, répartition des lots, et transfert sur
+la boucle locale vers plusieurs adresses 127.0.0.x et ports.
+
+usage: python -m pytest test/   (ou python -m unittest discover -s test)
+"""
+
+import os, sys, socket, shutil, tempfile, unittest, filecmp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bftp
+
+
+def ouvrir_recepteur(adresse):
+    "socket de réception liée à adresse, port choisi par le système."
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4*1024*1024)
+    s.bind((adresse, 0))
+    s.settimeout(0.5)
+    return s
+
+def vider(s):
+    "datagrammes en attente sur la socket s."
+    datagrammes = []
+    try:
+        while True:
+            datagrammes.append(s.recv(70000))
+    except socket.timeout:
+        pass
+    return datagrammes
+
+
+class TestTourniquet(unittest.TestCase):
+
+    def test_sequence_lissee(self):
+        "chaque lien figure poids fois par cycle, ses passages répartis."
+        self.assertEqual(bftp.tourniquet_pondere([1]), [0])
+        self.assertEqual(bftp.tourniquet_pondere([3, 1]), [0, 0, 1, 0])
+        self.assertEqual(bftp.tourniquet_pondere([1, 1, 1]), [0, 1, 2])
+        sequence = bftp.tourniquet_pondere([5, 2, 1])
+        self.assertEqual([sequence.count(i) for i in range(3)], [5, 2, 1])
+        # le lien le plus lourd n'est jamais choisi plus de deux fois de suite
+        self.assertNotIn([0, 0, 0], [sequence[i:i+3] for i in range(len(sequence))])
+
+    def test_repartition_lots(self):
+        """répartition au prorata des poids, exacte sur chaque cycle, y compris
+        quand les lots ne sont pas des multiples du cycle."""
+        transport = bftp.Transport([("127.0.0.1", 1), ("127.0.0.2", 2), ("127.0.0.3", 3)],
+                                   poids=[2, 1, 1])
+        try:
+            comptes = [0, 0, 0]
+            for n in range(100):
+                lots = transport.repartir(list(range(3)))
+                for i, lot in enumerate(lots):
+                    comptes[i] += len(lot)
+            self.assertEqual(comptes, [150, 75, 75])
+            # l'ordre des datagrammes est conservé dans chaque lot
+            lots = transport.repartir(list(range(8)))
+            self.assertTrue(all(lot == sorted(lot) for lot in lots))
+        finally:
+            transport.fermer()
+
+    def test_poids_invalides(self):
+        with self.assertRaises(ValueError):
+            bftp.Transport([("127.0.0.1", 1), ("127.0.0.2", 2)], poids=[1])
+        with self.assertRaises(ValueError):
+            bftp.Transport([("127.0.0.1", 1), ("127.0.0.2", 2)], poids=[1, 0])
+
+
+class TestTransfertLiens(unittest.TestCase):
+
+    def setUp(self):
+        self.recepteurs = [ouvrir_recepteur(adresse) for adresse in ("127.0.0.1", "127.0.0.2", "127.0.0.3")]
+        self.destination = tempfile.mkdtemp(prefix='BFTP_test_')
+        bftp.CHEMIN_DEST = bftp.path(self.destination)
+        bftp.stats = bftp.Stats()
+
+    def tearDown(self):
+        bftp.transport.fermer()
+        bftp.transport = None
+        bftp.fichiers.clear()
+        for s in self.recepteurs:
+            s.close()
+        shutil.rmtree(self.destination)
+
+    def test_envoi_reparti(self):
+        """datagrammes de 1400 octets envoyés sur trois liens de poids 2, 1, 1:
+        chaque récepteur en reçoit sa part, et la réunion de ce qu'ils
+        reçoivent reconstitue le fichier dans la même table de fichiers."""
+        bftp.transport = bftp.Transport([s.getsockname() for s in self.recepteurs], poids=[2, 1, 1])
+        source = os.path.join(self.destination, "source.bin")
+        with open(source, 'wb') as f:
+            f.write(os.urandom(400 * 1024))
+        taille_datagramme = bftp.TAILLE_DATAGRAMME
+        bftp.TAILLE_DATAGRAMME = 1400
+        try:
+            bftp.envoyer(source, "recu.bin", bftp.LimiteurDebit(100000, rafale=4*1024*1024),
+                         crc=bftp.CalcCRC(source))
+        finally:
+            bftp.TAILLE_DATAGRAMME = taille_datagramme
+        recus = [vider(s) for s in self.recepteurs]
+        nb_emis = bftp.transport.nb_datagrammes
+        self.assertEqual(sum(map(len, recus)), nb_emis)
+        self.assertEqual(bftp.transport.nb_par_lien, [len(r) for r in recus])
+        for recu, part in zip(recus, (0.5, 0.25, 0.25)):
+            self.assertAlmostEqual(len(recu) / nb_emis, part, delta=2 / nb_emis)
+        paquet = bftp.Paquet()
+        for recu in recus:
+            for datagramme in recu:
+                paquet.decoder(datagramme)
+        self.assertTrue(filecmp.cmp(source, os.path.join(self.destination, "recu.bin"), shallow=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests de LimiteurDebit (seau à jetons GCRA de bftp).
+
+usage: python -m pytest test/   (ou python -m unittest discover -s test)
+
+Les tests de comportement utilisent une horloge simulée (time.monotonic_ns
+et time.sleep remplacés): ils sont exacts et ne dépendent pas de la charge
+de la machine. Un dernier test mesure le débit réel sur l'horloge système.
+"""
+
+import os, sys, time, unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bftp
+
+TAILLE_DATAGRAMME = 1472    # datagramme UDP d'une trame de MTU 1500
+
+
+class HorlogeSimulee:
+    """remplace time.monotonic_ns et time.sleep: chaque lecture de l'horloge
+    avance d'une microseconde (attente active), et chaque pause dure ce qui
+    est demandé plus un dépassement fixe, comme un réveil en retard."""
+
+    def __init__(self, depassement=0):
+        self.ns = 10**12
+        self.pas = 1000             # avance à chaque lecture, en ns
+        self.depassement = depassement
+
+    def monotonic_ns(self):
+        self.ns += self.pas
+        return self.ns
+
+    def sleep(self, secondes):
+        self.ns += int(secondes * 1e9) + self.depassement
+
+    def remplacer(self):
+        return mock.patch.multiple(bftp.time, monotonic_ns=self.monotonic_ns, sleep=self.sleep)
+
+
+def emettre(limiteur, nb_datagrammes, taille=TAILLE_DATAGRAMME):
+    "boucle d'émission de bftp: pause éventuelle, puis un datagramme."
+    for n in range(nb_datagrammes):
+        limiteur.limiter_debit()
+        limiteur.ajouter_donnees(taille)
+
+
+class TestLimiteurDebit(unittest.TestCase):
+
+    def test_surcout_entetes(self):
+        "entêtes IP/UDP comptées sur le lien, une entête IP par fragment."
+        limiteur = bftp.LimiteurDebit(10000, mtu=1500)
+        self.assertEqual(limiteur.surcout(1472), 8 + 20)
+        self.assertEqual(limiteur.surcout(1473), 8 + 2*20)
+        self.assertEqual(limiteur.surcout(65500), 8 + 45*20)
+
+    def test_debit_long_terme(self):
+        """débit moyen sur le lien (entêtes comprises) à moins de 1% de la
+        consigne, de 1 Mbps à 2 Gbps, malgré des réveils en retard."""
+        for debit in (1000, 10000, 100000, 1000000, 2000000):
+            with self.subTest(debit=debit):
+                horloge = HorlogeSimulee(depassement=300000)
+                with horloge.remplacer():
+                    limiteur = bftp.LimiteurDebit(debit, rafale=16*1024, mtu=1500)
+                    debut = horloge.ns
+                    nb = 20000
+                    emettre(limiteur, nb)
+                    duree = (horloge.ns - debut) / 1e9
+                octets_lien = nb * (TAILLE_DATAGRAMME + limiteur.surcout(TAILLE_DATAGRAMME))
+                self.assertAlmostEqual(octets_lien / duree / limiteur.debit_max, 1.0, delta=0.01)
+
+    def test_compensation_depassement(self):
+        """sans rafale pour l'absorber, le retard au réveil de chaque pause
+        (300 µs par datagramme de 1,2 ms) est rattrapé: débit à 1% près."""
+        horloge = HorlogeSimulee(depassement=300000)
+        with horloge.remplacer():
+            limiteur = bftp.LimiteurDebit(10000, rafale=0, mtu=1500)
+            debut = horloge.ns
+            nb = 2000
+            emettre(limiteur, nb)
+            duree = (horloge.ns - debut) / 1e9
+        octets_lien = nb * (TAILLE_DATAGRAMME + limiteur.surcout(TAILLE_DATAGRAMME))
+        self.assertAlmostEqual(octets_lien / duree / limiteur.debit_max, 1.0, delta=0.01)
+
+    def test_rattrapage_borne(self):
+        "le retard au réveil rattrapé ne dépasse jamais RATTRAPAGE."
+        horloge = HorlogeSimulee(depassement=10 * bftp.RATTRAPAGE)
+        with horloge.remplacer():
+            limiteur = bftp.LimiteurDebit(1000, rafale=2000, mtu=1500)
+            for n in range(50):
+                limiteur.limiter_debit()
+                self.assertLessEqual(limiteur.retard, bftp.RATTRAPAGE)
+                limiteur.ajouter_donnees(TAILLE_DATAGRAMME)
+
+    def test_rafale_bornee(self):
+        """après une longue inactivité, on n'émet d'un coup qu'une rafale (plus
+        le datagramme qui la dépasse), puis on attend de nouveau."""
+        rafale = 64 * 1024
+        horloge = HorlogeSimulee()
+        with horloge.remplacer():
+            limiteur = bftp.LimiteurDebit(100000, rafale=rafale, mtu=1500)
+            emettre(limiteur, 100)
+            # une minute d'inactivité: les jetons ne s'accumulent pas au-delà de la rafale
+            horloge.ns += 60 * 10**9
+            # la rafale est mesurée à instant fixe
+            horloge.pas = 0
+            octets = 0
+            while limiteur.attente() <= 0:
+                limiteur.ajouter_donnees(TAILLE_DATAGRAMME)
+                octets += TAILLE_DATAGRAMME + limiteur.surcout(TAILLE_DATAGRAMME)
+        cout = TAILLE_DATAGRAMME + limiteur.surcout(TAILLE_DATAGRAMME)
+        self.assertLessEqual(octets, rafale + cout)
+        self.assertGreaterEqual(octets, rafale - cout)
+
+    def test_pas_de_rafale_initiale(self):
+        "le seau démarre vide: pas de rafale au premier datagramme."
+        horloge = HorlogeSimulee()
+        with horloge.remplacer():
+            limiteur = bftp.LimiteurDebit(100000, rafale=64*1024, mtu=1500)
+            limiteur.ajouter_donnees(TAILLE_DATAGRAMME)
+            self.assertGreater(limiteur.attente(), 0)
+
+    def test_horloge_monotone(self):
+        """le limiteur ne dépend que de time.monotonic_ns: un saut de l'heure
+        système (time.time) ne change pas l'attente."""
+        horloge = HorlogeSimulee()
+        with horloge.remplacer():
+            limiteur = bftp.LimiteurDebit(8000, rafale=1500, mtu=1500)
+            limiteur.ajouter_donnees(TAILLE_DATAGRAMME)
+            with mock.patch.object(bftp.time, 'time', side_effect=AssertionError("time.time utilisé")):
+                attente = limiteur.attente()
+                horloge.ns -= 1000   # la lecture suivante retrouve le même instant
+                self.assertEqual(limiteur.attente(), attente)
+                limiteur.limiter_debit()
+        # 1 Mo/s, seau parti vide: la pause couvre la durée du datagramme et
+        # de ses entêtes sur le lien (1000 ns par octet)
+        cout = TAILLE_DATAGRAMME + limiteur.surcout(TAILLE_DATAGRAMME)
+        self.assertAlmostEqual(attente, cout * 1000, delta=10000)
+
+    def test_debit_reel(self):
+        "sur l'horloge système: 20 Mbps pendant 0,5 s, à 2% près."
+        limiteur = bftp.LimiteurDebit(20000, rafale=16*1024, mtu=1500)
+        cout = TAILLE_DATAGRAMME + limiteur.surcout(TAILLE_DATAGRAMME)
+        nb = int(limiteur.debit_max * 0.5 / cout)
+        debut = time.monotonic()
+        emettre(limiteur, nb)
+        duree = time.monotonic() - debut
+        self.assertAlmostEqual(nb * cout / duree / limiteur.debit_max, 1.0, delta=0.02)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests du moteur d'émission asyncio de bftp (MoteurAsync, --async): émission
+par lots sur la socket non bloquante du Transport, reprise quand le tampon
+d'émission est plein, comptage sur plusieurs liens.
+
+usage: python -m pytest test/   (ou python -m unittest discover -s test)
+"""
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bftp
+from test_liens import ouvrir_recepteur, vider
+
+TAILLE = 1400
+
+
+def datagrammes(nb):
+    "nb datagrammes numérotés, de deux tampons chacun."
+    return [(b"%06d" % n, bytes(TAILLE - 6)) for n in range(nb)]
+
+
+class TestMoteurAsync(unittest.TestCase):
+
+    def setUp(self):
+        self.recepteurs = [ouvrir_recepteur("127.0.0.1") for i in range(2)]
+        self.moteur = None
+
+    def tearDown(self):
+        if self.moteur is not None:
+            self.moteur.fermer()
+        self.transport.fermer()
+        for s in self.recepteurs:
+            s.close()
+
+    def demarrer(self, destinations, poids=None):
+        self.transport = bftp.Transport(destinations, taille_lot=64, poids=poids)
+        self.moteur = bftp.MoteurAsync(self.transport)
+        self.moteur.demarrer()
+
+    def test_tampon_emission_plein(self):
+        """tampon d'émission saturé (la socket n'accepte que quelques
+        datagrammes par appel): la suite de chaque lot est émise au fil de la
+        disponibilité de la socket, sans perte ni désordre."""
+        recepteur = self.recepteurs[0]
+        self.demarrer(recepteur.getsockname())
+        emission = self.transport.emission
+        envoyer_partiel = emission.envoyer_partiel
+        appels = []
+        def saturee(lot, destination):
+            appels.append(len(lot))
+            return envoyer_partiel(lot[:7], destination)
+        emission.envoyer_partiel = saturee
+        nb = 0
+        octets = 0
+        for n in range(3):
+            octets += self.moteur.executer(self.moteur.envoyer(datagrammes(100)))
+            nb += 100
+            recus = vider(recepteur)
+            self.assertEqual([d[:6] for d in recus], [b"%06d" % i for i in range(100)])
+        self.assertEqual(len(appels), 3 * 15)
+        self.assertEqual(octets, nb * TAILLE)
+        self.assertEqual(self.transport.nb_datagrammes, nb)
+        self.assertEqual(self.transport.nb_octets, nb * TAILLE)
+        self.assertEqual(self.transport.nb_erreurs, 0)
+        self.assertIsNone(self.moteur.attente_ecriture)
+
+    def test_emission_par_lots(self):
+        "un appel système sendmmsg par lot, pas un par datagramme."
+        recepteur = self.recepteurs[0]
+        self.demarrer(recepteur.getsockname())
+        if not self.transport.emission.sendmmsg:
+            self.skipTest("sendmmsg indisponible")
+        self.moteur.executer(self.moteur.envoyer(datagrammes(128)))
+        self.assertEqual(self.transport.emission.nb_appels, 2)
+        self.assertEqual(len(vider(recepteur)), 128)
+
+    def test_repartition_liens(self):
+        "répartition et compteurs par lien identiques à Transport.envoyer."
+        self.demarrer([s.getsockname() for s in self.recepteurs], poids=[3, 1])
+        for n in range(10):
+            self.moteur.executer(self.moteur.envoyer(datagrammes(40)))
+        recus = [vider(s) for s in self.recepteurs]
+        self.assertEqual([len(r) for r in recus], [300, 100])
+        self.assertEqual(self.transport.nb_par_lien, [300, 100])
+        self.assertEqual(self.transport.nb_datagrammes, 400)
+
+    def test_socket_rendue_bloquante(self):
+        "après l'arrêt du moteur, le Transport émet de nouveau en synchrone."
+        recepteur = self.recepteurs[0]
+        self.demarrer(recepteur.getsockname())
+        self.assertFalse(self.transport.sock.getblocking())
+        self.moteur.fermer()
+        self.moteur = None
+        self.assertTrue(self.transport.sock.getblocking())
+        self.transport.envoyer(datagrammes(10))
+        self.assertEqual(len(vider(recepteur)), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests du récepteur de bftp (Paquet.decoder, Fichier): réceptions en cours
+reprises ou recommencées d'un tour d'émission à l'autre, répartition des
+paquets entre les threads d'écriture (PoolEcriture).
+
+usage: python -m pytest test/   (ou python -m unittest discover -s test)
+"""
+
+import os, sys, shutil, tempfile, unittest, filecmp, zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bftp
+
+TAILLE_FICHIER = 300 * 1024
+
+
+class TransportCapture:
+    "remplace le Transport de bftp: garde une copie des datagrammes émis."
+
+    def __init__(self):
+        self.datagrammes = []
+
+    def envoyer(self, datagrammes):
+        for datagramme in datagrammes:
+            self.datagrammes.append(b"".join(datagramme))
+        return sum(map(len, self.datagrammes[-len(datagrammes):]))
+
+
+class TestReception(unittest.TestCase):
+
+    def setUp(self):
+        self.destination = tempfile.mkdtemp(prefix='BFTP_test_')
+        bftp.CHEMIN_DEST = bftp.path(self.destination)
+        bftp.stats = bftp.Stats()
+        self.source = os.path.join(self.destination, "source.bin")
+        with open(self.source, 'wb') as f:
+            f.write(os.urandom(TAILLE_FICHIER))
+        self.recu = os.path.join(self.destination, "recu.bin")
+        self.crc = bftp.CalcCRC(self.source)
+
+    def tearDown(self):
+        for f in list(bftp.fichiers.values()):
+            f.annuler_reception()
+        bftp.fichiers.clear()
+        bftp.transport = None
+        bftp.TAILLE_DATAGRAMME = bftp.TAILLE_PAQUET
+        bftp.REPERTOIRE_ETAT = None
+        bftp.points_reprise.clear()
+        shutil.rmtree(self.destination)
+
+    def emettre(self, mtu):
+        "datagrammes d'un tour d'émission du fichier source, pour une MTU donnée."
+        bftp.TAILLE_DATAGRAMME = bftp.taille_datagramme_mtu(mtu)
+        bftp.transport = TransportCapture()
+        bftp.envoyer(self.source, "recu.bin", bftp.LimiteurDebit(100000000), crc=self.crc)
+        return bftp.transport.datagrammes
+
+    def decoder(self, datagrammes):
+        paquet = bftp.Paquet()
+        for datagramme in datagrammes:
+            paquet.decoder(datagramme)
+
+    def test_changement_de_mtu(self):
+        """même version du fichier émise en datagrammes d'une autre taille:
+        la réception en cours, découpée autrement, est recommencée au lieu
+        de mélanger les deux découpages."""
+        self.decoder(self.emettre(9000)[::2])
+        self.assertIn("recu.bin", bftp.fichiers)
+        self.decoder(self.emettre(1500))
+        self.assertNotIn("recu.bin", bftp.fichiers)
+        self.assertTrue(filecmp.cmp(self.source, self.recu, shallow=False))
+
+    def test_meme_nombre_de_paquets(self):
+        """autre taille de datagrammes donnant le même nombre de paquets: les
+        offsets ne correspondent plus, la réception est recommencée."""
+        premier = self.emettre(9000)
+        bftp.TAILLE_DATAGRAMME = bftp.taille_datagramme_mtu(9000) - 100
+        bftp.transport = TransportCapture()
+        bftp.envoyer(self.source, "recu.bin", bftp.LimiteurDebit(100000000), crc=self.crc)
+        second = bftp.transport.datagrammes
+        self.assertEqual(len(premier), len(second))
+        self.decoder(premier[:-3])
+        # le premier paquet est au même offset dans les deux découpages: la
+        # réception recommence au suivant, et s'achève au tour d'après
+        self.decoder(second)
+        self.decoder(second)
+        self.assertTrue(filecmp.cmp(self.source, self.recu, shallow=False))
+
+    def test_paquet_corrompu(self):
+        """un paquet corrompu en route fait échouer le contrôle du CRC32: la
+        réception est abandonnée sans laisser de fichier partiel dans
+        l'arborescence, et le tour d'émission suivant la recommence."""
+        datagrammes = self.emettre(9000)
+        corrompu = bytearray(datagrammes[5])
+        corrompu[-1] ^= 0xFF
+        self.decoder(datagrammes[:5] + [bytes(corrompu)] + datagrammes[6:])
+        self.assertNotIn("recu.bin", bftp.fichiers)
+        self.assertEqual(sorted(os.listdir(self.destination)), ["source.bin"])
+        self.decoder(datagrammes)
+        self.assertTrue(filecmp.cmp(self.source, self.recu, shallow=False))
+
+    def interrompre(self, datagrammes):
+        """reçoit des datagrammes avec point de reprise (--etat), puis simule
+        un redémarrage du récepteur: la réception en cours est sauvegardée
+        puis oubliée, et les points de reprise rechargés."""
+        bftp.REPERTOIRE_ETAT = os.path.join(self.destination, "etat")
+        os.mkdir(bftp.REPERTOIRE_ETAT)
+        self.decoder(datagrammes)
+        f = bftp.fichiers.pop("recu.bin")
+        f.sauvegarder()
+        f.fichier_temp.close()
+        bftp.charger_points_reprise()
+        self.assertIn("recu.bin", bftp.points_reprise)
+        return f.paquets_recus.nb_true
+
+    def reprise_abandonnee(self, datagrammes):
+        """le premier paquet reçu après le redémarrage recommence la
+        réception, au lieu de reprendre celle découpée autrement."""
+        self.decoder(datagrammes[:1])
+        self.assertEqual(bftp.fichiers["recu.bin"].paquets_recus.nb_true, 1)
+        self.assertEqual(os.listdir(bftp.REPERTOIRE_ETAT), [])
+        self.decoder(datagrammes[1:])
+        self.assertTrue(filecmp.cmp(self.source, self.recu, shallow=False))
+
+    def test_reprise_changement_de_mtu(self):
+        "point de reprise d'une autre taille de datagrammes: abandonné."
+        self.assertGreater(self.interrompre(self.emettre(9000)[:-10]), 1)
+        second = self.emettre(1500)
+        self.reprise_abandonnee(second[1:] + second[:1])
+
+    def test_reprise_meme_nombre_de_paquets(self):
+        """point de reprise de même nombre de paquets, mais de taille
+        différente: abandonné aussi, les offsets ne correspondent plus."""
+        premier = self.emettre(9000)
+        bftp.TAILLE_DATAGRAMME = bftp.taille_datagramme_mtu(9000) - 100
+        bftp.transport = TransportCapture()
+        bftp.envoyer(self.source, "recu.bin", bftp.LimiteurDebit(100000000), crc=self.crc)
+        second = bftp.transport.datagrammes
+        self.assertEqual(len(premier), len(second))
+        self.interrompre(premier[:-3])
+        self.reprise_abandonnee(second[1:] + second[:1])
+
+    def test_reprise_meme_decoupage(self):
+        "même découpage: la réception est reprise là où elle en était."
+        datagrammes = self.emettre(9000)
+        nb_recus = self.interrompre(datagrammes[:-3])
+        self.decoder(datagrammes[-3:-2])
+        self.assertEqual(bftp.fichiers["recu.bin"].paquets_recus.nb_true, nb_recus + 1)
+        self.decoder(datagrammes[-2:])
+        self.assertTrue(filecmp.cmp(self.source, self.recu, shallow=False))
+
+
+class TestPoolEcriture(unittest.TestCase):
+
+    def setUp(self):
+        self.destination = tempfile.mkdtemp(prefix='BFTP_test_')
+        bftp.CHEMIN_DEST = bftp.path(self.destination)
+        bftp.stats = bftp.Stats()
+        bftp.transport = TransportCapture()
+        self.ecriture = bftp.PoolEcriture(4)
+
+    def tearDown(self):
+        self.ecriture.fermer()
+        bftp.fichiers.clear()
+        bftp.transport = None
+        bftp.IDENTIFIANTS = False
+        bftp.table_identifiants = bftp.TableIdentifiants()
+        shutil.rmtree(self.destination)
+
+    def repartir(self, datagramme):
+        "datagrammes à déposer pour un datagramme reçu, comme dans la capture."
+        p = bftp.Paquet()
+        p.decoder_entete(datagramme)
+        return self.ecriture.repartir(p, datagramme)
+
+    def indice(self, nom_fichier):
+        return self.ecriture.indice(nom_fichier.encode('utf-8'))
+
+    def test_multifichier_decoupe(self):
+        """un paquet multi-fichiers est découpé par thread d'écriture: chaque
+        petit fichier va au thread de son nom, et tous sont reçus."""
+        petits = [("f%02d.txt" % n, b"contenu %d" % n) for n in range(40)]
+        bftp.envoyer_petits_fichiers([(nom, donnees, 1000000000, zlib.crc32(donnees))
+                                      for nom, donnees in petits], bftp.LimiteurDebit(100000000))
+        datagramme, = bftp.transport.datagrammes
+        decoupage = self.repartir(datagramme)
+        self.assertEqual(len(decoupage), 4)
+        p = bftp.Paquet()
+        for indice, paquet in decoupage:
+            p.decoder_entete(paquet)
+            self.assertEqual(p.type_paquet, bftp.PAQUET_MULTIFICHIER)
+            # entête cohérente avec les seules entrées du sous-paquet: seuls
+            # les CRC32 des entrées sont contrôlés, celui de l'entête est nul
+            self.assertEqual(p.taille_donnees, len(paquet) - bftp.TAILLE_ENTETE)
+            self.assertEqual(p.taille_fichier, p.taille_donnees)
+            self.assertEqual((p.date_fichier, p.crc32), (0, 0))
+            nb_avant = len(os.listdir(self.destination))
+            p.decoder(paquet)
+            recus = set(os.listdir(self.destination))
+            self.assertEqual(len(recus) - nb_avant, p.num_paquet)
+        for nom, donnees in petits:
+            with open(os.path.join(self.destination, nom), 'rb') as f:
+                self.assertEqual(f.read(), donnees)
+        # chaque sous-paquet ne porte que les fichiers de son thread
+        for indice, paquet in decoupage:
+            p.decoder_entete(paquet)
+            position = bftp.TAILLE_ENTETE
+            for n in range(p.num_paquet):
+                longueur_nom, date_fichier, taille, crc32 = bftp.ENTREE_MULTIFICHIER.unpack_from(paquet, position)
+                debut = position + bftp.ENTREE_MULTIFICHIER.size
+                self.assertEqual(self.ecriture.indice(paquet[debut:debut+longueur_nom]), indice)
+                position = debut + longueur_nom + taille
+
+    def emettre(self, taille):
+        "datagrammes d'un fichier recu.bin de taille octets."
+        source = os.path.join(self.destination, "source.bin")
+        with open(source, 'wb') as f:
+            f.write(os.urandom(taille))
+        bftp.envoyer(source, "recu.bin", bftp.LimiteurDebit(100000000), crc=bftp.CalcCRC(source))
+        return source, bftp.transport.datagrammes
+
+    def test_arret_apres_ecriture(self):
+        """l'arrêt attend que les threads d'écriture aient traité tous les
+        datagrammes déposés: les réceptions ne sont plus utilisées après."""
+        source, datagrammes = self.emettre(4 * 1024 * 1024)
+        for datagramme in datagrammes:
+            self.ecriture.deposer(self.repartir(datagramme))
+        self.ecriture.fermer()
+        self.assertFalse(any(thread.is_alive() for thread in self.ecriture.threads))
+        self.assertEqual(self.ecriture.nb_en_attente, 0)
+        self.assertTrue(filecmp.cmp(source, os.path.join(self.destination, "recu.bin"), shallow=False))
+
+    def test_annulation_par_le_thread_d_ecriture(self):
+        """l'abandon d'une réception demandé par le processus principal passe
+        par la file du thread d'écriture du fichier, après ses datagrammes."""
+        source, datagrammes = self.emettre(1024 * 1024)
+        for datagramme in datagrammes[:-2]:
+            self.ecriture.deposer(self.repartir(datagramme))
+        self.ecriture.annuler("recu.bin")
+        self.ecriture.fermer()
+        self.assertEqual(self.ecriture.nb_en_attente, 0)
+        self.assertEqual(self.ecriture.octets, 0)
+        self.assertNotIn("recu.bin", bftp.fichiers)
+        self.assertEqual(os.listdir(self.destination), ["source.bin"])
+
+    def test_meme_thread_par_fichier(self):
+        """données par identifiant, annonce et effacement d'un même
+        fichier vont au thread de son nom; les paquets reçus avant l'annonce
+        sont gardés par la capture, puis déposés à ce thread."""
+        source = os.path.join(self.destination, "source.bin")
+        with open(source, 'wb') as f:
+            f.write(os.urandom(100 * 1024))
+        bftp.IDENTIFIANTS = True
+        bftp.envoyer(source, "rep/recu.bin", bftp.LimiteurDebit(100000000), crc=bftp.CalcCRC(source))
+        bftp.SendDeleteFileMessage("rep/recu.bin")
+        datagrammes = bftp.transport.datagrammes
+        annonce = datagrammes[0]
+        self.assertEqual(bftp.ENTETE.unpack_from(annonce)[0] & bftp.MASQUE_TYPE, bftp.PAQUET_ANNONCE)
+        indice = self.indice("rep/recu.bin")
+        # données reçues avant la première annonce: gardées par la capture
+        self.assertEqual(self.repartir(datagrammes[1]), [])
+        self.assertEqual(self.repartir(datagrammes[2]), [])
+        self.assertEqual(self.repartir(annonce), [(indice, datagrammes[1]), (indice, datagrammes[2])])
+        types = []
+        for datagramme in datagrammes[3:]:
+            types.append(bftp.ENTETE.unpack_from(datagramme)[0] & bftp.MASQUE_TYPE)
+            if types[-1] == bftp.PAQUET_ANNONCE:
+                # annonce répétée: traitée par la capture, rien à déposer
+                self.assertEqual(self.repartir(datagramme), [])
+            else:
+                self.assertEqual(self.repartir(datagramme), [(indice, datagramme)])
+        self.assertEqual(types[-1], bftp.PAQUET_DELETEFile)
+
+
+if __name__ == '__main__':
+    unittest.main()